@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Script to move extracted text out of the materials table.
+
+This script will:
+1. Find materials that still carry text in the legacy extracted_text column
+2. Store that text compressed in the material_texts table
+3. Clear the legacy column so material rows stay small
+
+Usage:
+    python backfill_material_text.py [--batch-size 20] [--dry-run]
+"""
+
+import argparse
+from database import get_db, Material, MaterialText
+from material_cache import store_material_text
+
+def backfill_material_texts(batch_size: int = 20, dry_run: bool = False):
+    """Copy legacy extracted_text into the compressed blob table"""
+    db = next(get_db())
+
+    # Only ids here - the text itself is loaded one material at a time
+    pending_ids = [row.id for row in db.query(Material.id).outerjoin(
+        MaterialText, MaterialText.material_id == Material.id
+    ).filter(
+        MaterialText.material_id.is_(None),
+        Material.extracted_text.isnot(None)
+    ).order_by(Material.id).all()]
+
+    if not pending_ids:
+        print("✅ No materials need backfilling!")
+        return 0
+
+    print(f"📦 Found {len(pending_ids)} materials with legacy inline text\n")
+
+    if dry_run:
+        for material_id in pending_ids:
+            print(f"   Would backfill material ID {material_id}")
+        return 0
+
+    moved = 0
+    for i, material_id in enumerate(pending_ids, 1):
+        text = db.query(Material.extracted_text).filter(Material.id == material_id).scalar()
+        if text:
+            store_material_text(db, material_id, text)
+        db.query(Material).filter(Material.id == material_id).update(
+            {Material.extracted_text: None}, synchronize_session=False
+        )
+        moved += 1
+
+        # Commit in batches to keep transactions short
+        if i % batch_size == 0:
+            db.commit()
+            print(f"   ✓ Backfilled {i}/{len(pending_ids)}")
+
+    db.commit()
+    print(f"\n✅ Backfilled {moved} materials!")
+    return moved
+
+def main():
+    parser = argparse.ArgumentParser(description="Move Material.extracted_text into the compressed material_texts table")
+    parser.add_argument('--batch-size', type=int, default=20, help='Materials per commit (default: 20)')
+    parser.add_argument('--dry-run', action='store_true', help='Only list materials that would be backfilled')
+
+    args = parser.parse_args()
+    backfill_material_texts(batch_size=args.batch_size, dry_run=args.dry_run)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Cache Admission Module
+
+TinyLFU admission for the in-memory text cache. A count-min sketch estimates
+how often each key was requested recently; a new entry is only admitted if it
+is requested more often than the LRU entries it would evict. One-off reads of
+large materials therefore go to the disk tier without flushing hot entries.
+"""
+
+import threading
+from typing import Hashable
+
+SKETCH_DEPTH = 4  # Hash rows in the count-min sketch
+MAX_COUNT = 15  # Counters saturate here (TinyLFU uses 4-bit counters)
+_HALVE = bytes(i >> 1 for i in range(256))  # translate() table for aging
+
+
+class FrequencySketch:
+    """
+    Count-min sketch with periodic aging.
+    After sample_size increments every counter is halved, so frequencies
+    reflect recent traffic instead of all-time popularity.
+    """
+
+    def __init__(self, width: int = 4096, sample_size: int = None):
+        # Power-of-two width so a hash maps to a column with a mask
+        self.width = 1 << max(4, (width - 1).bit_length())
+        self.mask = self.width - 1
+        self.sample_size = sample_size or self.width * 10
+        self.rows = [bytearray(self.width) for _ in range(SKETCH_DEPTH)]
+        self.additions = 0
+        self.resets = 0
+        self._lock = threading.Lock()
+
+    def _columns(self, key: Hashable):
+        return [hash((seed, key)) & self.mask for seed in range(SKETCH_DEPTH)]
+
+    def increment(self, key: Hashable):
+        """Record one access to key"""
+        columns = self._columns(key)
+        with self._lock:
+            added = False
+            for row, column in zip(self.rows, columns):
+                if row[column] < MAX_COUNT:
+                    row[column] += 1
+                    added = True
+            if added:
+                self.additions += 1
+                if self.additions >= self.sample_size:
+                    self._reset()
+
+    def frequency(self, key: Hashable) -> int:
+        """Estimated recent access count of key (never under-counts before aging)"""
+        columns = self._columns(key)
+        with self._lock:
+            return min(row[column] for row, column in zip(self.rows, columns))
+
+    def _reset(self):
+        """Halve every counter. Must be called with _lock held."""
+        for row in self.rows:
+            row[:] = row.translate(_HALVE)
+        self.additions //= 2
+        self.resets += 1
+
+
+def should_admit(sketch: FrequencySketch, candidate: Hashable, victims) -> bool:
+    """
+    TinyLFU admission: admit the candidate only if it is more frequent than
+    every entry that would be evicted to make room for it.
+    """
+    if not victims:
+        return True
+    candidate_frequency = sketch.frequency(candidate)
+    return all(candidate_frequency > sketch.frequency(victim) for victim in victims)
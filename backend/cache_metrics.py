@@ -0,0 +1,227 @@
+"""
+Cache Metrics Module
+
+O(1) counters for the material caches: per-tier hit/miss/eviction/expiration
+counts, load latency histograms, bytes read from disk and the hottest keys.
+Exposed as JSON (get_cache_stats) and in Prometheus text format.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# Latency histogram bucket upper bounds in seconds (Prometheus style, cumulative on export)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+HOT_KEY_CAPACITY = 64  # Keys tracked per hot-key table
+METRIC_PREFIX = "clyvara_cache"
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram"""
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # Last bucket is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS)
+        self.counts[i] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate quantile (upper bound of the bucket that contains it)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float('inf')
+        return float('inf')
+
+
+class HotKeys:
+    """
+    Space-Saving heavy hitters: tracks the most frequently accessed keys with a
+    fixed number of counters. Counts of tracked keys are exact increments; a new
+    key replaces the least counted one and inherits its count (an upper bound).
+    """
+    __slots__ = ('capacity', 'counts', '_min_key')
+
+    def __init__(self, capacity: int = HOT_KEY_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[Hashable, int] = {}
+        self._min_key = None
+
+    def record(self, key: Hashable):
+        counts = self.counts
+        if key in counts:
+            counts[key] += 1
+            if key == self._min_key:
+                self._min_key = None
+            return
+        if len(counts) < self.capacity:
+            counts[key] = 1
+            self._min_key = None
+            return
+        # Replace the least counted key; the minimum is only rescanned after it changes
+        if self._min_key is None or self._min_key not in counts:
+            self._min_key = min(counts, key=counts.get)
+        inherited = counts.pop(self._min_key)
+        counts[key] = inherited + 1
+        self._min_key = None
+
+    def top(self, n: int) -> List[Tuple[Hashable, int]]:
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+
+
+class CacheMetrics:
+    """Thread-safe counters, histograms and hot keys for all cache tiers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.events: Dict[Tuple[str, str], int] = {}  # (tier, event) -> count
+            self.latencies: Dict[str, LatencyHistogram] = {}  # operation -> histogram
+            self.disk_bytes_read = 0
+            self.hot_keys: Dict[str, HotKeys] = {}  # tier -> heavy hitters
+
+    def count(self, tier: str, event: str, n: int = 1):
+        """Count n events (hit, miss, eviction, expiration, ...) for a tier"""
+        if n <= 0:
+            return
+        with self._lock:
+            key = (tier, event)
+            self.events[key] = self.events.get(key, 0) + n
+
+    def get(self, tier: str, event: str) -> int:
+        with self._lock:
+            return self.events.get((tier, event), 0)
+
+    def observe_latency(self, operation: str, seconds: float):
+        with self._lock:
+            histogram = self.latencies.get(operation)
+            if histogram is None:
+                histogram = self.latencies[operation] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timed(self, operation: str):
+        """Record the duration of the with-block in the operation's histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_latency(operation, time.perf_counter() - start)
+
+    def add_disk_bytes_read(self, n: int):
+        with self._lock:
+            self.disk_bytes_read += n
+
+    def record_access(self, tier: str, key: Hashable):
+        with self._lock:
+            hot_keys = self.hot_keys.get(tier)
+            if hot_keys is None:
+                hot_keys = self.hot_keys[tier] = HotKeys()
+            hot_keys.record(key)
+
+    def snapshot(self, top_n: int = 10) -> Dict:
+        """All metrics as a JSON-serializable dict"""
+        with self._lock:
+            tiers: Dict[str, Dict[str, int]] = {}
+            for (tier, event), value in self.events.items():
+                tiers.setdefault(tier, {})[event] = value
+            for counters in tiers.values():
+                lookups = counters.get('hit', 0) + counters.get('miss', 0)
+                if lookups:
+                    counters['hit_ratio'] = round(counters.get('hit', 0) / lookups, 4)
+
+            latencies = {}
+            for operation, histogram in self.latencies.items():
+                latencies[operation] = {
+                    'count': histogram.count,
+                    'avg_ms': round(histogram.total / histogram.count * 1000, 3) if histogram.count else None,
+                    'p50_ms': _ms(histogram.quantile(0.5)),
+                    'p95_ms': _ms(histogram.quantile(0.95)),
+                    'p99_ms': _ms(histogram.quantile(0.99)),
+                    'buckets': {_bucket_label(i): c for i, c in enumerate(histogram.counts)}
+                }
+
+            return {
+                'since': self.started_at,
+                'tiers': tiers,
+                'latency': latencies,
+                'disk_bytes_read': self.disk_bytes_read,
+                'hot_keys': {
+                    tier: [{'key': key, 'count': count} for key, count in hot_keys.top(top_n)]
+                    for tier, hot_keys in self.hot_keys.items()
+                }
+            }
+
+    def render_prometheus(self, gauges: Optional[Dict[str, float]] = None, top_n: int = 10) -> str:
+        """Render all metrics (plus the given gauges) in Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append(f"# HELP {METRIC_PREFIX}_events_total Cache events by tier (hit, miss, eviction, expiration, ...)")
+            lines.append(f"# TYPE {METRIC_PREFIX}_events_total counter")
+            for (tier, event), value in sorted(self.events.items()):
+                lines.append(f'{METRIC_PREFIX}_events_total{{tier="{tier}",event="{event}"}} {value}')
+
+            lines.append(f"# HELP {METRIC_PREFIX}_disk_read_bytes_total Bytes read from the disk cache tier")
+            lines.append(f"# TYPE {METRIC_PREFIX}_disk_read_bytes_total counter")
+            lines.append(f"{METRIC_PREFIX}_disk_read_bytes_total {self.disk_bytes_read}")
+
+            lines.append(f"# HELP {METRIC_PREFIX}_load_seconds Cache load latency by operation")
+            lines.append(f"# TYPE {METRIC_PREFIX}_load_seconds histogram")
+            for operation, histogram in sorted(self.latencies.items()):
+                cumulative = 0
+                for i, bucket_count in enumerate(histogram.counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if i == len(LATENCY_BUCKETS) else repr(LATENCY_BUCKETS[i])
+                    lines.append(f'{METRIC_PREFIX}_load_seconds_bucket{{operation="{operation}",le="{le}"}} {cumulative}')
+                lines.append(f'{METRIC_PREFIX}_load_seconds_sum{{operation="{operation}"}} {histogram.total}')
+                lines.append(f'{METRIC_PREFIX}_load_seconds_count{{operation="{operation}"}} {histogram.count}')
+
+            lines.append(f"# HELP {METRIC_PREFIX}_hot_key_accesses Approximate access counts of the hottest keys")
+            lines.append(f"# TYPE {METRIC_PREFIX}_hot_key_accesses gauge")
+            for tier, hot_keys in sorted(self.hot_keys.items()):
+                for key, count in hot_keys.top(top_n):
+                    lines.append(f'{METRIC_PREFIX}_hot_key_accesses{{tier="{tier}",key="{key}"}} {count}')
+
+        # Gauge names may carry labels, e.g. 'single_flight_in_flight{group="text_db"}'
+        typed = set()
+        for name, value in sorted((gauges or {}).items()):
+            base = name.split('{', 1)[0]
+            if base not in typed:
+                typed.add(base)
+                lines.append(f"# TYPE {METRIC_PREFIX}_{base} gauge")
+            lines.append(f"{METRIC_PREFIX}_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    if seconds is None:
+        return None
+    return round(seconds * 1000, 3) if seconds != float('inf') else None
+
+
+def _bucket_label(i: int) -> str:
+    return f"le_{LATENCY_BUCKETS[i] * 1000:g}ms" if i < len(LATENCY_BUCKETS) else "le_inf"
+
+
+# Process-wide metrics shared by material_cache and shared_corpus
+cache_metrics = CacheMetrics()
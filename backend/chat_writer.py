@@ -0,0 +1,262 @@
+"""
+Chat Writer Module
+
+Write-behind persistence for chat traffic. Chat endpoints enqueue their writes
+and return; a background thread flushes them in batches (every
+CHAT_WRITE_FLUSH_MS or CHAT_WRITE_BATCH_SIZE writes, whichever comes first):
+one session upsert (ON CONFLICT on session_id), one multi-row message insert
+and the RAG access-count updates, all in a single transaction.
+
+A batch that still fails after its retries is split in halves and written
+again, down to single writes, so only the writes that fail on their own are
+dropped (and logged).
+"""
+
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert
+
+# Configuration
+CHAT_WRITE_FLUSH_MS = int(os.getenv("CHAT_WRITE_FLUSH_MS", "50"))  # Max time a write waits for its batch
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "200"))  # Writes per flush
+CHAT_WRITE_QUEUE_SIZE = int(os.getenv("CHAT_WRITE_QUEUE_SIZE", "10000"))  # Pending writes before new ones are dropped
+CHAT_WRITE_MAX_RETRIES = 3
+CHAT_WRITE_DRAIN_TIMEOUT_SECONDS = 10
+
+_MESSAGE = "message"
+_ACCESS = "access"
+
+
+class ChatWriter:
+    """Bounded queue plus one flusher thread"""
+
+    def __init__(self):
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=CHAT_WRITE_QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        """Start the flusher thread (idempotent); also restarts a stopped writer"""
+        with self._start_lock:
+            self._stop.clear()
+            self._ensure_thread()
+
+    def _ensure_thread(self):
+        # Caller holds _start_lock
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = CHAT_WRITE_DRAIN_TIMEOUT_SECONDS):
+        """Flush everything still queued, then stop the thread. Later writes are written synchronously."""
+        with self._start_lock:
+            self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                print(f"⚠️  Chat writer did not drain within {timeout}s ({self._queue.qsize()} writes pending)")
+
+    def _put(self, item: tuple):
+        # Under _start_lock so an item is either queued before stop() or written here after it
+        with self._start_lock:
+            stopped = self._stop.is_set()
+            if not stopped:
+                self._ensure_thread()
+                try:
+                    self._queue.put_nowait(item)
+                    full = False
+                except queue.Full:
+                    full = True
+        if stopped:
+            # Shutting down: the flusher is gone and must not be restarted, so write it now
+            with self._stats_lock:
+                self.enqueued += 1
+            print("⚠️  Chat writer is stopped; writing a late chat write synchronously")
+            self._flush([item])
+            return
+        if full:
+            with self._stats_lock:
+                self.dropped += 1
+            print("⚠️  Chat write queue is full; dropping a write")
+            return
+        with self._stats_lock:
+            self.enqueued += 1
+
+    def enqueue_message(self, session_id: str, user_id: str, message_type: str, message_content: Dict[str, Any],
+                        thread_id: Optional[str] = None, response_time_ms: Optional[int] = None,
+                        message_length: Optional[int] = None):
+        """
+        Queue a chat message; its session is created if it does not exist yet.
+        A user_id that is not a UUID would fail the whole batch, so it is rejected here.
+        """
+        if user_id is not None:
+            try:
+                user_id = str(uuid.UUID(str(user_id)))
+            except ValueError:
+                with self._stats_lock:
+                    self.rejected += 1
+                print(f"⚠️  Rejected chat write for session {session_id}: user_id {user_id!r} is not a UUID")
+                return
+        self._put((_MESSAGE, {
+            "session_id": session_id,
+            "user_id": user_id,
+            "message_type": message_type,
+            "message_content": message_content,
+            "thread_id": thread_id,
+            "response_time_ms": response_time_ms,
+            "message_length": message_length
+        }))
+
+    def enqueue_access(self, vector_entry_ids: List[int]):
+        """Queue access-count updates for vector entries used as RAG context"""
+        if vector_entry_ids:
+            self._put((_ACCESS, list(vector_entry_ids)))
+
+    def _run(self):
+        flush_interval = CHAT_WRITE_FLUSH_MS / 1000
+        while True:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+
+            # Collect until the batch is full or the oldest write has waited flush_interval
+            batch = [first]
+            deadline = time.monotonic() + flush_interval
+            while len(batch) < CHAT_WRITE_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._flush(batch)
+
+    def _flush(self, batch: List[tuple]):
+        for attempt in range(1, CHAT_WRITE_MAX_RETRIES + 1):
+            start = time.perf_counter()
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"Chat write batch failed (attempt {attempt}/{CHAT_WRITE_MAX_RETRIES}): {e}")
+                if attempt < CHAT_WRITE_MAX_RETRIES:
+                    time.sleep(0.1 * 2 ** attempt)
+                    continue
+                if len(batch) > 1:
+                    self._bisect(batch)
+                else:
+                    self._drop(batch[0], e)
+                return
+            self._record_flush(len(batch), start)
+            return
+
+    def _bisect(self, batch: List[tuple]):
+        """Write the halves of a failed batch separately, down to the writes that fail on their own"""
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            start = time.perf_counter()
+            try:
+                self._write(half)
+            except Exception as e:
+                if len(half) > 1:
+                    self._bisect(half)
+                else:
+                    self._drop(half[0], e)
+                continue
+            self._record_flush(len(half), start)
+
+    def _record_flush(self, count: int, start: float):
+        with self._stats_lock:
+            self.written += count
+            self.flushes += 1
+            self.last_flush_ms = round((time.perf_counter() - start) * 1000, 3)
+
+    def _drop(self, item: tuple, error: Exception):
+        kind, payload = item
+        if kind == _MESSAGE:
+            what = f"{payload['message_type']} message in session {payload['session_id']} (user {payload['user_id']})"
+        else:
+            what = f"access counts for vector entries {payload}"
+        with self._stats_lock:
+            self.failed += 1
+        print(f"⚠️  Dropped chat write, {what}: {error}")
+
+    def _write(self, batch: List[tuple]):
+        from database import get_session_local, ChatMessage, UserSession, VectorIndexEntry
+
+        messages = [payload for kind, payload in batch if kind == _MESSAGE]
+        accesses = Counter(entry_id for kind, payload in batch if kind == _ACCESS for entry_id in payload)
+
+        db = get_session_local()()
+        try:
+            if messages:
+                sessions = {}
+                for message in messages:
+                    sessions.setdefault(message["session_id"], message["user_id"])
+                session_insert = insert(UserSession).values([
+                    {"session_id": session_id, "user_id": user_id, "is_active": True, "last_activity": func.now()}
+                    for session_id, user_id in sessions.items()
+                ])
+                db.execute(session_insert.on_conflict_do_update(
+                    index_elements=[UserSession.session_id],
+                    set_={"last_activity": session_insert.excluded.last_activity, "is_active": True}
+                ))
+
+                # clock_timestamp() advances per row, so messages keep their queue order
+                db.execute(insert(ChatMessage).values([
+                    dict(message, timestamp=func.clock_timestamp()) for message in messages
+                ]))
+
+            # One UPDATE per distinct increment (almost always just +1)
+            by_increment: Dict[int, List[int]] = {}
+            for entry_id, count in accesses.items():
+                by_increment.setdefault(count, []).append(entry_id)
+            for increment, entry_ids in by_increment.items():
+                db.execute(update(VectorIndexEntry).where(VectorIndexEntry.id.in_(entry_ids)).values(
+                    last_accessed=func.now(),
+                    access_count=func.coalesce(VectorIndexEntry.access_count, 0) + increment
+                ).execution_options(synchronize_session=False))
+
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "pending": self._queue.qsize(),
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped": self.dropped,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "flushes": self.flushes,
+                "last_flush_ms": self.last_flush_ms,
+                "running": self._thread is not None and self._thread.is_alive()
+            }
+
+
+# Process-wide writer used by the chat endpoints
+chat_writer = ChatWriter()
@@ -10,7 +10,8 @@ This script will:
 
 import sys
 from datetime import datetime, timedelta
-from database import get_db, Material, VectorIndexEntry
+from database import get_db, Material, MaterialText, VectorIndexEntry
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 def check_stuck_materials():
@@ -25,10 +26,18 @@ def check_stuck_materials():
     
     if not processing:
         print("✅ No materials stuck in processing status!")
-        return []
+        return [], []
     
     print(f"⏳ Found {len(processing)} materials in processing status:\n")
     
+    # Vector entries per material (any means processing started), in one query
+    vector_counts = dict(db.query(
+        VectorIndexEntry.source_id, func.count(VectorIndexEntry.id)
+    ).filter(
+        VectorIndexEntry.source_type == 'material',
+        VectorIndexEntry.source_id.in_([m.id for m in processing])
+    ).group_by(VectorIndexEntry.source_id).all())
+    
     stuck_materials = []
     active_materials = []
     
@@ -37,11 +46,7 @@ def check_stuck_materials():
         time_diff = datetime.now() - m.uploaded_at
         hours = time_diff.total_seconds() / 3600
         
-        # Check if there are any vector entries (means processing started)
-        vector_count = db.query(VectorIndexEntry).filter(
-            VectorIndexEntry.source_id == m.id,
-            VectorIndexEntry.source_type == 'material'
-        ).count()
+        vector_count = vector_counts.get(m.id, 0)
         
         print(f"📄 {m.title}")
         print(f"   ID: {m.id}")
@@ -89,6 +94,9 @@ def clean_stuck_materials(stuck_materials, action='mark_failed'):
             for v in vectors:
                 db.delete(v)
             
+            # Delete stored text
+            db.query(MaterialText).filter(MaterialText.material_id == m.id).delete()
+            
             # Delete material
             db.delete(m)
             print(f"   ✓ Deleted material and {len(vectors)} vector entries")
@@ -165,6 +173,9 @@ def remove_duplicates():
         for v in vectors:
             db.delete(v)
         
+        # Delete stored text
+        db.query(MaterialText).filter(MaterialText.material_id == m.id).delete()
+        
         # Delete material
         db.delete(m)
         print(f"✓ Deleted material ID {m.id} and {len(vectors)} vector entries")
@@ -1,12 +1,19 @@
 #all backend connections supported here
 
-from fastapi import FastAPI, Request, Depends, HTTPException, UploadFile, File, Header, Body
+from fastapi import FastAPI, Request, Depends, HTTPException, UploadFile, File, Header, Body, Cookie, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Iterator
 from uuid import uuid4
+import asyncio
 import random
 import json
+import time
+import math
+import threading
+import weakref
 import boto3
 import PyPDF2
 import io
@@ -18,12 +25,23 @@ import os
 import jwt
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
-from database import get_db, test_connection, ChatMessage, UserInteraction, UserSession, Material, VectorIndexEntry, CarePlan, Profile, LearningPlan, LearningPlanProgress
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, or_, select, delete, literal, union_all
+from database import get_db, get_async_db, get_read_db_for, get_async_read_db_for, DATABASE_READ_URL, READ_YOUR_WRITES_SECONDS, get_session_local, dispose_async_engine, test_connection, get_pool_stats, ChatMessage, UserInteraction, UserSession, Material, MaterialText, VectorIndexEntry, CarePlan, Profile, LearningPlan, LearningPlanProgress, UserActivitySummary
 from material_cache import (
-    get_cached_text, cache_text, invalidate_cache, preload_system_materials, get_cache_stats,
-    get_cached_vector_entries, cache_vector_entries, invalidate_vector_cache
+    cache_text, get_cache_stats,
+    start_background_warmup, get_warmup_status, start_snapshot_thread, stop_snapshot_thread,
+    get_cache_metrics_prometheus,
+    invalidate_vector_cache, load_vector_blocks,
+    store_material_text, load_material_text_range, delete_material_text
 )
+from shared_corpus import schedule_shared_corpus_rebuild
+from single_flight import get_single_flight
+from pagination import DEFAULT_PAGE_SIZE, clamp_limit, paginate, page_result
+from chat_writer import chat_writer
+from thread_memory import ThreadMemory, THREAD_SUMMARY_TOKENS
+from cache_metrics import LatencyHistogram
+from query_metrics import QUERY_METRICS_ENABLED, track_queries, server_timing, report_repeats
 
 load_dotenv()
 
@@ -33,6 +51,12 @@ SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 # System materials user ID - materials with this user_id are accessible to all users
 SYSTEM_USER_ID = "SYSTEM"
 
+# Serve /api/all-users-with-data from the trigger-maintained summary table (migrations.py version 2)
+USER_ACTIVITY_SUMMARY_ENABLED = os.getenv("USER_ACTIVITY_SUMMARY_ENABLED", "false").lower() == "true"
+
+# Concurrent requests for the same embedding share one OpenAI call
+_embedding_flight = get_single_flight("embeddings")
+
 # Cache for general query embedding (since it's always the same)
 _general_query_embedding_cache = None
 
@@ -41,8 +65,10 @@ def get_current_user(authorization: str = Header(None)):
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid authorization header")
     
-    token = authorization.split(" ")[1]
-    
+    return decode_user_token(authorization.split(" ")[1])
+
+def decode_user_token(token: str) -> dict:
+    """User info from a Supabase JWT (raises 401 if it cannot be decoded)"""
     try:
         # For Supabase tokens, decode without signature verification for now
         # This is a simplified approach for development
@@ -58,6 +84,24 @@ def get_current_user(authorization: str = Header(None)):
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Token error: {str(e)}")
 
+# Set after a client's writes: when it last wrote (epoch seconds). Only used to route reads.
+READ_YOUR_WRITES_COOKIE = "last_write"
+
+def _last_write_time(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+# Read-only endpoints use these: the read replica (DATABASE_READ_URL) unless the
+# client wrote recently, so users always see their own changes
+def get_read_db(last_write: Optional[str] = Cookie(None, alias=READ_YOUR_WRITES_COOKIE)):
+    yield from get_read_db_for(_last_write_time(last_write))
+
+async def get_async_read_db(last_write: Optional[str] = Cookie(None, alias=READ_YOUR_WRITES_COOKIE)):
+    async for db in get_async_read_db_for(_last_write_time(last_write)):
+        yield db
+
 # Initialize OpenAI client only if API key is available
 openai_api_key = os.getenv("OPENAI_API_KEY")
 if openai_api_key and openai_api_key != "your_openai_api_key_here":
@@ -92,19 +136,59 @@ app.add_middleware(
     allow_credentials=True,
 )
 
+@app.middleware("http")
+async def query_metrics_middleware(request: Request, call_next):
+    """Count each request's SQL statements, report them in Server-Timing and flag N+1 patterns"""
+    if not QUERY_METRICS_ENABLED:
+        return await call_next(request)
+    start = time.perf_counter()
+    label = f"{request.method} {request.url.path}"
+    with track_queries() as stats:
+        response = await call_next(request)
+    if "content-length" not in response.headers:
+        # Streamed body: it runs after the headers are sent, so a Server-Timing
+        # header would undercount. Check for N+1 patterns once it is done instead.
+        body = response.body_iterator
+
+        async def body_then_report():
+            async for chunk in body:
+                yield chunk
+            report_repeats(label, stats)
+
+        response.body_iterator = body_then_report()
+        return response
+    response.headers.append("Server-Timing", server_timing(stats, time.perf_counter() - start))
+    report_repeats(label, stats)
+    return response
+
+# Chat persistence is write-behind (chat_writer.py) and was never read-your-writes;
+# not marking these keeps an active chatter's retrieval scans on the replica
+_WRITE_BEHIND_PATHS = {"/chat", "/chat-rag"}
+
+@app.middleware("http")
+async def read_your_writes_middleware(request: Request, call_next):
+    """Keep a client's reads on the primary for a while after any request that may have written"""
+    response = await call_next(request)
+    if (DATABASE_READ_URL and request.method not in ("GET", "HEAD", "OPTIONS")
+            and request.url.path not in _WRITE_BEHIND_PATHS):
+        # The client carries the write time, so whichever worker or instance serves its next read sees it
+        response.set_cookie(READ_YOUR_WRITES_COOKIE, f"{time.time():.3f}",
+                            max_age=max(1, math.ceil(READ_YOUR_WRITES_SECONDS)), httponly=True, samesite="lax")
+    return response
+
 @app.on_event("startup")
 async def startup_event():
-    """Preload system materials into cache on startup"""
-    try:
-        from database import get_session_local
-        db = get_session_local()()
-        try:
-            preload_system_materials(db, SYSTEM_USER_ID)
-            print("Material cache initialized")
-        finally:
-            db.close()
-    except Exception as e:
-        print(f"Warning: Could not preload system materials: {e}")
+    """Preload system materials into cache in the background (see /ready)"""
+    start_background_warmup(SYSTEM_USER_ID)
+    start_snapshot_thread()
+    chat_writer.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Drain queued chat writes and save the hot cache set so the next start can reload it"""
+    await run_in_threadpool(chat_writer.stop)
+    stop_snapshot_thread()
+    await dispose_async_engine()
 
 # File processing functions
 def extract_text_from_pdf(file_content: bytes) -> str:
@@ -145,6 +229,11 @@ def generate_embeddings(text: str) -> List[float]:
     if not client:
         raise HTTPException(status_code=503, detail="OpenAI client not configured")
     
+    # Identical concurrent queries share one API call
+    return _embedding_flight.do(text, lambda: _create_embedding(text))
+
+def _create_embedding(text: str) -> List[float]:
+    """Call the OpenAI embeddings API for one text"""
     try:
         response = client.embeddings.create(
             model="text-embedding-3-small",
@@ -195,6 +284,19 @@ def health_check():
         "database": "connected" if test_connection() else "disconnected"
     }
 
+@app.get("/ready")
+def readiness_check():
+    """Readiness endpoint - 503 until the startup cache warmup has succeeded"""
+    warmup = get_warmup_status()
+    # A warmup that failed all its retries usually means the database is unreachable;
+    # keep the worker out of rotation rather than serve every request cold
+    ready = warmup["state"] == "ready"
+    status = {"ready": "ready", "failed": "failed"}.get(warmup["state"], "warming")
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": status, "warmup": warmup}
+    )
+
 @app.get("/api/cache/stats")
 def get_cache_stats_endpoint():
     """Get material cache statistics"""
@@ -210,6 +312,27 @@ def get_cache_stats_endpoint():
             "error": str(e)
         }
 
+@app.get("/api/cache/metrics", response_class=PlainTextResponse)
+def get_cache_metrics_endpoint():
+    """Cache metrics in Prometheus text exposition format"""
+    return PlainTextResponse(get_cache_metrics_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/db/pool-stats")
+def get_pool_stats_endpoint():
+    """Get database connection pool statistics for this worker"""
+    try:
+        return {
+            "success": True,
+            "pool_stats": get_pool_stats(),
+            "chat_writer": chat_writer.stats(),
+            "thread_memory": thread_memory.stats()
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
 @app.get("/api/tables")
 def list_tables(db: Session = Depends(get_db)):
     """List all tables in the database"""
@@ -304,7 +427,7 @@ def test_authentication_flow(
         return {"error": f"Connection test failed: {str(e)}"}
 
 @app.get("/api/user-data/{user_id}")
-def get_user_data(user_id: str, db: Session = Depends(get_db)):
+def get_user_data(user_id: str, db: Session = Depends(get_read_db)):
     """Get all data for a specific Supabase user from AWS"""
     try:
         # Get chat messages for this user
@@ -339,29 +462,48 @@ def get_user_data(user_id: str, db: Session = Depends(get_db)):
     except Exception as e:
         return {"error": f"Failed to get user data: {str(e)}"}
 
+def _user_activity_counts(db: Session):
+    """(user_id, total_messages, total_interactions) for every user with data, in one query"""
+    if USER_ACTIVITY_SUMMARY_ENABLED:
+        return db.query(
+            UserActivitySummary.user_id,
+            UserActivitySummary.total_messages,
+            UserActivitySummary.total_interactions
+        ).filter(
+            or_(UserActivitySummary.total_messages > 0, UserActivitySummary.total_interactions > 0)
+        ).all()
+    
+    # Pre-aggregate each table, then one GROUP BY over the union
+    activity = union_all(
+        select(
+            ChatMessage.user_id.label("user_id"),
+            func.count().label("messages"),
+            literal(0).label("interactions")
+        ).where(ChatMessage.user_id.isnot(None)).group_by(ChatMessage.user_id),
+        select(
+            UserInteraction.user_id.label("user_id"),
+            literal(0).label("messages"),
+            func.count().label("interactions")
+        ).where(UserInteraction.user_id.isnot(None)).group_by(UserInteraction.user_id)
+    ).subquery()
+    return db.execute(
+        select(
+            activity.c.user_id,
+            func.sum(activity.c.messages),
+            func.sum(activity.c.interactions)
+        ).group_by(activity.c.user_id)
+    ).all()
+
 @app.get("/api/all-users-with-data")
-def get_all_users_with_data(db: Session = Depends(get_db)):
+def get_all_users_with_data(db: Session = Depends(get_read_db)):
     """Get all Supabase users who have data in AWS"""
     try:
-        # Get all unique user IDs from chat messages (filter out None)
-        chat_users = db.query(ChatMessage.user_id).filter(ChatMessage.user_id.isnot(None)).distinct().all()
-        chat_user_ids = [str(user[0]) for user in chat_users if user[0] is not None]
-        
-        # Get all unique user IDs from user interactions (filter out None)
-        interaction_users = db.query(UserInteraction.user_id).filter(UserInteraction.user_id.isnot(None)).distinct().all()
-        interaction_user_ids = [str(user[0]) for user in interaction_users if user[0] is not None]
-        
-        # Combine and deduplicate
-        all_user_ids = list(set(chat_user_ids + interaction_user_ids))
-        
-        # Get user details for each
         user_data = []
-        for user_id in all_user_ids:
-            messages = db.query(ChatMessage).filter(ChatMessage.user_id == user_id).count()
-            interactions = db.query(UserInteraction).filter(UserInteraction.user_id == user_id).count()
-            
+        for user_id, messages, interactions in _user_activity_counts(db):
+            messages = int(messages or 0)
+            interactions = int(interactions or 0)
             user_data.append({
-                "supabase_user_id": user_id,
+                "supabase_user_id": str(user_id),
                 "total_messages": messages,
                 "total_interactions": interactions,
                 "has_data": messages > 0 or interactions > 0
@@ -379,7 +521,7 @@ def get_all_users_with_data(db: Session = Depends(get_db)):
         return {"error": f"Failed to get user data: {str(e)}"}
 
 @app.get("/api/recent-chat-messages")
-def get_recent_chat_messages(db: Session = Depends(get_db)):
+def get_recent_chat_messages(db: Session = Depends(get_read_db)):
     """Get recent chat messages from the database"""
     try:
         # Get the 10 most recent chat messages
@@ -465,10 +607,12 @@ async def create_item(item: Dict):
 def get_chat_messages(
     session_id: Optional[str] = None,
     user_id: Optional[str] = None,
-    limit: int = 50,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    db: Session = Depends(get_read_db)
 ):
-    """Get chat messages with optional filtering"""
+    """Get chat messages with optional filtering (cursor-paginated, newest first)"""
+    limit = clamp_limit(limit)
     try:
         query = db.query(ChatMessage)
         
@@ -477,9 +621,13 @@ def get_chat_messages(
         if user_id:
             query = query.filter(ChatMessage.user_id == user_id)
         
-        messages = query.order_by(ChatMessage.timestamp.desc()).limit(limit).all()
+        rows = paginate(query, ChatMessage.timestamp, ChatMessage.id, cursor, limit).all()
+        messages, next_cursor, has_more = page_result(rows, limit, lambda msg: (msg.timestamp, msg.id))
         return {"messages": [{"id": str(msg.id), "session_id": msg.session_id, "message_type": msg.message_type, 
-                             "timestamp": msg.timestamp.isoformat() if msg.timestamp else None, "user_id": str(msg.user_id) if msg.user_id else None} for msg in messages]}
+                             "timestamp": msg.timestamp.isoformat() if msg.timestamp else None, "user_id": str(msg.user_id) if msg.user_id else None} for msg in messages],
+                "next_cursor": next_cursor, "has_more": has_more}
+    except HTTPException:
+        raise
     except Exception as e:
         return {"error": f"Database error: {str(e)}", "message": "Tables may not exist yet. Please create them first."}
 
@@ -519,10 +667,12 @@ def create_chat_message(
 def get_user_sessions(
     user_id: Optional[str] = None,
     is_active: Optional[bool] = None,
-    limit: int = 50,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    db: Session = Depends(get_read_db)
 ):
-    """Get user sessions with optional filtering"""
+    """Get user sessions with optional filtering (cursor-paginated, newest first)"""
+    limit = clamp_limit(limit)
     try:
         query = db.query(UserSession)
         
@@ -531,9 +681,13 @@ def get_user_sessions(
         if is_active is not None:
             query = query.filter(UserSession.is_active == is_active)
         
-        sessions = query.order_by(UserSession.created_at.desc()).limit(limit).all()
+        rows = paginate(query, UserSession.created_at, UserSession.id, cursor, limit).all()
+        sessions, next_cursor, has_more = page_result(rows, limit, lambda sess: (sess.created_at, sess.id))
         return {"sessions": [{"id": str(sess.id), "session_id": sess.session_id, "user_id": str(sess.user_id) if sess.user_id else None,
-                             "created_at": sess.created_at.isoformat() if sess.created_at else None, "is_active": sess.is_active} for sess in sessions]}
+                             "created_at": sess.created_at.isoformat() if sess.created_at else None, "is_active": sess.is_active} for sess in sessions],
+                "next_cursor": next_cursor, "has_more": has_more}
+    except HTTPException:
+        raise
     except Exception as e:
         return {"error": f"Database error: {str(e)}", "message": "Tables may not exist yet. Please create them first."}
 
@@ -542,10 +696,12 @@ def get_user_interactions(
     user_id: Optional[str] = None,
     session_id: Optional[str] = None,
     interaction_type: Optional[str] = None,
-    limit: int = 50,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    db: Session = Depends(get_read_db)
 ):
-    """Get user interactions with optional filtering"""
+    """Get user interactions with optional filtering (cursor-paginated, newest first)"""
+    limit = clamp_limit(limit)
     try:
         query = db.query(UserInteraction)
         
@@ -556,9 +712,13 @@ def get_user_interactions(
         if interaction_type:
             query = query.filter(UserInteraction.interaction_type == interaction_type)
         
-        interactions = query.order_by(UserInteraction.timestamp.desc()).limit(limit).all()
+        rows = paginate(query, UserInteraction.timestamp, UserInteraction.id, cursor, limit).all()
+        interactions, next_cursor, has_more = page_result(rows, limit, lambda inter: (inter.timestamp, inter.id))
         return {"interactions": [{"id": str(inter.id), "session_id": inter.session_id, "user_id": str(inter.user_id) if inter.user_id else None,
-                                 "interaction_type": inter.interaction_type, "timestamp": inter.timestamp.isoformat() if inter.timestamp else None} for inter in interactions]}
+                                 "interaction_type": inter.interaction_type, "timestamp": inter.timestamp.isoformat() if inter.timestamp else None} for inter in interactions],
+                "next_cursor": next_cursor, "has_more": has_more}
+    except HTTPException:
+        raise
     except Exception as e:
         return {"error": f"Database error: {str(e)}", "message": "Tables may not exist yet. Please create them first."}
 
@@ -653,6 +813,12 @@ def build_page_context_message(ctx: Optional[dict]) -> Optional[dict]:
     return {"role": "system", "content": content}
 
 
+CHAT_MODEL = "gpt-3.5-turbo"
+CHAT_MAX_TOKENS = 500
+CHAT_WS_MATERIALS_TTL_SECONDS = int(os.getenv("CHAT_WS_MATERIALS_TTL_SECONDS", "300"))  # WebSocket chat reloads the user's material list this often
+CHAT_WS_AUTH_TIMEOUT_SECONDS = 10
+CHAT_SYSTEM_PROMPT = "You are a helpful AI assistant. You can answer questions about medical topics, general knowledge, current events, and provide practical information. Be helpful and informative in your responses."
+
 class ChatIn(BaseModel):
     message: str
     thread_id: Optional[str] = None
@@ -662,73 +828,196 @@ class ChatOut(BaseModel):
     reply: str
     thread_id: str
 
+# Time to first token of streamed replies: the latency users actually wait through
+_chat_ttft = LatencyHistogram()
+_chat_ttft_lock = threading.Lock()
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_chat_completion(messages: List[Dict[str, str]]) -> Iterator[str]:
+    """Content deltas of a streamed completion; closing the generator stops the generation"""
+    stream = client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=messages,
+        max_tokens=CHAT_MAX_TOKENS,
+        stream=True
+    )
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        stream.close()
+
+def _record_ttft(started: float) -> int:
+    ttft_ms = int((time.perf_counter() - started) * 1000)
+    with _chat_ttft_lock:
+        _chat_ttft.observe(ttft_ms / 1000)
+    return ttft_ms
+
+def summarize_thread(summary: str, turns: List[tuple]) -> str:
+    """Fold older turns of a chat thread into its rolling summary (see thread_memory.py)"""
+    transcript = "\n".join(f"{role}: {content}" for role, content in turns)
+    previous = f"Summary so far:\n{summary}\n\n" if summary else ""
+    response = client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=[
+            {"role": "system", "content": f"Update the summary of this conversation between a user and an assistant. Keep facts, names, numbers, the user's goals and open questions. Reply with the summary only, at most {THREAD_SUMMARY_TOKENS * 3 // 4} words."},
+            {"role": "user", "content": f"{previous}New messages:\n{transcript}"}
+        ],
+        max_tokens=THREAD_SUMMARY_TOKENS
+    )
+    return response.choices[0].message.content
+
+# Per-worker LRU of chat thread histories, loaded once per thread
+thread_memory = ThreadMemory(summarize=summarize_thread)
+
+def with_thread_history(messages: List[Dict[str, str]], user_id: str, thread_id: str, new: bool) -> List[Dict[str, str]]:
+    """
+    Insert the thread's token-bounded history between the system prompt(s) and the new user message.
+    Loading an uncached thread queries the database; if that fails the turn goes ahead without
+    history, the same degradation compaction accepts when the summarizer fails.
+    """
+    try:
+        history = thread_memory.get(user_id, thread_id, new=new).prompt_messages()
+    except Exception as e:
+        print(f"⚠️  Could not load history of thread {thread_id}, answering without it: {e}")
+        return messages
+    return messages[:-1] + history + messages[-1:]
+
+def persist_chat_turn(thread_id: str, user_id: str, user_message: str, reply: str, response_time_ms: Optional[int]):
+    """Queue both messages of a turn (write-behind) and append it to the thread's history"""
+    chat_writer.enqueue_message(
+        session_id=thread_id,
+        user_id=user_id,
+        message_type="user",
+        message_content={"message": user_message},
+        response_time_ms=response_time_ms,
+        message_length=len(user_message)
+    )
+    if reply:
+        chat_writer.enqueue_message(
+            session_id=thread_id,
+            user_id=user_id,
+            message_type="assistant",
+            message_content={"message": reply},
+            message_length=len(reply)
+        )
+    thread_memory.remember(user_id, thread_id, user_message, reply)
+
+def chat_event_stream(messages: List[Dict[str, str]], thread_id: str, user_id: str, user_message: str,
+                      started: float) -> StreamingResponse:
+    """
+    Stream the completion for messages as server-sent events:
+    meta (thread_id), token (content) per delta, then done (timings) or error (detail).
+    The turn (with whatever part of the reply was sent) is persisted once the stream closes.
+    """
+    def events():
+        ttft_ms = None
+        failed = False
+        parts = []
+        yield _sse("meta", {"thread_id": thread_id})
+        deltas = stream_chat_completion(messages)
+        try:
+            for delta in deltas:
+                if ttft_ms is None:
+                    ttft_ms = _record_ttft(started)
+                parts.append(delta)
+                yield _sse("token", {"content": delta})
+            yield _sse("done", {
+                "thread_id": thread_id,
+                "ttft_ms": ttft_ms,
+                "total_ms": int((time.perf_counter() - started) * 1000)
+            })
+        except Exception as e:
+            failed = True
+            yield _sse("error", {"detail": chat_error_detail(str(e))})
+        finally:
+            # Also runs when the client disconnects mid-stream: stop the generation
+            deltas.close()
+            if not failed:
+                persist_chat_turn(thread_id, user_id, user_message, "".join(parts), ttft_ms)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # Keep proxies from buffering the stream
+    })
+
 @app.post("/chat", response_model=ChatOut)
-def chat(payload: ChatIn, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+def chat(payload: ChatIn, current_user: dict = Depends(get_current_user)):
     """Chat endpoint with authentication and database storage"""
     if not client:
         raise HTTPException(status_code=503, detail="OpenAI client not configured")
     
+    started = time.perf_counter()
+    
     # Create or reuse a thread
     thread_id = payload.thread_id or str(uuid4())
     
-    # Simple conversation without session management for now
     messages = [
-        {"role": "system", "content": "You are a helpful AI assistant. You can answer questions about medical topics, general knowledge, current events, and provide practical information. Be helpful and informative in your responses."}
+        {"role": "system", "content": CHAT_SYSTEM_PROMPT}
     ]
     
     messages.append({"role": "user", "content": payload.message})
+    messages = with_thread_history(messages, current_user["user_id"], thread_id, new=not payload.thread_id)
     
     try:
-        # Use the correct OpenAI model
         response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+            model=CHAT_MODEL,
             messages=messages,
-            max_tokens=500
+            max_tokens=CHAT_MAX_TOKENS
         )
         
         reply = response.choices[0].message.content
         
-        # Store the chat message in database with real user ID
-        try:
-            # First create a user session if it doesn't exist
-            existing_session = db.query(UserSession).filter(UserSession.session_id == thread_id).first()
-            if not existing_session:
-                user_session = UserSession(
-                    session_id=thread_id,
-                    user_id=current_user["user_id"],
-                    is_active=True
-                )
-                db.add(user_session)
-                db.commit()
-            
-            # Store the chat message
-            chat_message = ChatMessage(
-                session_id=thread_id,
-                message_type="user",
-                message_content={"message": payload.message},
-                user_id=current_user["user_id"],
-                response_time_ms=100,  # Placeholder
-                message_length=len(payload.message)
-            )
-            
-            db.add(chat_message)
-            db.commit()
-            
-        except Exception as db_error:
-            # Log the error but don't fail the chat
-            print(f"Database storage error: {db_error}")
+        # Store the turn (write-behind: the session upsert and inserts happen off the request path)
+        persist_chat_turn(thread_id, current_user["user_id"], payload.message, reply,
+                          int((time.perf_counter() - started) * 1000))
         
         return ChatOut(reply=reply, thread_id=thread_id)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
+@app.post("/chat/stream")
+def chat_stream(payload: ChatIn, current_user: dict = Depends(get_current_user)):
+    """/chat streamed as server-sent events"""
+    if not client:
+        raise HTTPException(status_code=503, detail="OpenAI client not configured")
+    
+    started = time.perf_counter()
+    thread_id = payload.thread_id or str(uuid4())
+    messages = [
+        {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+        {"role": "user", "content": payload.message}
+    ]
+    messages = with_thread_history(messages, current_user["user_id"], thread_id, new=not payload.thread_id)
+    return chat_event_stream(messages, thread_id, current_user["user_id"], payload.message, started)
+
+@app.get("/api/chat/latency")
+def get_chat_latency():
+    """Time to first token of streamed chat replies in this process"""
+    with _chat_ttft_lock:
+        return {
+            "streamed_replies": _chat_ttft.count,
+            "ttft_avg_ms": round(_chat_ttft.total / _chat_ttft.count * 1000, 1) if _chat_ttft.count else None,
+            "ttft_p50_ms": _quantile_ms(_chat_ttft.quantile(0.5)),
+            "ttft_p95_ms": _quantile_ms(_chat_ttft.quantile(0.95))
+        }
+
+def _quantile_ms(seconds: Optional[float]) -> Optional[float]:
+    """Histogram quantile (bucket upper bound) in ms; None when empty or beyond the last bucket"""
+    if seconds is None or seconds == float('inf'):
+        return None
+    return seconds * 1000
+
 # Care Plan API Endpoints
 @app.post("/api/care-plans")
 async def create_care_plan(
     care_plan_data: dict,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new care plan"""
     try:
@@ -815,8 +1104,8 @@ async def create_care_plan(
         )
         
         db.add(care_plan)
-        db.commit()
-        db.refresh(care_plan)
+        await db.commit()
+        await db.refresh(care_plan)
         
         # Index the care plan content for RAG
         await index_care_plan_for_rag(care_plan, db)
@@ -828,19 +1117,25 @@ async def create_care_plan(
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error creating care plan: {str(e)}")
 
 @app.get("/api/care-plans")
 async def get_care_plans(
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Get all care plans for the current user"""
+    """Get the current user's care plans (cursor-paginated, newest first)"""
+    limit = clamp_limit(limit)
     try:
-        care_plans = db.query(CarePlan).filter(
-            CarePlan.user_id == current_user['user_id']
-        ).order_by(CarePlan.created_at.desc()).all()
+        statement = paginate(
+            select(CarePlan).where(CarePlan.user_id == current_user['user_id']),
+            CarePlan.created_at, CarePlan.id, cursor, limit
+        )
+        rows = (await db.execute(statement)).scalars().all()
+        care_plans, next_cursor, has_more = page_result(rows, limit, lambda cp: (cp.created_at, cp.id))
         
         return {
             "success": True,
@@ -856,9 +1151,13 @@ async def get_care_plans(
                     "updated_at": cp.updated_at.isoformat() if cp.updated_at else None
                 }
                 for cp in care_plans
-            ]
+            ],
+            "next_cursor": next_cursor,
+            "has_more": has_more
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching care plans: {str(e)}")
 
@@ -866,21 +1165,25 @@ async def get_care_plans(
 async def get_care_plan(
     care_plan_id: int,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific care plan by ID"""
     try:
-        care_plan = db.query(CarePlan).filter(
-            CarePlan.id == care_plan_id,
-            CarePlan.user_id == current_user['user_id']
-        ).first()
+        result = await db.execute(
+            select(CarePlan).where(
+                CarePlan.id == care_plan_id,
+                CarePlan.user_id == current_user['user_id']
+            )
+        )
+        care_plan = result.scalars().first()
         
         if not care_plan:
             raise HTTPException(status_code=404, detail="Care plan not found")
         
         # Update last accessed
         care_plan.last_accessed = func.now()
-        db.commit()
+        await db.commit()
+        await db.refresh(care_plan)  # Load the server-set timestamps without lazy IO
         
         return {
             "success": True,
@@ -983,14 +1286,17 @@ async def get_care_plan(
 async def generate_ai_recommendations(
     care_plan_id: int,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Generate AI recommendations for a care plan using RAG"""
     try:
-        care_plan = db.query(CarePlan).filter(
-            CarePlan.id == care_plan_id,
-            CarePlan.user_id == current_user['user_id']
-        ).first()
+        result = await db.execute(
+            select(CarePlan).where(
+                CarePlan.id == care_plan_id,
+                CarePlan.user_id == current_user['user_id']
+            )
+        )
+        care_plan = result.scalars().first()
         
         if not care_plan:
             raise HTTPException(status_code=404, detail="Care plan not found")
@@ -998,8 +1304,8 @@ async def generate_ai_recommendations(
         if not client:
             raise HTTPException(status_code=503, detail="OpenAI client not configured")
         
-        # Build context for AI generation
-        context = build_care_plan_context(care_plan, db)
+        # Build context for AI generation (embedding call and vector cache are blocking)
+        context = await run_in_threadpool(build_care_plan_context_sync, care_plan)
         
         # Generate AI recommendations
         recommendations = await generate_care_plan_recommendations(context, client)
@@ -1014,7 +1320,7 @@ async def generate_ai_recommendations(
         care_plan.rag_confidence_score = recommendations.get('confidence_score', 0.0)
         care_plan.updated_at = func.now()
         
-        db.commit()
+        await db.commit()
         
         return {
             "success": True,
@@ -1031,27 +1337,32 @@ async def generate_ai_recommendations(
 async def delete_care_plan(
     care_plan_id: int,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a care plan"""
     try:
-        care_plan = db.query(CarePlan).filter(
-            CarePlan.id == care_plan_id,
-            CarePlan.user_id == current_user['user_id']
-        ).first()
+        result = await db.execute(
+            select(CarePlan).where(
+                CarePlan.id == care_plan_id,
+                CarePlan.user_id == current_user['user_id']
+            )
+        )
+        care_plan = result.scalars().first()
         
         if not care_plan:
             raise HTTPException(status_code=404, detail="Care plan not found")
         
         # Delete associated RAG entries
-        db.query(VectorIndexEntry).filter(
-            VectorIndexEntry.source_id == care_plan_id,
-            VectorIndexEntry.source_type == "care_plan"
-        ).delete()
+        await db.execute(
+            delete(VectorIndexEntry).where(
+                VectorIndexEntry.source_id == care_plan_id,
+                VectorIndexEntry.source_type == "care_plan"
+            )
+        )
         
         # Delete care plan
-        db.delete(care_plan)
-        db.commit()
+        await db.delete(care_plan)
+        await db.commit()
         
         return {
             "success": True,
@@ -1061,7 +1372,7 @@ async def delete_care_plan(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error deleting care plan: {str(e)}")
 
 # Helper functions for care plan operations
@@ -1113,14 +1424,14 @@ def build_care_plan_text(care_plan_data: dict) -> str:
     
     return "\n".join(sections)
 
-async def index_care_plan_for_rag(care_plan: CarePlan, db: Session):
+async def index_care_plan_for_rag(care_plan: CarePlan, db: AsyncSession):
     """Index care plan content for RAG retrieval"""
     try:
         if not care_plan.exported_text:
             return
         
         # Create vector index entry for the care plan
-        embedding = generate_embeddings(care_plan.exported_text)
+        embedding = await run_in_threadpool(generate_embeddings, care_plan.exported_text)
         
         vector_entry = VectorIndexEntry(
             user_id=care_plan.user_id,
@@ -1142,7 +1453,7 @@ async def index_care_plan_for_rag(care_plan: CarePlan, db: Session):
         )
         
         db.add(vector_entry)
-        db.commit()
+        await db.commit()
         
     except Exception as e:
         print(f"Error indexing care plan for RAG: {e}")
@@ -1154,23 +1465,39 @@ def build_care_plan_context(care_plan: CarePlan, db: Session) -> str:
         query_text = f"{care_plan.diagnosis} {care_plan.procedure} anesthesia care plan"
         query_embedding = generate_embeddings(query_text)
         
-        # Get relevant vector entries (user's materials AND system materials)
-        vector_entries = db.query(VectorIndexEntry).filter(
+        # Get relevant vector entries (user's materials AND system materials) from the vector cache
+        materials = db.query(Material.id, Material.processed_at, Material.chunk_count).filter(
             or_(
-                VectorIndexEntry.user_id == care_plan.user_id,
-                VectorIndexEntry.user_id == SYSTEM_USER_ID
-            )
+                Material.user_id == care_plan.user_id,
+                Material.user_id == SYSTEM_USER_ID
+            ),
+            Material.status == "processed"
+        ).all()
+        vector_blocks = load_vector_blocks(db, materials)
+        
+        # The user's indexed care plans are small and change often, so read them directly
+        care_plan_entries = db.query(VectorIndexEntry).filter(
+            VectorIndexEntry.user_id == care_plan.user_id,
+            VectorIndexEntry.source_type == "care_plan"
         ).all()
         
         # Calculate similarity and get top results
         results = []
-        for entry in vector_entries:
+        for block in vector_blocks:
+            for i, similarity in enumerate(block.dot_scores(query_embedding)):
+                results.append({
+                    "content": block.contents[i],
+                    "similarity": similarity,
+                    "metadata": block.metadata[i],
+                    "is_system": block.user_id == SYSTEM_USER_ID
+                })
+        for entry in care_plan_entries:
             similarity = sum(a * b for a, b in zip(query_embedding, entry.embedding))
             results.append({
                 "content": entry.content,
                 "similarity": similarity,
-                "metadata": entry.vector_metadata,
-                "is_system": entry.user_id == SYSTEM_USER_ID
+                "metadata": entry.vector_metadata or {},
+                "is_system": False
             })
         
         # Sort by similarity and get top 5 most relevant chunks
@@ -1192,6 +1519,14 @@ def build_care_plan_context(care_plan: CarePlan, db: Session) -> str:
         print(f"Error building care plan context: {e}")
         return care_plan.exported_text or ""
 
+def build_care_plan_context_sync(care_plan: CarePlan) -> str:
+    """build_care_plan_context with its own sync session, for use from async endpoints via the threadpool"""
+    db = get_session_local()()
+    try:
+        return build_care_plan_context(care_plan, db)
+    finally:
+        db.close()
+
 @app.post("/chat-test", response_model=ChatOut)
 def chat_test(payload: ChatIn, db: Session = Depends(get_db)):
     """Test chat endpoint without authentication"""
@@ -1226,695 +1561,227 @@ def chat_test(payload: ChatIn, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
 
-# Care Plan API Endpoints
-@app.post("/api/care-plans")
-async def create_care_plan(
-    care_plan_data: dict,
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Create a new care plan"""
+async def generate_care_plan_recommendations(context: str, client) -> dict:
+    """Generate AI recommendations for care plan"""
     try:
-        # Create care plan record
-        care_plan = CarePlan(
-            user_id=current_user['user_id'],
-            title=care_plan_data.get('title', 'Untitled Care Plan'),
-            patient_name=care_plan_data.get('patient_name'),
-            procedure=care_plan_data.get('procedure'),
-            diagnosis=care_plan_data.get('diagnosis'),
-            
-            # Demographics
-            age=care_plan_data.get('age'),
-            sex=care_plan_data.get('sex'),
-            height=care_plan_data.get('height'),
-            weight=care_plan_data.get('weight'),
-            
-            # Vital Signs
-            temperature_f=care_plan_data.get('tempF'),
-            blood_pressure=care_plan_data.get('bp'),
-            heart_rate=care_plan_data.get('hr'),
-            respiration_rate=care_plan_data.get('rr'),
-            oxygen_saturation=care_plan_data.get('oxygen_saturation'),
-            lmp_date=care_plan_data.get('lmp_date'),
-            
-            # Medical History
-            past_medical_history=care_plan_data.get('pmh'),
-            past_surgical_history=care_plan_data.get('psh'),
-            anesthesia_history=care_plan_data.get('anesthesiaHx'),
-            current_medications=care_plan_data.get('meds'),
-            alcohol_use=care_plan_data.get('alcohol'),
-            substance_use=care_plan_data.get('substance'),
-            allergies=care_plan_data.get('allergies'),
-            
-            # Physical Assessment
-            neurological_findings=care_plan_data.get('neuro'),
-            heent_findings=care_plan_data.get('heent'),
-            respiratory_findings=care_plan_data.get('resp'),
-            cardiovascular_findings=care_plan_data.get('cardio'),
-            gastrointestinal_findings=care_plan_data.get('gi'),
-            genitourinary_findings=care_plan_data.get('gu'),
-            endocrine_findings=care_plan_data.get('endo'),
-            other_findings=care_plan_data.get('otherFindings'),
-            
-            # Airway Assessment
-            mallampati_class=care_plan_data.get('mallampati'),
-            ulbt_grade=care_plan_data.get('ulbt'),
-            thyromental_distance=care_plan_data.get('thyromental'),
-            interincisor_distance=care_plan_data.get('interincisor'),
-            dentition=care_plan_data.get('dentition'),
-            neck_assessment=care_plan_data.get('neck'),
-            oral_mucosa=care_plan_data.get('oralMucosa'),
-            
-            # Laboratory Values
-            sodium=care_plan_data.get('na'),
-            potassium=care_plan_data.get('k'),
-            chloride=care_plan_data.get('cl'),
-            co2=care_plan_data.get('co2'),
-            bun=care_plan_data.get('bun'),
-            creatinine=care_plan_data.get('cr'),
-            glucose=care_plan_data.get('glu'),
-            wbc=care_plan_data.get('wbc'),
-            hemoglobin=care_plan_data.get('hgb'),
-            hematocrit=care_plan_data.get('hct'),
-            platelets=care_plan_data.get('plt'),
-            pt=care_plan_data.get('pt'),
-            ptt=care_plan_data.get('ptt'),
-            inr=care_plan_data.get('inr'),
-            abg=care_plan_data.get('abg'),
-            other_labs=care_plan_data.get('otherLabs'),
-            
-            # Imaging/Diagnostic Tests
-            ekg=care_plan_data.get('ekg'),
-            chest_xray=care_plan_data.get('cxr'),
-            echocardiogram=care_plan_data.get('echo'),
-            other_imaging=care_plan_data.get('otherImaging'),
-            
-            # Cultural/Religious Considerations
-            cultural_religious_attributes=care_plan_data.get('cultural_religious_attributes'),
-            
-            # Generate export text for RAG indexing
-            exported_text=build_care_plan_text(care_plan_data),
-            export_hash=hash(str(care_plan_data))
+        system_prompt = """You are an expert anesthesiologist AI assistant. Based on the patient information and relevant medical literature provided, generate comprehensive anesthesia care plan recommendations.
+
+Please provide:
+1. Anesthesia Plan: Detailed anesthesia approach including induction, maintenance, and emergence
+2. Risk Assessment: Analysis of patient-specific risks and complications
+3. Monitoring Plan: Required monitoring during the procedure
+4. Medication Plan: Specific medications and dosages
+
+Be specific, evidence-based, and consider the patient's comorbidities and procedure requirements."""
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": context}
+        ]
+        
+        response = await run_in_threadpool(
+            client.chat.completions.create,
+            model="gpt-3.5-turbo",
+            messages=messages,
+            max_tokens=1500
         )
         
-        db.add(care_plan)
-        db.commit()
-        db.refresh(care_plan)
+        ai_response = response.choices[0].message.content
         
-        # Index the care plan content for RAG
-        await index_care_plan_for_rag(care_plan, db)
+        # Parse the response into structured recommendations
+        recommendations = {
+            "anesthesia_plan": ai_response,
+            "risk_assessment": "",
+            "monitoring_plan": "",
+            "medication_plan": "",
+            "sources": [],
+            "confidence_score": 0.8
+        }
         
-        return {
-            "success": True,
-            "care_plan_id": care_plan.id,
-            "message": "Care plan created successfully"
-        }
+        return recommendations
         
     except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error creating care plan: {str(e)}")
+        print(f"Error generating AI recommendations: {e}")
+        return {
+            "anesthesia_plan": "Error generating recommendations",
+            "risk_assessment": "",
+            "monitoring_plan": "",
+            "medication_plan": "",
+            "sources": [],
+            "confidence_score": 0.0
+        }
 
-@app.get("/api/care-plans")
-async def get_care_plans(
+# File Upload Endpoints
+@app.post("/api/upload")
+def upload_file(
+    file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get all care plans for the current user"""
+    """Upload and process a file (PDF, DOCX, TXT) for RAG"""
+    
+    # Validate file type
+    allowed_types = ["pdf", "docx", "doc", "txt"]
+    file_extension = file.filename.split('.')[-1].lower() if '.' in file.filename else ""
+    
+    if file_extension not in allowed_types:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Unsupported file type. Allowed: {', '.join(allowed_types)}"
+        )
+    
+    # Read file content
+    try:
+        file_content = file.file.read()  # Sync handler: runs on the threadpool
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
+    
+    # Generate unique file path
+    file_id = str(uuid4())
+    s3_key = f"uploads/{current_user['user_id']}/{file_id}_{file.filename}"
+    
+    # Store file path (S3 if configured, otherwise None for text-only storage)
+    file_path = None
+    if s3_client:
+        try:
+            s3_client.put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=s3_key,
+                Body=file_content,
+                ContentType=file.content_type or "application/octet-stream"
+            )
+            file_path = f"s3://{S3_BUCKET_NAME}/{s3_key}"
+            print(f"File uploaded to S3: {file_path}")
+        except Exception as e:
+            print(f"S3 upload failed: {e}")
+            file_path = None
+    else:
+        print("S3 not configured - storing text content only (no file download available)")
+        file_path = None
+    
+    # Extract text from file
+    try:
+        extracted_text = extract_text_from_file(file_content, file_extension)
+        print(f"Extracted text length: {len(extracted_text)} characters")
+        print(f"First 200 chars: {extracted_text[:200]}")
+    except Exception as e:
+        print(f"Text extraction error: {e}")
+        raise HTTPException(status_code=400, detail=f"Error processing file: {str(e)}")
+    
+    # Create material record in database
+    material = Material(
+        user_id=current_user['user_id'],
+        title=file.filename,
+        file_type=file_extension,
+        file_path=file_path,
+        file_size=len(file_content),
+        status="processing",
+        processing_progress=0
+    )
+    
+    db.add(material)
+    db.commit()
+    db.refresh(material)
+    
+    # Process text for RAG (chunk and create embeddings)
     try:
-        care_plans = db.query(CarePlan).filter(
-            CarePlan.user_id == current_user['user_id']
-        ).order_by(CarePlan.created_at.desc()).all()
+        chunks = chunk_text(extracted_text)
+        
+        # Create vector index entries for each chunk
+        for i, chunk in enumerate(chunks):
+            try:
+                embedding = generate_embeddings(chunk)
+                
+                vector_entry = VectorIndexEntry(
+                    user_id=current_user['user_id'],
+                    content_hash=f"{file_id}_{i}",
+                    embedding=embedding,
+                    content=chunk,
+                    token_count=len(chunk.split()),  # Approximate token count
+                    chunk_index=i,
+                    source_type="material",
+                    source_id=material.id,
+                    embedding_model="text-embedding-3-small",
+                    vector_metadata={
+                        "file_name": file.filename,
+                        "chunk_index": i,
+                        "total_chunks": len(chunks),
+                        "file_type": file_extension,
+                        "file_size": len(file_content)
+                    }
+                )
+                
+                db.add(vector_entry)
+                
+            except Exception as e:
+                error_msg = str(e)
+                print(f"Error creating embedding for chunk {i}: {error_msg}")
+                # Log specific error types for debugging
+                if "403" in error_msg:
+                    print(f"⚠️  OpenAI API 403 error for chunk {i}. This chunk will be skipped. Check your API key permissions/quota.")
+                elif "401" in error_msg:
+                    print(f"⚠️  OpenAI API 401 error for chunk {i}. Invalid API key. Please check your OPENAI_API_KEY.")
+                continue
+        
+        db.commit()
+        
+        # Update material status
+        material.status = "processed"
+        material.processing_progress = 100
+        material.chunk_count = len(chunks)
+        material.total_tokens = sum(len(chunk.split()) for chunk in chunks)
+        material.processed_at = func.now()
+        store_material_text(db, material.id, extracted_text)
+        db.commit()
+        
+        # Cache the extracted text
+        cache_text(material.id, extracted_text)
         
         return {
             "success": True,
-            "care_plans": [
-                {
-                    "id": cp.id,
-                    "title": cp.title,
-                    "patient_name": cp.patient_name,
-                    "procedure": cp.procedure,
-                    "diagnosis": cp.diagnosis,
-                    "status": cp.status,
-                    "created_at": cp.created_at.isoformat() if cp.created_at else None,
-                    "updated_at": cp.updated_at.isoformat() if cp.updated_at else None
-                }
-                for cp in care_plans
-            ]
+            "material_id": material.id,
+            "file_name": file.filename,
+            "file_type": file_extension,
+            "chunks_created": len(chunks),
+            "text_length": len(extracted_text),
+            "file_path": file_path,
+            "message": f"File processed successfully. Created {len(chunks)} chunks for RAG."
         }
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching care plans: {str(e)}")
+        # Update material status to failed
+        material.status = "failed"
+        material.processing_error = str(e)
+        db.commit()
+        raise HTTPException(status_code=500, detail=f"Error processing file for RAG: {str(e)}")
 
-@app.get("/api/care-plans/{care_plan_id}")
-async def get_care_plan(
-    care_plan_id: int,
-    current_user: dict = Depends(get_current_user),
+@app.post("/api/admin/upload-system-material")
+def upload_system_material(
+    file: UploadFile = File(...),
+    x_admin_key: Optional[str] = Header(None, alias="X-Admin-Key"),
     db: Session = Depends(get_db)
 ):
-    """Get a specific care plan by ID"""
+    """Admin endpoint to upload system materials accessible to all users"""
+    
+    # Optional: Check admin key (set ADMIN_API_KEY in environment)
+    admin_api_key = os.getenv("ADMIN_API_KEY")
+    if admin_api_key:
+        if not x_admin_key or x_admin_key != admin_api_key:
+            raise HTTPException(status_code=403, detail="Invalid admin key")
+    
+    # Validate file type
+    allowed_types = ["pdf", "docx", "doc", "txt"]
+    file_extension = file.filename.split('.')[-1].lower() if '.' in file.filename else ""
+    
+    if file_extension not in allowed_types:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Unsupported file type. Allowed: {', '.join(allowed_types)}"
+        )
+    
+    # Read file content
     try:
-        care_plan = db.query(CarePlan).filter(
-            CarePlan.id == care_plan_id,
-            CarePlan.user_id == current_user['user_id']
-        ).first()
-        
-        if not care_plan:
-            raise HTTPException(status_code=404, detail="Care plan not found")
-        
-        # Update last accessed
-        care_plan.last_accessed = func.now()
-        db.commit()
-        
-        return {
-            "success": True,
-            "care_plan": {
-                "id": care_plan.id,
-                "title": care_plan.title,
-                "patient_name": care_plan.patient_name,
-                "procedure": care_plan.procedure,
-                "diagnosis": care_plan.diagnosis,
-                
-                # Demographics
-                "age": care_plan.age,
-                "sex": care_plan.sex,
-                "height": care_plan.height,
-                "weight": care_plan.weight,
-                
-                # Vital Signs
-                "tempF": care_plan.temperature_f,
-                "bp": care_plan.blood_pressure,
-                "hr": care_plan.heart_rate,
-                "rr": care_plan.respiration_rate,
-                "oxygen_saturation": care_plan.oxygen_saturation,
-                "lmp_date": care_plan.lmp_date,
-                
-                # Medical History
-                "pmh": care_plan.past_medical_history,
-                "psh": care_plan.past_surgical_history,
-                "anesthesiaHx": care_plan.anesthesia_history,
-                "meds": care_plan.current_medications,
-                "alcohol": care_plan.alcohol_use,
-                "substance": care_plan.substance_use,
-                "allergies": care_plan.allergies,
-                
-                # Physical Assessment
-                "neuro": care_plan.neurological_findings,
-                "heent": care_plan.heent_findings,
-                "resp": care_plan.respiratory_findings,
-                "cardio": care_plan.cardiovascular_findings,
-                "gi": care_plan.gastrointestinal_findings,
-                "gu": care_plan.genitourinary_findings,
-                "endo": care_plan.endocrine_findings,
-                "otherFindings": care_plan.other_findings,
-                
-                # Airway Assessment
-                "mallampati": care_plan.mallampati_class,
-                "ulbt": care_plan.ulbt_grade,
-                "thyromental": care_plan.thyromental_distance,
-                "interincisor": care_plan.interincisor_distance,
-                "dentition": care_plan.dentition,
-                "neck": care_plan.neck_assessment,
-                "oralMucosa": care_plan.oral_mucosa,
-                
-                # Laboratory Values
-                "na": care_plan.sodium,
-                "k": care_plan.potassium,
-                "cl": care_plan.chloride,
-                "co2": care_plan.co2,
-                "bun": care_plan.bun,
-                "cr": care_plan.creatinine,
-                "glu": care_plan.glucose,
-                "wbc": care_plan.wbc,
-                "hgb": care_plan.hemoglobin,
-                "hct": care_plan.hematocrit,
-                "plt": care_plan.platelets,
-                "pt": care_plan.pt,
-                "ptt": care_plan.ptt,
-                "inr": care_plan.inr,
-                "abg": care_plan.abg,
-                "otherLabs": care_plan.other_labs,
-                
-                # Imaging/Diagnostic Tests
-                "ekg": care_plan.ekg,
-                "cxr": care_plan.chest_xray,
-                "echo": care_plan.echocardiogram,
-                "otherImaging": care_plan.other_imaging,
-                
-                # Cultural/Religious Considerations
-                "cultural_religious_attributes": care_plan.cultural_religious_attributes,
-                
-                # AI-Generated Content
-                "ai_recommendations": care_plan.ai_recommendations,
-                "risk_assessment": care_plan.risk_assessment,
-                "monitoring_plan": care_plan.monitoring_plan,
-                "medication_plan": care_plan.medication_plan,
-                
-                # Metadata
-                "status": care_plan.status,
-                "version": care_plan.version,
-                "created_at": care_plan.created_at.isoformat() if care_plan.created_at else None,
-                "updated_at": care_plan.updated_at.isoformat() if care_plan.updated_at else None
-            }
-        }
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching care plan: {str(e)}")
-
-@app.post("/api/care-plans/{care_plan_id}/generate-ai")
-async def generate_ai_recommendations(
-    care_plan_id: int,
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Generate AI recommendations for a care plan using RAG"""
-    try:
-        care_plan = db.query(CarePlan).filter(
-            CarePlan.id == care_plan_id,
-            CarePlan.user_id == current_user['user_id']
-        ).first()
-        
-        if not care_plan:
-            raise HTTPException(status_code=404, detail="Care plan not found")
-        
-        if not client:
-            raise HTTPException(status_code=503, detail="OpenAI client not configured")
-        
-        # Build context for AI generation
-        context = build_care_plan_context(care_plan, db)
-        
-        # Generate AI recommendations
-        recommendations = await generate_care_plan_recommendations(context, client)
-        
-        # Update care plan with AI recommendations
-        care_plan.ai_recommendations = recommendations.get('anesthesia_plan', '')
-        care_plan.risk_assessment = recommendations.get('risk_assessment', '')
-        care_plan.monitoring_plan = recommendations.get('monitoring_plan', '')
-        care_plan.medication_plan = recommendations.get('medication_plan', '')
-        care_plan.rag_context = context
-        care_plan.rag_sources = recommendations.get('sources', [])
-        care_plan.rag_confidence_score = recommendations.get('confidence_score', 0.0)
-        care_plan.updated_at = func.now()
-        
-        db.commit()
-        
-        return {
-            "success": True,
-            "recommendations": recommendations,
-            "message": "AI recommendations generated successfully"
-        }
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating AI recommendations: {str(e)}")
-
-@app.delete("/api/care-plans/{care_plan_id}")
-async def delete_care_plan(
-    care_plan_id: int,
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Delete a care plan"""
-    try:
-        care_plan = db.query(CarePlan).filter(
-            CarePlan.id == care_plan_id,
-            CarePlan.user_id == current_user['user_id']
-        ).first()
-        
-        if not care_plan:
-            raise HTTPException(status_code=404, detail="Care plan not found")
-        
-        # Delete associated RAG entries
-        db.query(VectorIndexEntry).filter(
-            VectorIndexEntry.source_id == care_plan_id,
-            VectorIndexEntry.source_type == "care_plan"
-        ).delete()
-        
-        # Delete care plan
-        db.delete(care_plan)
-        db.commit()
-        
-        return {
-            "success": True,
-            "message": "Care plan deleted successfully"
-        }
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error deleting care plan: {str(e)}")
-
-# Helper functions for care plan operations
-def build_care_plan_text(care_plan_data: dict) -> str:
-    """Build text representation of care plan for RAG indexing"""
-    sections = []
-    
-    # Patient Information
-    if care_plan_data.get('patient_name'):
-        sections.append(f"Patient: {care_plan_data['patient_name']}")
-    if care_plan_data.get('age'):
-        sections.append(f"Age: {care_plan_data['age']}")
-    if care_plan_data.get('sex'):
-        sections.append(f"Sex: {care_plan_data['sex']}")
-    if care_plan_data.get('diagnosis'):
-        sections.append(f"Diagnosis: {care_plan_data['diagnosis']}")
-    if care_plan_data.get('procedure'):
-        sections.append(f"Procedure: {care_plan_data['procedure']}")
-    
-    # Medical History
-    if care_plan_data.get('pmh'):
-        sections.append(f"Past Medical History: {care_plan_data['pmh']}")
-    if care_plan_data.get('psh'):
-        sections.append(f"Past Surgical History: {care_plan_data['psh']}")
-    if care_plan_data.get('meds'):
-        sections.append(f"Current Medications: {care_plan_data['meds']}")
-    
-    # Physical Assessment
-    if care_plan_data.get('neuro'):
-        sections.append(f"Neurological: {care_plan_data['neuro']}")
-    if care_plan_data.get('cardio'):
-        sections.append(f"Cardiovascular: {care_plan_data['cardio']}")
-    if care_plan_data.get('resp'):
-        sections.append(f"Respiratory: {care_plan_data['resp']}")
-    
-    # Airway Assessment
-    if care_plan_data.get('mallampati'):
-        sections.append(f"Mallampati: {care_plan_data['mallampati']}")
-    if care_plan_data.get('ulbt'):
-        sections.append(f"ULBT Grade: {care_plan_data['ulbt']}")
-    
-    # Laboratory Values
-    lab_values = []
-    for lab in ['na', 'k', 'cl', 'co2', 'bun', 'cr', 'glu', 'wbc', 'hgb', 'hct', 'plt', 'pt', 'ptt', 'inr']:
-        if care_plan_data.get(lab):
-            lab_values.append(f"{lab.upper()}: {care_plan_data[lab]}")
-    if lab_values:
-        sections.append(f"Laboratory Values: {', '.join(lab_values)}")
-    
-    return "\n".join(sections)
-
-async def index_care_plan_for_rag(care_plan: CarePlan, db: Session):
-    """Index care plan content for RAG retrieval"""
-    try:
-        if not care_plan.exported_text:
-            return
-        
-        # Create vector index entry for the care plan
-        embedding = generate_embeddings(care_plan.exported_text)
-        
-        vector_entry = VectorIndexEntry(
-            user_id=care_plan.user_id,
-            content_hash=f"care_plan_{care_plan.id}",
-            embedding=embedding,
-            content=care_plan.exported_text,
-            token_count=len(care_plan.exported_text.split()),
-            chunk_index=0,
-            source_type="care_plan",
-            source_id=care_plan.id,
-            embedding_model="text-embedding-3-small",
-            vector_metadata={
-                "care_plan_id": care_plan.id,
-                "patient_name": care_plan.patient_name,
-                "procedure": care_plan.procedure,
-                "diagnosis": care_plan.diagnosis,
-                "created_at": care_plan.created_at.isoformat() if care_plan.created_at else None
-            }
-        )
-        
-        db.add(vector_entry)
-        db.commit()
-        
-    except Exception as e:
-        print(f"Error indexing care plan for RAG: {e}")
-
-def build_care_plan_context(care_plan: CarePlan, db: Session) -> str:
-    """Build context for AI generation by searching relevant materials"""
-    try:
-        # Search for relevant materials using care plan content
-        query_text = f"{care_plan.diagnosis} {care_plan.procedure} anesthesia care plan"
-        query_embedding = generate_embeddings(query_text)
-        
-        # Get relevant vector entries (user's materials AND system materials)
-        vector_entries = db.query(VectorIndexEntry).filter(
-            or_(
-                VectorIndexEntry.user_id == care_plan.user_id,
-                VectorIndexEntry.user_id == SYSTEM_USER_ID
-            )
-        ).all()
-        
-        # Calculate similarity and get top results
-        results = []
-        for entry in vector_entries:
-            similarity = sum(a * b for a, b in zip(query_embedding, entry.embedding))
-            results.append({
-                "content": entry.content,
-                "similarity": similarity,
-                "metadata": entry.vector_metadata,
-                "is_system": entry.user_id == SYSTEM_USER_ID
-            })
-        
-        # Sort by similarity and get top 5 most relevant chunks
-        results.sort(key=lambda x: x["similarity"], reverse=True)
-        top_results = results[:5]
-        
-        context_parts = [f"Patient Care Plan:\n{care_plan.exported_text}"]
-        
-        if top_results:
-            context_parts.append("\nRelevant Medical Literature:")
-            for i, result in enumerate(top_results, 1):
-                source_name = result["metadata"].get("file_name", "Unknown Source")
-                source_label = "System Textbook" if result.get("is_system") else "User Material"
-                context_parts.append(f"\n{i}. From {source_name} ({source_label}):\n{result['content'][:300]}...")
-        
-        return "\n".join(context_parts)
-        
-    except Exception as e:
-        print(f"Error building care plan context: {e}")
-        return care_plan.exported_text or ""
-
-async def generate_care_plan_recommendations(context: str, client) -> dict:
-    """Generate AI recommendations for care plan"""
-    try:
-        system_prompt = """You are an expert anesthesiologist AI assistant. Based on the patient information and relevant medical literature provided, generate comprehensive anesthesia care plan recommendations.
-
-Please provide:
-1. Anesthesia Plan: Detailed anesthesia approach including induction, maintenance, and emergence
-2. Risk Assessment: Analysis of patient-specific risks and complications
-3. Monitoring Plan: Required monitoring during the procedure
-4. Medication Plan: Specific medications and dosages
-
-Be specific, evidence-based, and consider the patient's comorbidities and procedure requirements."""
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": context}
-        ]
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            max_tokens=1500
-        )
-        
-        ai_response = response.choices[0].message.content
-        
-        # Parse the response into structured recommendations
-        recommendations = {
-            "anesthesia_plan": ai_response,
-            "risk_assessment": "",
-            "monitoring_plan": "",
-            "medication_plan": "",
-            "sources": [],
-            "confidence_score": 0.8
-        }
-        
-        return recommendations
-        
-    except Exception as e:
-        print(f"Error generating AI recommendations: {e}")
-        return {
-            "anesthesia_plan": "Error generating recommendations",
-            "risk_assessment": "",
-            "monitoring_plan": "",
-            "medication_plan": "",
-            "sources": [],
-            "confidence_score": 0.0
-        }
-
-# File Upload Endpoints
-@app.post("/api/upload")
-async def upload_file(
-    file: UploadFile = File(...),
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Upload and process a file (PDF, DOCX, TXT) for RAG"""
-    
-    # Validate file type
-    allowed_types = ["pdf", "docx", "doc", "txt"]
-    file_extension = file.filename.split('.')[-1].lower() if '.' in file.filename else ""
-    
-    if file_extension not in allowed_types:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Unsupported file type. Allowed: {', '.join(allowed_types)}"
-        )
-    
-    # Read file content
-    try:
-        file_content = await file.read()
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
-    
-    # Generate unique file path
-    file_id = str(uuid4())
-    s3_key = f"uploads/{current_user['user_id']}/{file_id}_{file.filename}"
-    
-    # Store file path (S3 if configured, otherwise None for text-only storage)
-    file_path = None
-    if s3_client:
-        try:
-            s3_client.put_object(
-                Bucket=S3_BUCKET_NAME,
-                Key=s3_key,
-                Body=file_content,
-                ContentType=file.content_type or "application/octet-stream"
-            )
-            file_path = f"s3://{S3_BUCKET_NAME}/{s3_key}"
-            print(f"File uploaded to S3: {file_path}")
-        except Exception as e:
-            print(f"S3 upload failed: {e}")
-            file_path = None
-    else:
-        print("S3 not configured - storing text content only (no file download available)")
-        file_path = None
-    
-    # Extract text from file
-    try:
-        extracted_text = extract_text_from_file(file_content, file_extension)
-        print(f"Extracted text length: {len(extracted_text)} characters")
-        print(f"First 200 chars: {extracted_text[:200]}")
-    except Exception as e:
-        print(f"Text extraction error: {e}")
-        raise HTTPException(status_code=400, detail=f"Error processing file: {str(e)}")
-    
-    # Create material record in database
-    material = Material(
-        user_id=current_user['user_id'],
-        title=file.filename,
-        file_type=file_extension,
-        file_path=file_path,
-        file_size=len(file_content),
-        status="processing",
-        processing_progress=0
-    )
-    
-    db.add(material)
-    db.commit()
-    db.refresh(material)
-    
-    # Process text for RAG (chunk and create embeddings)
-    try:
-        chunks = chunk_text(extracted_text)
-        
-        # Create vector index entries for each chunk
-        for i, chunk in enumerate(chunks):
-            try:
-                embedding = generate_embeddings(chunk)
-                
-                vector_entry = VectorIndexEntry(
-                    user_id=current_user['user_id'],
-                    content_hash=f"{file_id}_{i}",
-                    embedding=embedding,
-                    content=chunk,
-                    token_count=len(chunk.split()),  # Approximate token count
-                    chunk_index=i,
-                    source_type="material",
-                    source_id=material.id,
-                    embedding_model="text-embedding-3-small",
-                    vector_metadata={
-                        "file_name": file.filename,
-                        "chunk_index": i,
-                        "total_chunks": len(chunks),
-                        "file_type": file_extension,
-                        "file_size": len(file_content)
-                    }
-                )
-                
-                db.add(vector_entry)
-                
-            except Exception as e:
-                error_msg = str(e)
-                print(f"Error creating embedding for chunk {i}: {error_msg}")
-                # Log specific error types for debugging
-                if "403" in error_msg:
-                    print(f"⚠️  OpenAI API 403 error for chunk {i}. This chunk will be skipped. Check your API key permissions/quota.")
-                elif "401" in error_msg:
-                    print(f"⚠️  OpenAI API 401 error for chunk {i}. Invalid API key. Please check your OPENAI_API_KEY.")
-                continue
-        
-        db.commit()
-        
-        # Update material status
-        material.status = "processed"
-        material.processing_progress = 100
-        material.chunk_count = len(chunks)
-        material.total_tokens = sum(len(chunk.split()) for chunk in chunks)
-        material.extracted_text = extracted_text
-        material.processed_at = func.now()
-        db.commit()
-        
-        # Cache the extracted text
-        cache_text(material.id, extracted_text)
-        
-        return {
-            "success": True,
-            "material_id": material.id,
-            "file_name": file.filename,
-            "file_type": file_extension,
-            "chunks_created": len(chunks),
-            "text_length": len(extracted_text),
-            "file_path": file_path,
-            "message": f"File processed successfully. Created {len(chunks)} chunks for RAG."
-        }
-        
-    except Exception as e:
-        # Update material status to failed
-        material.status = "failed"
-        material.processing_error = str(e)
-        db.commit()
-        raise HTTPException(status_code=500, detail=f"Error processing file for RAG: {str(e)}")
-
-@app.post("/api/admin/upload-system-material")
-async def upload_system_material(
-    file: UploadFile = File(...),
-    x_admin_key: Optional[str] = Header(None, alias="X-Admin-Key"),
-    db: Session = Depends(get_db)
-):
-    """Admin endpoint to upload system materials accessible to all users"""
-    
-    # Optional: Check admin key (set ADMIN_API_KEY in environment)
-    admin_api_key = os.getenv("ADMIN_API_KEY")
-    if admin_api_key:
-        if not x_admin_key or x_admin_key != admin_api_key:
-            raise HTTPException(status_code=403, detail="Invalid admin key")
-    
-    # Validate file type
-    allowed_types = ["pdf", "docx", "doc", "txt"]
-    file_extension = file.filename.split('.')[-1].lower() if '.' in file.filename else ""
-    
-    if file_extension not in allowed_types:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Unsupported file type. Allowed: {', '.join(allowed_types)}"
-        )
-    
-    # Read file content
-    try:
-        file_content = await file.read()
+        file_content = file.file.read()  # Sync handler: runs on the threadpool
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error reading file: {str(e)}")
     
@@ -2050,684 +1917,513 @@ async def upload_system_material(
             bg_material.status = "processed"
             bg_material.processing_progress = 100
             bg_material.chunk_count = successful_chunks
-            bg_material.total_tokens = sum(len(chunk.split()) for chunk in chunks)
-            bg_material.extracted_text = extracted_text
-            bg_material.processed_at = func.now()
-            background_db.commit()
-            
-            # Cache the extracted text
-            cache_text(bg_material.id, extracted_text)
-            
-            print(f"✓ Successfully processed system material: {file.filename} ({successful_chunks} chunks)")
-            
-        except Exception as e:
-            # Update material status to failed
-            try:
-                bg_material = background_db.query(Material).filter(Material.id == material.id).first()
-                if bg_material:
-                    bg_material.status = "failed"
-                    bg_material.processing_error = str(e)
-                    background_db.commit()
-            except:
-                pass
-            print(f"✗ Error processing system material {file.filename}: {str(e)}")
-        finally:
-            background_db.close()
-    
-    # Start background processing in a separate thread (fire and forget)
-    thread = threading.Thread(target=process_material_background, daemon=True)
-    thread.start()
-    
-    # Return immediately with processing status
-    return {
-        "success": True,
-        "material_id": material.id,
-        "file_name": file.filename,
-        "file_type": file_extension,
-        "file_size": len(file_content),
-        "file_path": file_path,
-        "status": "processing",
-        "message": f"System material uploaded successfully. Processing in background. Check status later."
-    }
-
-@app.get("/api/materials")
-def get_user_materials(
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Get all materials uploaded by the current user"""
-    
-    materials = db.query(Material).filter(
-        Material.user_id == current_user['user_id']
-    ).order_by(Material.uploaded_at.desc()).all()
-    
-    result_materials = []
-    for material in materials:
-        # Try to get from cache first
-        cached_text = get_cached_text(material.id)
-        
-        # If not in cache, use database value and cache it
-        extracted_text = cached_text if cached_text is not None else material.extracted_text
-        
-        # Cache the text if it wasn't cached and exists
-        if cached_text is None and extracted_text:
-            cache_text(material.id, extracted_text)
-        
-        result_materials.append({
-            "id": material.id,
-            "title": material.title,
-            "file_type": material.file_type,
-            "file_path": material.file_path,
-            "file_size": material.file_size,
-            "status": material.status,
-            "processing_progress": material.processing_progress,
-            "processing_error": material.processing_error,
-            "extracted_text": extracted_text,
-            "chunk_count": material.chunk_count,
-            "total_tokens": material.total_tokens,
-            "embedding_model": material.embedding_model,
-            "uploaded_at": material.uploaded_at.isoformat(),
-            "processed_at": material.processed_at.isoformat() if material.processed_at else None,
-            "last_accessed": material.last_accessed.isoformat() if material.last_accessed else None
-        })
-    
-    return {
-        "materials": result_materials
-    }
-
-@app.delete("/api/materials/{material_id}")
-def delete_material(
-    material_id: int,
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Delete a material and its associated vector entries"""
-    
-    # Find the material
-    material = db.query(Material).filter(
-        Material.id == material_id,
-        Material.user_id == current_user['user_id']
-    ).first()
-    
-    if not material:
-        raise HTTPException(status_code=404, detail="Material not found")
-    
-    # Invalidate caches before deleting
-    invalidate_cache(material_id)
-    invalidate_vector_cache(material_id)
-    
-    # Delete associated vector entries
-    vector_entries = db.query(VectorIndexEntry).filter(
-        VectorIndexEntry.source_id == material_id,
-        VectorIndexEntry.source_type == "material"
-    ).all()
-    
-    for entry in vector_entries:
-        db.delete(entry)
-    
-    # Delete the material
-    db.delete(material)
-    db.commit()
-    
-    return {"success": True, "message": "Material deleted successfully"}
-
-@app.get("/api/search")
-def search_materials(
-    query: str,
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    limit: int = 5
-):
-    """Search through user's materials and system materials using vector similarity"""
-    
-    if not client:
-        raise HTTPException(status_code=503, detail="OpenAI client not configured")
-    
-    try:
-        # Generate embedding for the query
-        query_embedding = generate_embeddings(query)
-        
-        # Get user's materials AND system materials (accessible to all users)
-        user_materials = db.query(Material).filter(
-            or_(
-                Material.user_id == current_user['user_id'],
-                Material.user_id == SYSTEM_USER_ID
-            ),
-            Material.status == "processed"
-        ).all()
-        
-        material_ids = [m.id for m in user_materials]
-        
-        if not material_ids:
-            return {"results": [], "message": "No processed materials found"}
-        
-        # Get vector entries for user's materials and system materials
-        vector_entries = db.query(VectorIndexEntry).filter(
-            VectorIndexEntry.source_id.in_(material_ids),
-            VectorIndexEntry.source_type == "material",
-            or_(
-                VectorIndexEntry.user_id == current_user['user_id'],
-                VectorIndexEntry.user_id == SYSTEM_USER_ID
-            )
-        ).all()
-        
-        # Calculate similarity scores (simplified cosine similarity)
-        results = []
-        for entry in vector_entries:
-            # Simple dot product for similarity (in production, use proper cosine similarity)
-            similarity = sum(a * b for a, b in zip(query_embedding, entry.embedding))
-            results.append({
-                "content": entry.content,
-                "similarity": similarity,
-                "metadata": entry.vector_metadata,
-                "source_id": entry.source_id,
-                "is_system": entry.user_id == SYSTEM_USER_ID
-            })
-        
-        # Sort by similarity and return top results
-        results.sort(key=lambda x: x["similarity"], reverse=True)
-        
-        return {
-            "results": results[:limit],
-            "query": query,
-            "total_found": len(results)
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Search error: {str(e)}")
-
-@app.post("/chat-rag", response_model=ChatOut)
-def chat_with_rag(payload: ChatIn, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Enhanced chat endpoint with RAG integration - searches user's materials for relevant context"""
-    if not client:
-        raise HTTPException(status_code=503, detail="OpenAI client not configured")
-    
-    # Create or reuse a thread
-    thread_id = payload.thread_id or str(uuid4())
-    
-    # RAG: Search user's materials AND system materials for relevant context
-    relevant_context = ""
-    try:
-        # Generate embedding for the user's question
-        query_embedding = generate_embeddings(payload.message)
-        
-        # Get user's processed materials AND system materials (accessible to all users)
-        user_materials = db.query(Material).filter(
-            or_(
-                Material.user_id == current_user['user_id'],
-                Material.user_id == SYSTEM_USER_ID
-            ),
-            Material.status == "processed"
-        ).all()
-        
-        if user_materials:
-            material_ids = [m.id for m in user_materials]
+            bg_material.total_tokens = sum(len(chunk.split()) for chunk in chunks)
+            bg_material.processed_at = func.now()
+            store_material_text(background_db, bg_material.id, extracted_text)
+            background_db.commit()
             
-            # Get vector entries for user's materials and system materials
-            vector_entries = db.query(VectorIndexEntry).filter(
-                VectorIndexEntry.source_id.in_(material_ids),
-                VectorIndexEntry.source_type == "material",
-                or_(
-                    VectorIndexEntry.user_id == current_user['user_id'],
-                    VectorIndexEntry.user_id == SYSTEM_USER_ID
-                )
-            ).all()
+            # Cache the extracted text
+            cache_text(bg_material.id, extracted_text)
             
-            # Calculate similarity scores and get top results
-            results = []
-            for entry in vector_entries:
-                similarity = sum(a * b for a, b in zip(query_embedding, entry.embedding))
-                results.append({
-                    "content": entry.content,
-                    "similarity": similarity,
-                    "metadata": entry.vector_metadata,
-                    "is_system": entry.user_id == SYSTEM_USER_ID
-                })
+            # Publish a new shared corpus generation so every worker maps the new material
+            schedule_shared_corpus_rebuild(SYSTEM_USER_ID)
             
-            # Sort by similarity and get top 5 most relevant chunks (increased from 3 to include system materials)
-            results.sort(key=lambda x: x["similarity"], reverse=True)
-            top_results = results[:5]
+            print(f"✓ Successfully processed system material: {file.filename} ({successful_chunks} chunks)")
             
-            if top_results:
-                relevant_context = "\n\nRelevant information from available materials:\n"
-                for i, result in enumerate(top_results, 1):
-                    file_name = result["metadata"].get("file_name", "Unknown")
-                    source_label = "System Textbook" if result.get("is_system") else "Your Upload"
-                    relevant_context += f"\n{i}. From {file_name} ({source_label}):\n{result['content'][:500]}...\n"
-                
-                # Update access tracking (only for user's materials, not system materials)
-                for entry in vector_entries:
-                    if entry.user_id != SYSTEM_USER_ID and any(entry.content == result["content"] for result in top_results):
-                        entry.last_accessed = func.now()
-                        entry.access_count += 1
-                db.commit()
-    
-    except Exception as e:
-        error_msg = str(e)
-        print(f"RAG search error: {error_msg}")
-        # Log more specific error information
-        if "403" in error_msg or "forbidden" in error_msg.lower():
-            print("⚠️  OpenAI API key issue detected (403). Chatbot will work without RAG context. Please check your API key configuration.")
-        elif "401" in error_msg or "invalid_api_key" in error_msg.lower():
-            print("⚠️  Invalid OpenAI API key detected. Chatbot will work without RAG context. Please update your OPENAI_API_KEY in .env file.")
-        # Continue without RAG context if search fails - chatbot will still work
+        except Exception as e:
+            # Update material status to failed
+            try:
+                bg_material = background_db.query(Material).filter(Material.id == material.id).first()
+                if bg_material:
+                    bg_material.status = "failed"
+                    bg_material.processing_error = str(e)
+                    background_db.commit()
+            except:
+                pass
+            print(f"✗ Error processing system material {file.filename}: {str(e)}")
+        finally:
+            background_db.close()
     
-    # Build messages with RAG context
-    system_prompt = f"""You are a helpful AI assistant for Clyvara, a medical education platform. You can answer questions about medical topics, general knowledge, current events, and provide practical information.
-
-{relevant_context}
-
-When referencing information from uploaded materials, mention the source file name. Be helpful and informative in your responses."""
+    # Start background processing in a separate thread (fire and forget)
+    thread = threading.Thread(target=process_material_background, daemon=True)
+    thread.start()
     
-    messages = [
-        {"role": "system", "content": system_prompt}
-    ]
-
-    messages.append({"role": "user", "content": payload.message})
-
-    try:
-        # Use the correct OpenAI model
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            max_tokens=500
-        )
-        
-        reply = response.choices[0].message.content
-        
-        # Store the chat message in database
-        try:
-            # First create a user session if it doesn't exist
-            existing_session = db.query(UserSession).filter(UserSession.session_id == thread_id).first()
-            if not existing_session:
-                user_session = UserSession(
-                    session_id=thread_id,
-                    user_id=current_user['user_id'],
-                    is_active=True
-                )
-                db.add(user_session)
-                db.commit()
-            
-            # Store the chat message
-            chat_message = ChatMessage(
-                session_id=thread_id,
-                message_type="user",
-                message_content={"message": payload.message},
-                user_id=current_user['user_id'],
-                response_time_ms=100,  # Placeholder
-                message_length=len(payload.message)
-            )
-            
-            db.add(chat_message)
-            db.commit()
-            
-        except Exception as db_error:
-            # Log the error but don't fail the chat
-            print(f"Database storage error: {db_error}")
-        
-        return ChatOut(reply=reply, thread_id=thread_id)
-        
-    except Exception as e:
-        error_msg = str(e)
-        # Provide more specific error messages for common OpenAI API issues
-        if "401" in error_msg or "invalid_api_key" in error_msg.lower():
-            raise HTTPException(
-                status_code=500,
-                detail="Chat error: Invalid OpenAI API key. Please check your OPENAI_API_KEY in the .env file."
-            )
-        elif "403" in error_msg or "forbidden" in error_msg.lower():
-            raise HTTPException(
-                status_code=500,
-                detail="Chat error: API key access denied (403). This may be due to insufficient quota, expired key, or restricted permissions. Please check your OpenAI account."
-            )
-        elif "429" in error_msg or "rate limit" in error_msg.lower():
-            raise HTTPException(
-                status_code=500,
-                detail="Chat error: Rate limit exceeded. Please wait a moment and try again."
-            )
-        else:
-            raise HTTPException(status_code=500, detail=f"Chat error: {error_msg}")
+    # Return immediately with processing status
+    return {
+        "success": True,
+        "material_id": material.id,
+        "file_name": file.filename,
+        "file_type": file_extension,
+        "file_size": len(file_content),
+        "file_path": file_path,
+        "status": "processing",
+        "message": f"System material uploaded successfully. Processing in background. Check status later."
+    }
 
-# Care Plan API Endpoints
-@app.post("/api/care-plans")
-async def create_care_plan(
-    care_plan_data: dict,
+@app.get("/api/materials")
+def get_user_materials(
+    cursor: Optional[str] = None,
+    limit: int = 20,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    """Create a new care plan"""
-    try:
-        # Create care plan record
-        care_plan = CarePlan(
-            user_id=current_user['user_id'],
-            title=care_plan_data.get('title', 'Untitled Care Plan'),
-            patient_name=care_plan_data.get('patient_name'),
-            procedure=care_plan_data.get('procedure'),
-            diagnosis=care_plan_data.get('diagnosis'),
-            
-            # Demographics
-            age=care_plan_data.get('age'),
-            sex=care_plan_data.get('sex'),
-            height=care_plan_data.get('height'),
-            weight=care_plan_data.get('weight'),
-            
-            # Vital Signs
-            temperature_f=care_plan_data.get('tempF'),
-            blood_pressure=care_plan_data.get('bp'),
-            heart_rate=care_plan_data.get('hr'),
-            respiration_rate=care_plan_data.get('rr'),
-            oxygen_saturation=care_plan_data.get('oxygen_saturation'),
-            lmp_date=care_plan_data.get('lmp_date'),
-            
-            # Medical History
-            past_medical_history=care_plan_data.get('pmh'),
-            past_surgical_history=care_plan_data.get('psh'),
-            anesthesia_history=care_plan_data.get('anesthesiaHx'),
-            current_medications=care_plan_data.get('meds'),
-            alcohol_use=care_plan_data.get('alcohol'),
-            substance_use=care_plan_data.get('substance'),
-            allergies=care_plan_data.get('allergies'),
-            
-            # Physical Assessment
-            neurological_findings=care_plan_data.get('neuro'),
-            heent_findings=care_plan_data.get('heent'),
-            respiratory_findings=care_plan_data.get('resp'),
-            cardiovascular_findings=care_plan_data.get('cardio'),
-            gastrointestinal_findings=care_plan_data.get('gi'),
-            genitourinary_findings=care_plan_data.get('gu'),
-            endocrine_findings=care_plan_data.get('endo'),
-            other_findings=care_plan_data.get('otherFindings'),
-            
-            # Airway Assessment
-            mallampati_class=care_plan_data.get('mallampati'),
-            ulbt_grade=care_plan_data.get('ulbt'),
-            thyromental_distance=care_plan_data.get('thyromental'),
-            interincisor_distance=care_plan_data.get('interincisor'),
-            dentition=care_plan_data.get('dentition'),
-            neck_assessment=care_plan_data.get('neck'),
-            oral_mucosa=care_plan_data.get('oralMucosa'),
-            
-            # Laboratory Values
-            sodium=care_plan_data.get('na'),
-            potassium=care_plan_data.get('k'),
-            chloride=care_plan_data.get('cl'),
-            co2=care_plan_data.get('co2'),
-            bun=care_plan_data.get('bun'),
-            creatinine=care_plan_data.get('cr'),
-            glucose=care_plan_data.get('glu'),
-            wbc=care_plan_data.get('wbc'),
-            hemoglobin=care_plan_data.get('hgb'),
-            hematocrit=care_plan_data.get('hct'),
-            platelets=care_plan_data.get('plt'),
-            pt=care_plan_data.get('pt'),
-            ptt=care_plan_data.get('ptt'),
-            inr=care_plan_data.get('inr'),
-            abg=care_plan_data.get('abg'),
-            other_labs=care_plan_data.get('otherLabs'),
-            
-            # Imaging/Diagnostic Tests
-            ekg=care_plan_data.get('ekg'),
-            chest_xray=care_plan_data.get('cxr'),
-            echocardiogram=care_plan_data.get('echo'),
-            other_imaging=care_plan_data.get('otherImaging'),
-            
-            # Cultural/Religious Considerations
-            cultural_religious_attributes=care_plan_data.get('cultural_religious_attributes'),
-            
-            # Generate export text for RAG indexing
-            exported_text=build_care_plan_text(care_plan_data),
-            export_hash=hash(str(care_plan_data))
-        )
-        
-        db.add(care_plan)
-        db.commit()
-        db.refresh(care_plan)
-        
-        # Index the care plan content for RAG
-        await index_care_plan_for_rag(care_plan, db)
-        
-        return {
-            "success": True,
-            "care_plan_id": care_plan.id,
-            "message": "Care plan created successfully"
-        }
-        
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error creating care plan: {str(e)}")
+    """Get materials uploaded by the current user (metadata only, cursor-paginated)"""
+    limit = clamp_limit(limit)
+    
+    query = db.query(Material, MaterialText.raw_size).outerjoin(
+        MaterialText, MaterialText.material_id == Material.id
+    ).filter(
+        Material.user_id == current_user['user_id']
+    )
+    
+    rows = paginate(query, Material.uploaded_at, Material.id, cursor, limit).all()
+    rows, next_cursor, has_more = page_result(rows, limit, lambda row: (row[0].uploaded_at, row[0].id))
+    
+    result_materials = []
+    for material, text_size in rows:
+        result_materials.append({
+            "id": material.id,
+            "title": material.title,
+            "file_type": material.file_type,
+            "file_path": material.file_path,
+            "file_size": material.file_size,
+            "status": material.status,
+            "processing_progress": material.processing_progress,
+            "processing_error": material.processing_error,
+            "text_size": text_size,
+            "chunk_count": material.chunk_count,
+            "total_tokens": material.total_tokens,
+            "embedding_model": material.embedding_model,
+            "uploaded_at": material.uploaded_at.isoformat(),
+            "processed_at": material.processed_at.isoformat() if material.processed_at else None,
+            "last_accessed": material.last_accessed.isoformat() if material.last_accessed else None
+        })
+    
+    return {
+        "materials": result_materials,
+        "next_cursor": next_cursor,
+        "has_more": has_more
+    }
 
-@app.get("/api/care-plans")
-async def get_care_plans(
+@app.get("/api/materials/{material_id}/text")
+def get_material_text(
+    material_id: int,
+    start: int = 0,
+    length: int = 65536,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    """Get all care plans for the current user"""
-    try:
-        care_plans = db.query(CarePlan).filter(
-            CarePlan.user_id == current_user['user_id']
-        ).order_by(CarePlan.created_at.desc()).all()
-        
-        return {
-            "success": True,
-            "care_plans": [
-                {
-                    "id": cp.id,
-                    "title": cp.title,
-                    "patient_name": cp.patient_name,
-                    "procedure": cp.procedure,
-                    "diagnosis": cp.diagnosis,
-                    "status": cp.status,
-                    "created_at": cp.created_at.isoformat() if cp.created_at else None,
-                    "updated_at": cp.updated_at.isoformat() if cp.updated_at else None
-                }
-                for cp in care_plans
-            ]
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching care plans: {str(e)}")
+    """Read a byte range of a material's extracted text (served from the cache)"""
+    if start < 0 or length <= 0:
+        raise HTTPException(status_code=400, detail="start must be >= 0 and length must be > 0")
+    length = min(length, 1024 * 1024)
+    
+    # The user's own materials and system materials are readable
+    material = db.query(Material.id).filter(
+        Material.id == material_id,
+        or_(
+            Material.user_id == current_user['user_id'],
+            Material.user_id == SYSTEM_USER_ID
+        )
+    ).first()
+    
+    if not material:
+        raise HTTPException(status_code=404, detail="Material not found")
+    
+    text_range = load_material_text_range(db, material_id, start, length)
+    if text_range is None:
+        return {
+            "material_id": material_id,
+            "text": "",
+            "start": 0,
+            "end": 0,
+            "total_bytes": 0,
+            "has_more": False,
+            "next_start": None
+        }
+    
+    has_more = text_range["end"] < text_range["total_bytes"]
+    return {
+        "material_id": material_id,
+        "text": text_range["text"],
+        "start": text_range["start"],
+        "end": text_range["end"],
+        "total_bytes": text_range["total_bytes"],
+        "has_more": has_more,
+        "next_start": text_range["end"] if has_more else None
+    }
 
-@app.get("/api/care-plans/{care_plan_id}")
-async def get_care_plan(
-    care_plan_id: int,
+@app.delete("/api/materials/{material_id}")
+def delete_material(
+    material_id: int,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get a specific care plan by ID"""
-    try:
-        care_plan = db.query(CarePlan).filter(
-            CarePlan.id == care_plan_id,
-            CarePlan.user_id == current_user['user_id']
-        ).first()
-        
-        if not care_plan:
-            raise HTTPException(status_code=404, detail="Care plan not found")
-        
-        # Update last accessed
-        care_plan.last_accessed = func.now()
-        db.commit()
-        
-        return {
-            "success": True,
-            "care_plan": {
-                "id": care_plan.id,
-                "title": care_plan.title,
-                "patient_name": care_plan.patient_name,
-                "procedure": care_plan.procedure,
-                "diagnosis": care_plan.diagnosis,
-                
-                # Demographics
-                "age": care_plan.age,
-                "sex": care_plan.sex,
-                "height": care_plan.height,
-                "weight": care_plan.weight,
-                
-                # Vital Signs
-                "tempF": care_plan.temperature_f,
-                "bp": care_plan.blood_pressure,
-                "hr": care_plan.heart_rate,
-                "rr": care_plan.respiration_rate,
-                "oxygen_saturation": care_plan.oxygen_saturation,
-                "lmp_date": care_plan.lmp_date,
-                
-                # Medical History
-                "pmh": care_plan.past_medical_history,
-                "psh": care_plan.past_surgical_history,
-                "anesthesiaHx": care_plan.anesthesia_history,
-                "meds": care_plan.current_medications,
-                "alcohol": care_plan.alcohol_use,
-                "substance": care_plan.substance_use,
-                "allergies": care_plan.allergies,
-                
-                # Physical Assessment
-                "neuro": care_plan.neurological_findings,
-                "heent": care_plan.heent_findings,
-                "resp": care_plan.respiratory_findings,
-                "cardio": care_plan.cardiovascular_findings,
-                "gi": care_plan.gastrointestinal_findings,
-                "gu": care_plan.genitourinary_findings,
-                "endo": care_plan.endocrine_findings,
-                "otherFindings": care_plan.other_findings,
-                
-                # Airway Assessment
-                "mallampati": care_plan.mallampati_class,
-                "ulbt": care_plan.ulbt_grade,
-                "thyromental": care_plan.thyromental_distance,
-                "interincisor": care_plan.interincisor_distance,
-                "dentition": care_plan.dentition,
-                "neck": care_plan.neck_assessment,
-                "oralMucosa": care_plan.oral_mucosa,
-                
-                # Laboratory Values
-                "na": care_plan.sodium,
-                "k": care_plan.potassium,
-                "cl": care_plan.chloride,
-                "co2": care_plan.co2,
-                "bun": care_plan.bun,
-                "cr": care_plan.creatinine,
-                "glu": care_plan.glucose,
-                "wbc": care_plan.wbc,
-                "hgb": care_plan.hemoglobin,
-                "hct": care_plan.hematocrit,
-                "plt": care_plan.platelets,
-                "pt": care_plan.pt,
-                "ptt": care_plan.ptt,
-                "inr": care_plan.inr,
-                "abg": care_plan.abg,
-                "otherLabs": care_plan.other_labs,
-                
-                # Imaging/Diagnostic Tests
-                "ekg": care_plan.ekg,
-                "cxr": care_plan.chest_xray,
-                "echo": care_plan.echocardiogram,
-                "otherImaging": care_plan.other_imaging,
-                
-                # Cultural/Religious Considerations
-                "cultural_religious_attributes": care_plan.cultural_religious_attributes,
-                
-                # AI-Generated Content
-                "ai_recommendations": care_plan.ai_recommendations,
-                "risk_assessment": care_plan.risk_assessment,
-                "monitoring_plan": care_plan.monitoring_plan,
-                "medication_plan": care_plan.medication_plan,
-                
-                # Metadata
-                "status": care_plan.status,
-                "version": care_plan.version,
-                "created_at": care_plan.created_at.isoformat() if care_plan.created_at else None,
-                "updated_at": care_plan.updated_at.isoformat() if care_plan.updated_at else None
-            }
-        }
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching care plan: {str(e)}")
+    """Delete a material and its associated vector entries"""
+    
+    # Find the material
+    material = db.query(Material).filter(
+        Material.id == material_id,
+        Material.user_id == current_user['user_id']
+    ).first()
+    
+    if not material:
+        raise HTTPException(status_code=404, detail="Material not found")
+    
+    # Invalidate caches and drop the stored text before deleting
+    delete_material_text(db, material_id)
+    invalidate_vector_cache(material_id)
+    
+    # Delete associated vector entries
+    vector_entries = db.query(VectorIndexEntry).filter(
+        VectorIndexEntry.source_id == material_id,
+        VectorIndexEntry.source_type == "material"
+    ).all()
+    
+    for entry in vector_entries:
+        db.delete(entry)
+    
+    # Delete the material
+    db.delete(material)
+    db.commit()
+    forget_material_on_chat_connections(material_id)
+    
+    return {"success": True, "message": "Material deleted successfully"}
 
-@app.post("/api/care-plans/{care_plan_id}/generate-ai")
-async def generate_ai_recommendations(
-    care_plan_id: int,
+@app.get("/api/search")
+def search_materials(
+    query: str,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db),
+    limit: int = 5
 ):
-    """Generate AI recommendations for a care plan using RAG"""
+    """Search through user's materials and system materials using vector similarity"""
+    
+    if not client:
+        raise HTTPException(status_code=503, detail="OpenAI client not configured")
+    
     try:
-        care_plan = db.query(CarePlan).filter(
-            CarePlan.id == care_plan_id,
-            CarePlan.user_id == current_user['user_id']
-        ).first()
-        
-        if not care_plan:
-            raise HTTPException(status_code=404, detail="Care plan not found")
+        # Generate embedding for the query
+        query_embedding = generate_embeddings(query)
         
-        if not client:
-            raise HTTPException(status_code=503, detail="OpenAI client not configured")
+        # Get user's materials AND system materials (accessible to all users)
+        user_materials = db.query(Material.id, Material.processed_at, Material.chunk_count).filter(
+            or_(
+                Material.user_id == current_user['user_id'],
+                Material.user_id == SYSTEM_USER_ID
+            ),
+            Material.status == "processed"
+        ).all()
         
-        # Build context for AI generation
-        context = build_care_plan_context(care_plan, db)
+        if not user_materials:
+            return {"results": [], "message": "No processed materials found"}
         
-        # Generate AI recommendations
-        recommendations = await generate_care_plan_recommendations(context, client)
+        # Get vector entries for user's materials and system materials (served from the vector cache)
+        vector_blocks = load_vector_blocks(db, user_materials)
         
-        # Update care plan with AI recommendations
-        care_plan.ai_recommendations = recommendations.get('anesthesia_plan', '')
-        care_plan.risk_assessment = recommendations.get('risk_assessment', '')
-        care_plan.monitoring_plan = recommendations.get('monitoring_plan', '')
-        care_plan.medication_plan = recommendations.get('medication_plan', '')
-        care_plan.rag_context = context
-        care_plan.rag_sources = recommendations.get('sources', [])
-        care_plan.rag_confidence_score = recommendations.get('confidence_score', 0.0)
-        care_plan.updated_at = func.now()
+        # Calculate similarity scores (simplified cosine similarity)
+        results = []
+        for block in vector_blocks:
+            # Simple dot product for similarity (in production, use proper cosine similarity)
+            for i, similarity in enumerate(block.dot_scores(query_embedding)):
+                results.append({
+                    "content": block.contents[i],
+                    "similarity": similarity,
+                    "metadata": block.metadata[i],
+                    "source_id": block.material_id,
+                    "is_system": block.user_id == SYSTEM_USER_ID
+                })
         
-        db.commit()
+        # Sort by similarity and return top results
+        results.sort(key=lambda x: x["similarity"], reverse=True)
         
         return {
-            "success": True,
-            "recommendations": recommendations,
-            "message": "AI recommendations generated successfully"
+            "results": results[:limit],
+            "query": query,
+            "total_found": len(results)
         }
         
-    except HTTPException:
-        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating AI recommendations: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Search error: {str(e)}")
+
+def user_materials_for_retrieval(user_id: str, db: Session) -> list:
+    """(id, processed_at, chunk_count) of the user's processed materials AND system materials"""
+    return db.query(Material.id, Material.processed_at, Material.chunk_count).filter(
+        or_(
+            Material.user_id == user_id,
+            Material.user_id == SYSTEM_USER_ID
+        ),
+        Material.status == "processed"
+    ).all()
+
+def load_user_vector_blocks(user_id: str, db: Session) -> list:
+    """VectorBlocks of the user's processed materials AND system materials (accessible to all users)"""
+    user_materials = user_materials_for_retrieval(user_id, db)
+    if not user_materials:
+        return []
+    # Served from the vector cache
+    return load_vector_blocks(db, user_materials)
+
+def rag_context_from_blocks(query_embedding: List[float], vector_blocks: list) -> str:
+    """The most relevant chunks of vector_blocks formatted for the system prompt ("" if none)"""
+    # Calculate similarity scores and get top results
+    results = []
+    for block in vector_blocks:
+        for i, similarity in enumerate(block.dot_scores(query_embedding)):
+            results.append({
+                "id": block.ids[i],
+                "content": block.contents[i],
+                "similarity": similarity,
+                "metadata": block.metadata[i],
+                "is_system": block.user_id == SYSTEM_USER_ID
+            })
+    
+    # Sort by similarity and get top 5 most relevant chunks (increased from 3 to include system materials)
+    results.sort(key=lambda x: x["similarity"], reverse=True)
+    top_results = results[:5]
+    if not top_results:
+        return ""
+    
+    relevant_context = "\n\nRelevant information from available materials:\n"
+    for i, result in enumerate(top_results, 1):
+        file_name = result["metadata"].get("file_name", "Unknown")
+        source_label = "System Textbook" if result.get("is_system") else "Your Upload"
+        relevant_context += f"\n{i}. From {file_name} ({source_label}):\n{result['content'][:500]}...\n"
+    
+    # Update access tracking (only for user's materials, not system materials)
+    accessed_ids = [result["id"] for result in top_results if not result["is_system"]]
+    chat_writer.enqueue_access(accessed_ids)
+    return relevant_context
+
+def retrieve_rag_context(message: str, user_id: str, db: Session = None, vector_blocks: list = None) -> str:
+    """
+    Search the user's materials and system materials for context relevant to message ("" if none).
+    Pass vector_blocks to search an already loaded set instead of querying with db.
+    """
+    try:
+        # Generate embedding for the user's question
+        query_embedding = generate_embeddings(message)
+        if vector_blocks is None:
+            vector_blocks = load_user_vector_blocks(user_id, db)
+        return rag_context_from_blocks(query_embedding, vector_blocks)
+    
+    except Exception as e:
+        error_msg = str(e)
+        print(f"RAG search error: {error_msg}")
+        # Log more specific error information
+        if "403" in error_msg or "forbidden" in error_msg.lower():
+            print("⚠️  OpenAI API key issue detected (403). Chatbot will work without RAG context. Please check your API key configuration.")
+        elif "401" in error_msg or "invalid_api_key" in error_msg.lower():
+            print("⚠️  Invalid OpenAI API key detected. Chatbot will work without RAG context. Please update your OPENAI_API_KEY in .env file.")
+        # Continue without RAG context if search fails - chatbot will still work
+        return ""
+
+def build_rag_messages(message: str, relevant_context: str) -> List[Dict[str, str]]:
+    """System prompt with the retrieved context, followed by the user's message"""
+    system_prompt = f"""You are a helpful AI assistant for Clyvara, a medical education platform. You can answer questions about medical topics, general knowledge, current events, and provide practical information.
+
+{relevant_context}
+
+When referencing information from uploaded materials, mention the source file name. Be helpful and informative in your responses."""
+    
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": message}
+    ]
+
+def chat_error_detail(error_msg: str) -> str:
+    """User-facing message for an OpenAI API error"""
+    # Provide more specific error messages for common OpenAI API issues
+    if "401" in error_msg or "invalid_api_key" in error_msg.lower():
+        return "Chat error: Invalid OpenAI API key. Please check your OPENAI_API_KEY in the .env file."
+    elif "403" in error_msg or "forbidden" in error_msg.lower():
+        return "Chat error: API key access denied (403). This may be due to insufficient quota, expired key, or restricted permissions. Please check your OpenAI account."
+    elif "429" in error_msg or "rate limit" in error_msg.lower():
+        return "Chat error: Rate limit exceeded. Please wait a moment and try again."
+    return f"Chat error: {error_msg}"
+
+@app.post("/chat-rag", response_model=ChatOut)
+def chat_with_rag(payload: ChatIn, current_user: dict = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    """Enhanced chat endpoint with RAG integration - searches user's materials for relevant context"""
+    if not client:
+        raise HTTPException(status_code=503, detail="OpenAI client not configured")
+    
+    started = time.perf_counter()
+    
+    # Create or reuse a thread
+    thread_id = payload.thread_id or str(uuid4())
+    
+    # RAG: Search user's materials AND system materials for relevant context
+    relevant_context = retrieve_rag_context(payload.message, current_user['user_id'], db)
+    
+    # Build messages with RAG context and the thread's history
+    messages = build_rag_messages(payload.message, relevant_context)
+    messages = with_thread_history(messages, current_user['user_id'], thread_id, new=not payload.thread_id)
 
-@app.delete("/api/care-plans/{care_plan_id}")
-async def delete_care_plan(
-    care_plan_id: int,
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Delete a care plan"""
     try:
-        care_plan = db.query(CarePlan).filter(
-            CarePlan.id == care_plan_id,
-            CarePlan.user_id == current_user['user_id']
-        ).first()
-        
-        if not care_plan:
-            raise HTTPException(status_code=404, detail="Care plan not found")
+        response = client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=messages,
+            max_tokens=CHAT_MAX_TOKENS
+        )
         
-        # Delete associated RAG entries
-        db.query(VectorIndexEntry).filter(
-            VectorIndexEntry.source_id == care_plan_id,
-            VectorIndexEntry.source_type == "care_plan"
-        ).delete()
+        reply = response.choices[0].message.content
         
-        # Delete care plan
-        db.delete(care_plan)
-        db.commit()
+        # Store the turn (write-behind: the session upsert and inserts happen off the request path)
+        persist_chat_turn(thread_id, current_user['user_id'], payload.message, reply,
+                          int((time.perf_counter() - started) * 1000))
         
-        return {
-            "success": True,
-            "message": "Care plan deleted successfully"
-        }
+        return ChatOut(reply=reply, thread_id=thread_id)
         
-    except HTTPException:
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=chat_error_detail(str(e)))
+
+@app.post("/chat-rag/stream")
+def chat_with_rag_stream(payload: ChatIn, current_user: dict = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    """/chat-rag streamed as server-sent events; retrieval completes before the first byte"""
+    if not client:
+        raise HTTPException(status_code=503, detail="OpenAI client not configured")
+    
+    started = time.perf_counter()
+    thread_id = payload.thread_id or str(uuid4())
+    relevant_context = retrieve_rag_context(payload.message, current_user['user_id'], db)
+    messages = build_rag_messages(payload.message, relevant_context)
+    messages = with_thread_history(messages, current_user['user_id'], thread_id, new=not payload.thread_id)
+    return chat_event_stream(messages, thread_id, current_user['user_id'], payload.message, started)
+
+# Open chat WebSockets of this worker, so a deleted material leaves them at once
+_chat_connections: "weakref.WeakSet[ChatConnection]" = weakref.WeakSet()
+
+class ChatConnection:
+    """
+    State of one chat WebSocket: the user it authenticated as and which materials
+    (id and vector version) they can retrieve from, so a turn skips the materials query.
+    The blocks themselves come from load_vector_blocks on every turn, so they stay
+    within the vector cache budget. The material list is reloaded after
+    CHAT_WS_MATERIALS_TTL_SECONDS to pick up new uploads.
+    """
+
+    def __init__(self, user: dict, last_write: Optional[float] = None):
+        self.user_id = user["user_id"]
+        self.last_write = last_write  # From the handshake's read-your-writes cookie
+        self._materials = None
+        self._loaded_at = 0.0
+        _chat_connections.add(self)
+
+    def _load_vector_blocks(self, reload: bool) -> list:
+        sessions = get_read_db_for(self.last_write)
+        db = next(sessions)
+        try:
+            if reload:
+                self._materials = user_materials_for_retrieval(self.user_id, db)
+                self._loaded_at = time.monotonic()
+            if not self._materials:
+                return []
+            # Served from the vector cache; only evicted or reprocessed materials hit the database
+            return load_vector_blocks(db, self._materials)
+        finally:
+            sessions.close()
+
+    async def get_vector_blocks(self) -> list:
+        reload = self._materials is None or time.monotonic() - self._loaded_at > CHAT_WS_MATERIALS_TTL_SECONDS
+        return await run_in_threadpool(self._load_vector_blocks, reload)
+
+    def forget_material(self, material_id: int):
+        materials = self._materials
+        if materials:
+            self._materials = [m for m in materials if m.id != material_id]
+
+def forget_material_on_chat_connections(material_id: int):
+    """Stop retrieving a deleted material on this worker's open chat WebSockets"""
+    for connection in list(_chat_connections):
+        connection.forget_material(material_id)
+
+async def _chat_websocket_turn(websocket: WebSocket, connection: ChatConnection, data: dict):
+    started = time.perf_counter()
+    message = str(data["message"])
+    thread_id = data.get("thread_id") or str(uuid4())
+    try:
+        vector_blocks = await connection.get_vector_blocks()
+    except Exception as e:
+        print(f"RAG search error: {e}")
+        vector_blocks = []
+    try:
+        relevant_context = await run_in_threadpool(retrieve_rag_context, message, connection.user_id, None, vector_blocks)
+        messages = await run_in_threadpool(with_thread_history, build_rag_messages(message, relevant_context),
+                                           connection.user_id, thread_id, not data.get("thread_id"))
+    except Exception as e:
+        # Nothing was sent for this turn yet; report it and keep the connection for the next one
+        print(f"Chat turn setup error: {e}")
+        await websocket.send_json({"type": "error", "detail": chat_error_detail(str(e))})
+        return
+
+    await websocket.send_json({"type": "meta", "thread_id": thread_id})
+    ttft_ms = None
+    failed = False
+    parts = []
+    deltas = stream_chat_completion(messages)
+    try:
+        async for delta in iterate_in_threadpool(deltas):
+            if ttft_ms is None:
+                ttft_ms = _record_ttft(started)
+            parts.append(delta)
+            await websocket.send_json({"type": "token", "content": delta})
+        await websocket.send_json({
+            "type": "done",
+            "thread_id": thread_id,
+            "ttft_ms": ttft_ms,
+            "total_ms": int((time.perf_counter() - started) * 1000)
+        })
+    except WebSocketDisconnect:
         raise
     except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error deleting care plan: {str(e)}")
+        failed = True
+        await websocket.send_json({"type": "error", "detail": chat_error_detail(str(e))})
+    finally:
+        deltas.close()
+        if not failed:
+            await run_in_threadpool(persist_chat_turn, thread_id, connection.user_id, message, "".join(parts), ttft_ms)
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    /chat-rag over one WebSocket per conversation. The first message authenticates:
+    {"type": "auth", "token": "<Supabase JWT>"}, answered with {"type": "ready"}.
+    Each {"type": "message", "message": "...", "thread_id": "..."} is then answered
+    with the /chat-rag/stream events as JSON messages: meta, token..., done or error.
+    """
+    await websocket.accept()
+    try:
+        auth = await asyncio.wait_for(websocket.receive_json(), CHAT_WS_AUTH_TIMEOUT_SECONDS)
+        if not isinstance(auth, dict) or auth.get("type") != "auth":
+            raise HTTPException(status_code=401, detail="Expected an auth message")
+        user = decode_user_token(str(auth.get("token") or ""))
+    except WebSocketDisconnect:
+        return
+    except (HTTPException, asyncio.TimeoutError, ValueError) as e:
+        reason = e.detail if isinstance(e, HTTPException) else "Authentication failed"
+        await websocket.close(code=1008, reason=reason[:120])
+        return
+    if not client:
+        await websocket.close(code=1011, reason="OpenAI client not configured")
+        return
+
+    connection = ChatConnection(user, _last_write_time(websocket.cookies.get(READ_YOUR_WRITES_COOKIE)))
+    await websocket.send_json({"type": "ready"})
+    try:
+        while True:
+            try:
+                data = await websocket.receive_json()
+            except (ValueError, KeyError):
+                # Not JSON (or a binary frame)
+                await websocket.send_json({"type": "error", "detail": "Messages must be JSON text"})
+                continue
+            if not isinstance(data, dict) or data.get("type") != "message" or not data.get("message"):
+                await websocket.send_json({"type": "error", "detail": "Expected {\"type\": \"message\", \"message\": ...}"})
+                continue
+            await _chat_websocket_turn(websocket, connection, data)
+    except WebSocketDisconnect:
+        pass
 
 # Learning Plan Question Generation with RAG
 class GenerateQuestionsRequest(BaseModel):
@@ -2743,7 +2439,7 @@ def test_learning_plan_endpoint():
     return {"message": "Learning plan endpoint is working"}
 
 @app.post("/api/learning-plan/generate-questions")
-async def generate_learning_plan_questions(
+def generate_learning_plan_questions(
     request: GenerateQuestionsRequest,
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -2782,13 +2478,13 @@ async def generate_learning_plan_questions(
             # If no case study/topic, prioritize system materials
             if use_general_query:
                 # Get only system materials for general question generation
-                user_materials = db.query(Material).filter(
+                user_materials = db.query(Material.id).filter(
                     Material.user_id == SYSTEM_USER_ID,
                     Material.status == "processed"
                 ).all()
             else:
                 # Get both user and system materials
-                user_materials = db.query(Material).filter(
+                user_materials = db.query(Material.id).filter(
                     or_(
                         Material.user_id == current_user['user_id'],
                         Material.user_id == SYSTEM_USER_ID
@@ -2974,7 +2670,7 @@ class CreateLearningPlanRequest(BaseModel):
 async def create_or_get_learning_plan(
     request: CreateLearningPlanRequest,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new learning plan row for each generated question set"""
     try:
@@ -3002,8 +2698,8 @@ async def create_or_get_learning_plan(
         )
         
         db.add(learning_plan)
-        db.commit()
-        db.refresh(learning_plan)
+        await db.commit()
+        await db.refresh(learning_plan)
         
         return {
             "success": True,
@@ -3013,7 +2709,7 @@ async def create_or_get_learning_plan(
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error creating learning plan: {e}")
         raise HTTPException(status_code=500, detail=f"Error creating learning plan: {str(e)}")
 
@@ -3027,17 +2723,20 @@ class SubmitQuizRequest(BaseModel):
 async def submit_learning_plan_quiz(
     request: SubmitQuizRequest,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Submit quiz answers and save progress"""
     try:
         user_id = current_user['user_id']
         
         # Verify learning plan exists and belongs to user
-        learning_plan = db.query(LearningPlan).filter(
-            LearningPlan.id == request.learning_plan_id,
-            LearningPlan.user_id == user_id
-        ).first()
+        result = await db.execute(
+            select(LearningPlan).where(
+                LearningPlan.id == request.learning_plan_id,
+                LearningPlan.user_id == user_id
+            )
+        )
+        learning_plan = result.scalars().first()
         
         if not learning_plan:
             raise HTTPException(status_code=404, detail="Learning plan not found")
@@ -3062,18 +2761,23 @@ async def submit_learning_plan_quiz(
         percentage = (correct / total * 100) if total > 0 else 0
         
         # Calculate attempt count based on number of existing quiz submissions for this learning plan
-        attempt_count = db.query(LearningPlanProgress).filter(
-            LearningPlanProgress.user_id == user_id,
-            LearningPlanProgress.learning_plan_id == request.learning_plan_id,
-            LearningPlanProgress.quiz_submitted == True
-        ).count() + 1
+        attempt_count = (await db.scalar(
+            select(func.count()).select_from(LearningPlanProgress).where(
+                LearningPlanProgress.user_id == user_id,
+                LearningPlanProgress.learning_plan_id == request.learning_plan_id,
+                LearningPlanProgress.quiz_submitted == True
+            )
+        )) + 1
         
         # Get or create a base progress record for tracking video/case study (non-quiz progress)
         # We'll use the most recent one or create new if none exists
-        base_progress = db.query(LearningPlanProgress).filter(
-            LearningPlanProgress.user_id == user_id,
-            LearningPlanProgress.learning_plan_id == request.learning_plan_id
-        ).order_by(LearningPlanProgress.started_at.desc()).first()
+        result = await db.execute(
+            select(LearningPlanProgress).where(
+                LearningPlanProgress.user_id == user_id,
+                LearningPlanProgress.learning_plan_id == request.learning_plan_id
+            ).order_by(LearningPlanProgress.started_at.desc()).limit(1)
+        )
+        base_progress = result.scalars().first()
         
         # Create a NEW row for this quiz submission
         # This ensures each generated set of questions gets its own row
@@ -3113,8 +2817,8 @@ async def submit_learning_plan_quiz(
         
         db.add(progress)
         
-        db.commit()
-        db.refresh(progress)
+        await db.commit()
+        await db.refresh(progress)
         
         return {
             "success": True,
@@ -3128,50 +2832,70 @@ async def submit_learning_plan_quiz(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error submitting quiz: {e}")
         raise HTTPException(status_code=500, detail=f"Error submitting quiz: {str(e)}")
 
 @app.get("/api/learning-plans/{learning_plan_id}/progress")
 async def get_learning_plan_progress(
     learning_plan_id: int,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Get user's progress for a specific learning plan - returns all quiz attempts"""
+    """Get user's progress for a specific learning plan with its quiz attempts (cursor-paginated, newest first)"""
+    limit = clamp_limit(limit)
     try:
         user_id = current_user['user_id']
-        
-        # Get all progress records for this learning plan (each quiz submission is a row)
-        all_progress = db.query(LearningPlanProgress).filter(
+        progress_filter = (
             LearningPlanProgress.user_id == user_id,
             LearningPlanProgress.learning_plan_id == learning_plan_id
-        ).order_by(LearningPlanProgress.quiz_submitted_at.desc(), LearningPlanProgress.started_at.desc()).all()
+        )
+        
+        # The most recent progress row carries the current video/case study status
+        result = await db.execute(
+            select(LearningPlanProgress).where(*progress_filter)
+            .order_by(LearningPlanProgress.started_at.desc()).limit(1)
+        )
+        latest_progress = result.scalars().first()
         
-        if not all_progress:
+        if not latest_progress:
             return {
                 "success": True,
                 "progress": None,
                 "quiz_attempts": [],
+                "next_cursor": None,
+                "has_more": False,
                 "message": "No progress found"
             }
         
-        # Get the most recent progress for video/case study status
-        latest_progress = all_progress[0]
-        
-        # Get all quiz attempts (rows where quiz was submitted)
-        quiz_attempts = []
-        for prog in all_progress:
-            if prog.quiz_submitted:
-                quiz_attempts.append({
-                    "id": prog.id,
-                    "quiz_submitted_at": prog.quiz_submitted_at.isoformat() if prog.quiz_submitted_at else None,
-                    "quiz_answers": prog.quiz_answers,
-                    "quiz_score": prog.quiz_score,
-                    "quiz_total": prog.quiz_total,
-                    "quiz_percentage": float(prog.quiz_percentage) if prog.quiz_percentage else None,
-                    "attempt_number": prog.attempt_count
-                })
+        total_quiz_attempts = await db.scalar(
+            select(func.count()).select_from(LearningPlanProgress).where(
+                *progress_filter, LearningPlanProgress.quiz_submitted == True
+            )
+        )
+        
+        # One page of quiz attempts (each quiz submission is its own row)
+        statement = paginate(
+            select(LearningPlanProgress).where(*progress_filter, LearningPlanProgress.quiz_submitted == True),
+            LearningPlanProgress.quiz_submitted_at, LearningPlanProgress.id, cursor, limit
+        )
+        rows = (await db.execute(statement)).scalars().all()
+        attempts, next_cursor, has_more = page_result(rows, limit, lambda prog: (prog.quiz_submitted_at, prog.id))
+        
+        quiz_attempts = [
+            {
+                "id": prog.id,
+                "quiz_submitted_at": prog.quiz_submitted_at.isoformat() if prog.quiz_submitted_at else None,
+                "quiz_answers": prog.quiz_answers,
+                "quiz_score": prog.quiz_score,
+                "quiz_total": prog.quiz_total,
+                "quiz_percentage": float(prog.quiz_percentage) if prog.quiz_percentage else None,
+                "attempt_number": prog.attempt_count
+            }
+            for prog in attempts
+        ]
         
         return {
             "success": True,
@@ -3185,11 +2909,15 @@ async def get_learning_plan_progress(
                 "completed": latest_progress.completed,
                 "completed_at": latest_progress.completed_at.isoformat() if latest_progress.completed_at else None,
                 "started_at": latest_progress.started_at.isoformat() if latest_progress.started_at else None,
-                "total_quiz_attempts": len(quiz_attempts)
+                "total_quiz_attempts": total_quiz_attempts
             },
-            "quiz_attempts": quiz_attempts  # All quiz submissions, each in its own row
+            "quiz_attempts": quiz_attempts,
+            "next_cursor": next_cursor,
+            "has_more": has_more
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching progress: {e}")
         raise HTTPException(status_code=500, detail=f"Error fetching progress: {str(e)}")
@@ -3209,7 +2937,7 @@ def _get_user_uuid(user_id):
 async def create_or_update_profile(
     profile_data: Dict[str, Any] = Body(...),
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Create or update user profile"""
     try:
@@ -3224,11 +2952,8 @@ async def create_or_update_profile(
         # Check if profile exists with string ID (in case of mismatch)
         existing_profile_str = None
         try:
-            existing_profile_str = (
-                db.query(Profile)
-                .filter(Profile.id == user_id_str)
-                .first()
-            )
+            result = await db.execute(select(Profile).where(Profile.id == user_id_str))
+            existing_profile_str = result.scalars().first()
             if existing_profile_str:
                 print(f"DEBUG: Found profile with string ID: {existing_profile_str.id}")
         except Exception as e:
@@ -3240,11 +2965,8 @@ async def create_or_update_profile(
             raw_grad_year = raw_grad_year.strip() or None
 
         # Check if profile already exists with UUID
-        existing_profile = (
-            db.query(Profile)
-            .filter(Profile.id == user_id_uuid)
-            .first()
-        )
+        result = await db.execute(select(Profile).where(Profile.id == user_id_uuid))
+        existing_profile = result.scalars().first()
         print(f"DEBUG: Existing profile found (UUID): {existing_profile is not None}")
         
         # If found with string but not UUID, use the string one
@@ -3264,9 +2986,9 @@ async def create_or_update_profile(
                 existing_profile.updated_at = func.now()
 
             print(f"DEBUG: Updating existing profile, committing...")
-            db.commit()
+            await db.commit()
             print(f"DEBUG: Update commit successful, refreshing...")
-            db.refresh(existing_profile)
+            await db.refresh(existing_profile)
             print(f"DEBUG: Profile updated: {existing_profile.id}, {existing_profile.full_name}")
 
             return {
@@ -3291,15 +3013,6 @@ async def create_or_update_profile(
             # First, check if there's already a profile with this ID in any format
             print(f"DEBUG: No existing profile found, creating new one...")
             
-            # List all existing profiles to debug
-            try:
-                all_profiles = db.query(Profile).limit(10).all()
-                print(f"DEBUG: Sample of existing profiles in DB ({len(all_profiles)} shown):")
-                for p in all_profiles:
-                    print(f"  - Profile ID: {p.id} (type: {type(p.id).__name__}), name: {p.full_name}")
-            except Exception as e:
-                print(f"DEBUG: Could not list profiles: {e}")
-            
             try:
                 profile = Profile(
                     id=user_id_uuid,
@@ -3311,12 +3024,12 @@ async def create_or_update_profile(
 
                 db.add(profile)
                 print(f"DEBUG: Profile added to session, attempting commit...")
-                db.commit()
+                await db.commit()
                 print(f"DEBUG: Commit successful, refreshing profile...")
-                db.refresh(profile)
+                await db.refresh(profile)
                 print(f"DEBUG: Profile refreshed: {profile.id}, {profile.full_name}")
             except Exception as create_error:
-                db.rollback()
+                await db.rollback()
                 error_type = type(create_error).__name__
                 error_msg = str(create_error)
                 print(f"DEBUG: Error creating profile!")
@@ -3328,10 +3041,10 @@ async def create_or_update_profile(
                     print(f"DEBUG: Possible duplicate key error - profile may already exist")
                     # Try to find it
                     try:
-                        found = db.query(Profile).filter(Profile.id == user_id_str).first()
+                        found = (await db.execute(select(Profile).where(Profile.id == user_id_str))).scalars().first()
                         if found:
                             print(f"DEBUG: Found existing profile with string ID: {found.id}")
-                        found_uuid = db.query(Profile).filter(Profile.id == user_id_uuid).first()
+                        found_uuid = (await db.execute(select(Profile).where(Profile.id == user_id_uuid))).scalars().first()
                         if found_uuid:
                             print(f"DEBUG: Found existing profile with UUID: {found_uuid.id}")
                     except:
@@ -3361,7 +3074,7 @@ async def create_or_update_profile(
         # Re-raise HTTP exceptions
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         # also log this on the server so you can see the exact DB error
         import traceback
         error_trace = traceback.format_exc()
@@ -3377,18 +3090,15 @@ async def create_or_update_profile(
 @app.get("/api/profile")
 async def get_profile(
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
 ):
     """Get user profile"""
     try:
         # Convert user_id string to UUID if needed
         user_id_uuid = _get_user_uuid(current_user["user_id"])
         
-        profile = (
-            db.query(Profile)
-            .filter(Profile.id == user_id_uuid)
-            .first()
-        )
+        result = await db.execute(select(Profile).where(Profile.id == user_id_uuid))
+        profile = result.scalars().first()
 
         if not profile:
             return {
@@ -3428,18 +3138,15 @@ async def get_profile(
 @app.get("/api/profile/me")
 async def get_my_profile_with_user_data(
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
 ):
     """Get combined user data from Supabase and profile from database"""
     try:
         # Convert user_id string to UUID if needed
         user_id_uuid = _get_user_uuid(current_user["user_id"])
         
-        profile = (
-            db.query(Profile)
-            .filter(Profile.id == user_id_uuid)
-            .first()
-        )
+        result = await db.execute(select(Profile).where(Profile.id == user_id_uuid))
+        profile = result.scalars().first()
 
         user_data = {
             "user_id": current_user["user_id"],
@@ -3461,181 +3168,3 @@ async def get_my_profile_with_user_data(
         raise HTTPException(
             status_code=500, detail=f"Error fetching user data: {str(e)}"
         )
-
-
-# Helper functions for care plan operations
-def build_care_plan_text(care_plan_data: dict) -> str:
-    """Build text representation of care plan for RAG indexing"""
-    sections = []
-    
-    # Patient Information
-    if care_plan_data.get('patient_name'):
-        sections.append(f"Patient: {care_plan_data['patient_name']}")
-    if care_plan_data.get('age'):
-        sections.append(f"Age: {care_plan_data['age']}")
-    if care_plan_data.get('sex'):
-        sections.append(f"Sex: {care_plan_data['sex']}")
-    if care_plan_data.get('diagnosis'):
-        sections.append(f"Diagnosis: {care_plan_data['diagnosis']}")
-    if care_plan_data.get('procedure'):
-        sections.append(f"Procedure: {care_plan_data['procedure']}")
-    
-    # Medical History
-    if care_plan_data.get('pmh'):
-        sections.append(f"Past Medical History: {care_plan_data['pmh']}")
-    if care_plan_data.get('psh'):
-        sections.append(f"Past Surgical History: {care_plan_data['psh']}")
-    if care_plan_data.get('meds'):
-        sections.append(f"Current Medications: {care_plan_data['meds']}")
-    
-    # Physical Assessment
-    if care_plan_data.get('neuro'):
-        sections.append(f"Neurological: {care_plan_data['neuro']}")
-    if care_plan_data.get('cardio'):
-        sections.append(f"Cardiovascular: {care_plan_data['cardio']}")
-    if care_plan_data.get('resp'):
-        sections.append(f"Respiratory: {care_plan_data['resp']}")
-    
-    # Airway Assessment
-    if care_plan_data.get('mallampati'):
-        sections.append(f"Mallampati: {care_plan_data['mallampati']}")
-    if care_plan_data.get('ulbt'):
-        sections.append(f"ULBT Grade: {care_plan_data['ulbt']}")
-    
-    # Laboratory Values
-    lab_values = []
-    for lab in ['na', 'k', 'cl', 'co2', 'bun', 'cr', 'glu', 'wbc', 'hgb', 'hct', 'plt', 'pt', 'ptt', 'inr']:
-        if care_plan_data.get(lab):
-            lab_values.append(f"{lab.upper()}: {care_plan_data[lab]}")
-    if lab_values:
-        sections.append(f"Laboratory Values: {', '.join(lab_values)}")
-    
-    return "\n".join(sections)
-
-async def index_care_plan_for_rag(care_plan: CarePlan, db: Session):
-    """Index care plan content for RAG retrieval"""
-    try:
-        if not care_plan.exported_text:
-            return
-        
-        # Create vector index entry for the care plan
-        embedding = generate_embeddings(care_plan.exported_text)
-        
-        vector_entry = VectorIndexEntry(
-            user_id=care_plan.user_id,
-            content_hash=f"care_plan_{care_plan.id}",
-            embedding=embedding,
-            content=care_plan.exported_text,
-            token_count=len(care_plan.exported_text.split()),
-            chunk_index=0,
-            source_type="care_plan",
-            source_id=care_plan.id,
-            embedding_model="text-embedding-3-small",
-            vector_metadata={
-                "care_plan_id": care_plan.id,
-                "patient_name": care_plan.patient_name,
-                "procedure": care_plan.procedure,
-                "diagnosis": care_plan.diagnosis,
-                "created_at": care_plan.created_at.isoformat() if care_plan.created_at else None
-            }
-        )
-        
-        db.add(vector_entry)
-        db.commit()
-        
-    except Exception as e:
-        print(f"Error indexing care plan for RAG: {e}")
-
-def build_care_plan_context(care_plan: CarePlan, db: Session) -> str:
-    """Build context for AI generation by searching relevant materials"""
-    try:
-        # Search for relevant materials using care plan content
-        query_text = f"{care_plan.diagnosis} {care_plan.procedure} anesthesia care plan"
-        query_embedding = generate_embeddings(query_text)
-        
-        # Get relevant vector entries (user's materials AND system materials)
-        vector_entries = db.query(VectorIndexEntry).filter(
-            or_(
-                VectorIndexEntry.user_id == care_plan.user_id,
-                VectorIndexEntry.user_id == SYSTEM_USER_ID
-            )
-        ).all()
-        
-        # Calculate similarity and get top results
-        results = []
-        for entry in vector_entries:
-            similarity = sum(a * b for a, b in zip(query_embedding, entry.embedding))
-            results.append({
-                "content": entry.content,
-                "similarity": similarity,
-                "metadata": entry.vector_metadata,
-                "is_system": entry.user_id == SYSTEM_USER_ID
-            })
-        
-        # Sort by similarity and get top 5 most relevant chunks
-        results.sort(key=lambda x: x["similarity"], reverse=True)
-        top_results = results[:5]
-        
-        context_parts = [f"Patient Care Plan:\n{care_plan.exported_text}"]
-        
-        if top_results:
-            context_parts.append("\nRelevant Medical Literature:")
-            for i, result in enumerate(top_results, 1):
-                source_name = result["metadata"].get("file_name", "Unknown Source")
-                source_label = "System Textbook" if result.get("is_system") else "User Material"
-                context_parts.append(f"\n{i}. From {source_name} ({source_label}):\n{result['content'][:300]}...")
-        
-        return "\n".join(context_parts)
-        
-    except Exception as e:
-        print(f"Error building care plan context: {e}")
-        return care_plan.exported_text or ""
-
-async def generate_care_plan_recommendations(context: str, client) -> dict:
-    """Generate AI recommendations for care plan"""
-    try:
-        system_prompt = """You are an expert anesthesiologist AI assistant. Based on the patient information and relevant medical literature provided, generate comprehensive anesthesia care plan recommendations.
-
-Please provide:
-1. Anesthesia Plan: Detailed anesthesia approach including induction, maintenance, and emergence
-2. Risk Assessment: Analysis of patient-specific risks and complications
-3. Monitoring Plan: Required monitoring during the procedure
-4. Medication Plan: Specific medications and dosages
-
-Be specific, evidence-based, and consider the patient's comorbidities and procedure requirements."""
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": context}
-        ]
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            max_tokens=1500
-        )
-        
-        ai_response = response.choices[0].message.content
-        
-        # Parse the response into structured recommendations
-        recommendations = {
-            "anesthesia_plan": ai_response,
-            "risk_assessment": "",
-            "monitoring_plan": "",
-            "medication_plan": "",
-            "sources": [],
-            "confidence_score": 0.8
-        }
-        
-        return recommendations
-        
-    except Exception as e:
-        print(f"Error generating AI recommendations: {e}")
-        return {
-            "anesthesia_plan": "Error generating recommendations",
-            "risk_assessment": "",
-            "monitoring_plan": "",
-            "medication_plan": "",
-            "sources": [],
-            "confidence_score": 0.0
-        }
@@ -8,60 +8,291 @@ Uses in-memory LRU cache with optional disk persistence.
 import os
 import hashlib
 import json
-import pickle
+import mmap
+import struct
+import sqlite3
+from array import array
+import zlib
 from functools import lru_cache
 from typing import Optional, Dict
 from pathlib import Path
 import time
+import threading
+from collections import OrderedDict
+
+from single_flight import get_single_flight, get_single_flight_stats
+from cache_admission import FrequencySketch, should_admit
+from cache_metrics import cache_metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # Cache configuration
 CACHE_DIR = Path(__file__).parent / ".material_cache"
 CACHE_DIR.mkdir(exist_ok=True)
 MAX_CACHE_SIZE_MB = 500  # Maximum cache size in MB
+CACHE_ADMISSION_POLICY = os.getenv("CACHE_ADMISSION_POLICY", "tinylfu").lower()  # tinylfu or lru
+MAX_DISK_CACHE_SIZE_MB = int(os.getenv("MAX_DISK_CACHE_SIZE_MB", "2048"))  # Maximum disk cache size in MB
+DISK_CACHE_COMPRESS = os.getenv("DISK_CACHE_COMPRESS", "false").lower() == "true"  # zlib-compress disk files
 CACHE_EXPIRY_HOURS = 24 * 7  # Cache expires after 7 days
+MAX_VECTOR_CACHE_SIZE_MB = int(os.getenv("MAX_VECTOR_CACHE_SIZE_MB", "256"))  # Maximum vector cache size in MB
+SNAPSHOT_INTERVAL_SECONDS = int(os.getenv("CACHE_SNAPSHOT_INTERVAL_SECONDS", "300"))  # 0 disables hot-set snapshots
+SNAPSHOT_MAX_ENTRIES = 1000  # Hottest ids kept per tier in the snapshot
+SNAPSHOT_MAX_AGE = 3  # Snapshot intervals an id survives without any worker reporting it again
+
+# Disk cache file layout: 16-byte header followed by the UTF-8 payload.
+# Uncompressed payloads are read through mmap, so range reads never decode the whole text.
+CACHE_FILE_MAGIC = b"CLYT"
+CACHE_FILE_VERSION = 1
+CACHE_CODEC_RAW = 0
+CACHE_CODEC_ZLIB = 1
+_CACHE_FILE_HEADER = struct.Struct("<4sBBHQ")  # magic, version, codec, reserved, raw_size
+
+# Single-flight groups: concurrent misses for the same key share one load
+_text_disk_flight = get_single_flight("text_disk")
+_text_db_flight = get_single_flight("text_db")
+_vector_flight = get_single_flight("vectors")
+
+# Compression for the MaterialText blob store: zlib, or zstd (opt-in, needs the zstandard package)
+TEXT_CODEC = os.getenv("MATERIAL_TEXT_CODEC", "zlib").lower()
+if TEXT_CODEC == "zstd" and zstandard is None:
+    print("⚠️  MATERIAL_TEXT_CODEC=zstd but zstandard is not installed, using zlib")
+    TEXT_CODEC = "zlib"
+elif TEXT_CODEC not in ("zlib", "zstd"):
+    print(f"⚠️  Unknown MATERIAL_TEXT_CODEC={TEXT_CODEC}, using zlib")
+    TEXT_CODEC = "zlib"
+TEXT_COMPRESSION_LEVEL = 6
 
 # In-memory cache with size limit
-# Using a dictionary-based LRU cache
-_cache: Dict[int, tuple] = {}  # material_id -> (text, timestamp, size_bytes)
-_cache_access_order: list = []  # Track access order for LRU eviction
+# OrderedDict gives O(1) LRU: hits move to the end, eviction pops from the front
+_cache: "OrderedDict[int, tuple]" = OrderedDict()  # material_id -> (text, timestamp, size_bytes)
+# Same keys in insertion-time order, so expired entries are always at the front
+_cache_insert_order: "OrderedDict[int, float]" = OrderedDict()  # material_id -> timestamp
 _total_cache_size = 0  # Total size in bytes
+# Guards all in-memory state; cache_text is called from background processing threads
+_cache_lock = threading.RLock()
+# Recent access frequencies for TinyLFU admission into the in-memory tier
+_frequency_sketch = FrequencySketch()
+
+# Per-thread connections to the SQLite disk cache index
+_index_local = threading.local()
 
 
 def _get_cache_file_path(material_id: int) -> Path:
     """Get the disk cache file path for a material"""
-    return CACHE_DIR / f"material_{material_id}.cache"
+    return CACHE_DIR / f"material_{material_id}.text"
+
+
+def _write_cache_file(cache_file: Path, text: str) -> int:
+    """
+    Write text to a disk cache file (header + UTF-8 payload).
+    Writes to a temp file and renames so readers never see a partial file.
+    Returns the file size in bytes.
+    """
+    raw = text.encode('utf-8')
+    codec = CACHE_CODEC_RAW
+    payload = raw
+    if DISK_CACHE_COMPRESS:
+        codec = CACHE_CODEC_ZLIB
+        payload = zlib.compress(raw, TEXT_COMPRESSION_LEVEL)
+    
+    header = _CACHE_FILE_HEADER.pack(CACHE_FILE_MAGIC, CACHE_FILE_VERSION, codec, 0, len(raw))
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_file, 'wb') as f:
+        f.write(header)
+        f.write(payload)
+    os.replace(tmp_file, cache_file)
+    return len(header) + len(payload)
+
+
+def _read_cache_file(cache_file: Path, start: int = 0, length: Optional[int] = None) -> tuple:
+    """
+    Read from a disk cache file via mmap.
+    Returns (text, begin, end, total_bytes) for the byte range starting at
+    start, snapped to UTF-8 character boundaries. With length=None the whole
+    text is returned.
+    """
+    with open(cache_file, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if len(mm) < _CACHE_FILE_HEADER.size:
+                raise ValueError("Truncated cache file")
+            magic, version, codec, _, raw_size = _CACHE_FILE_HEADER.unpack_from(mm, 0)
+            if magic != CACHE_FILE_MAGIC or version != CACHE_FILE_VERSION:
+                raise ValueError("Unrecognized cache file format")
+            
+            if codec == CACHE_CODEC_ZLIB:
+                payload = zlib.decompress(mm[_CACHE_FILE_HEADER.size:])
+            elif codec == CACHE_CODEC_RAW:
+                payload = memoryview(mm)[_CACHE_FILE_HEADER.size:]
+            else:
+                raise ValueError(f"Unknown cache file codec: {codec}")
+            
+            try:
+                if len(payload) != raw_size:
+                    raise ValueError("Truncated cache file")
+                begin = _utf8_boundary(payload, start)
+                end = raw_size if length is None else _utf8_boundary(payload, begin + length)
+                text = bytes(payload[begin:end]).decode('utf-8')
+            finally:
+                if isinstance(payload, memoryview):
+                    payload.release()
+    
+    return text, begin, end, raw_size
+
+
+def _remove_legacy_cache_files():
+    """Remove pickled cache files left by older versions; they are never loaded"""
+    for legacy_file in CACHE_DIR.glob("material_*.cache"):
+        try:
+            legacy_file.unlink()
+        except FileNotFoundError:
+            pass
 
 
 def _get_cache_metadata_path() -> Path:
-    """Get the cache metadata file path"""
+    """Get the legacy JSON cache metadata file path"""
     return CACHE_DIR / "cache_metadata.json"
 
 
+def _get_cache_index_path() -> Path:
+    """Get the SQLite disk cache index path"""
+    return CACHE_DIR / "cache_index.sqlite3"
+
+
 def _get_text_size(text: str) -> int:
     """Calculate the size of text in bytes"""
     return len(text.encode('utf-8'))
 
 
-def _load_cache_metadata() -> Dict:
-    """Load cache metadata from disk"""
-    metadata_path = _get_cache_metadata_path()
-    if metadata_path.exists():
-        try:
-            with open(metadata_path, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading cache metadata: {e}")
-    return {}
+def _get_index_conn() -> sqlite3.Connection:
+    """
+    Get this thread's connection to the disk cache index.
+    The index is SQLite in WAL mode, so readers never block the writer and
+    several worker processes can share one cache directory safely.
+    """
+    conn = getattr(_index_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(str(_get_cache_index_path()), timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                material_id INTEGER PRIMARY KEY,
+                timestamp REAL NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_last_access ON cache_entries (last_access)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_timestamp ON cache_entries (timestamp)")
+        _index_local.conn = conn
+        _import_legacy_metadata(conn)
+        _remove_legacy_cache_files()
+    return conn
 
 
-def _save_cache_metadata(metadata: Dict):
-    """Save cache metadata to disk"""
+def _import_legacy_metadata(conn: sqlite3.Connection):
+    """One-time import of the old cache_metadata.json into the index"""
     metadata_path = _get_cache_metadata_path()
+    if not metadata_path.exists():
+        return
     try:
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f)
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+        conn.executemany(
+            "INSERT OR IGNORE INTO cache_entries (material_id, timestamp, size_bytes, last_access) VALUES (?, ?, ?, ?)",
+            [(int(key), info.get('timestamp', 0), info.get('size_bytes', 0), info.get('timestamp', 0))
+             for key, info in metadata.items()]
+        )
     except Exception as e:
-        print(f"Error saving cache metadata: {e}")
+        print(f"Error importing legacy cache metadata: {e}")
+    try:
+        metadata_path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _index_get(material_id: int) -> Optional[tuple]:
+    """Get (timestamp, size_bytes) for a disk cache entry, or None"""
+    return _get_index_conn().execute(
+        "SELECT timestamp, size_bytes FROM cache_entries WHERE material_id = ?", (material_id,)
+    ).fetchone()
+
+
+def _index_put(material_id: int, timestamp: float, size_bytes: int):
+    """Insert or replace a disk cache entry"""
+    _get_index_conn().execute(
+        "INSERT OR REPLACE INTO cache_entries (material_id, timestamp, size_bytes, last_access) VALUES (?, ?, ?, ?)",
+        (material_id, timestamp, size_bytes, time.time())
+    )
+
+
+def _index_touch(material_id: int):
+    """Record a disk cache hit for LRU eviction"""
+    _get_index_conn().execute(
+        "UPDATE cache_entries SET last_access = ? WHERE material_id = ?", (time.time(), material_id)
+    )
+
+
+def _index_delete(material_id: int):
+    """Remove a disk cache entry from the index"""
+    _get_index_conn().execute("DELETE FROM cache_entries WHERE material_id = ?", (material_id,))
+
+
+def _index_totals() -> tuple:
+    """Get (entry_count, total_size_bytes) for the disk cache"""
+    count, total = _get_index_conn().execute(
+        "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM cache_entries"
+    ).fetchone()
+    return count, total
+
+
+def _remove_disk_entry(material_id: int):
+    """Remove a disk cache file and its index entry"""
+    cache_file = _get_cache_file_path(material_id)
+    try:
+        cache_file.unlink()
+    except FileNotFoundError:
+        pass
+    _index_delete(material_id)
+
+
+def _enforce_disk_budget(new_size: int):
+    """
+    Evict expired, then least recently used, disk entries so that adding
+    new_size bytes stays within MAX_DISK_CACHE_SIZE_MB.
+    """
+    max_size_bytes = MAX_DISK_CACHE_SIZE_MB * 1024 * 1024
+    conn = _get_index_conn()
+    
+    cutoff = time.time() - CACHE_EXPIRY_HOURS * 3600
+    expired_ids = [row[0] for row in conn.execute(
+        "SELECT material_id FROM cache_entries WHERE timestamp < ?", (cutoff,)
+    )]
+    for material_id in expired_ids:
+        _remove_disk_entry(material_id)
+    cache_metrics.count('disk', 'expiration', len(expired_ids))
+    
+    _, total = _index_totals()
+    while total + new_size > max_size_bytes:
+        victims = conn.execute(
+            "SELECT material_id, size_bytes FROM cache_entries ORDER BY last_access LIMIT 16"
+        ).fetchall()
+        if not victims:
+            break
+        for material_id, size in victims:
+            _remove_disk_entry(material_id)
+            cache_metrics.count('disk', 'eviction')
+            total -= size
+            if total + new_size <= max_size_bytes:
+                break
 
 
 def _is_cache_expired(timestamp: float) -> bool:
@@ -69,39 +300,98 @@ def _is_cache_expired(timestamp: float) -> bool:
     return time.time() - timestamp > (CACHE_EXPIRY_HOURS * 3600)
 
 
+def _sweep_expired():
+    """
+    Remove expired entries from the in-memory cache.
+    Entries are kept in insertion-time order, so this only touches the expired
+    prefix - amortized O(1) per insert instead of a full scan.
+    Must be called with _cache_lock held.
+    """
+    while _cache_insert_order:
+        material_id, timestamp = next(iter(_cache_insert_order.items()))
+        if not _is_cache_expired(timestamp):
+            break
+        _remove_from_cache(material_id)
+        cache_metrics.count('memory', 'expiration')
+
+
 def _evict_lru_if_needed(new_size: int):
-    """Evict least recently used entries if cache is too large"""
-    global _total_cache_size, _cache, _cache_access_order
-    
+    """
+    Evict least recently used entries if cache is too large.
+    Must be called with _cache_lock held.
+    """
     max_size_bytes = MAX_CACHE_SIZE_MB * 1024 * 1024
     
     # Remove expired entries first
-    expired_ids = []
-    for material_id in list(_cache.keys()):
-        text, timestamp, size = _cache[material_id]
-        if _is_cache_expired(timestamp):
-            expired_ids.append(material_id)
-    
-    for material_id in expired_ids:
-        _remove_from_cache(material_id)
+    _sweep_expired()
     
     # If still too large, evict LRU entries
-    while _total_cache_size + new_size > max_size_bytes and _cache_access_order:
-        lru_id = _cache_access_order.pop(0)
-        if lru_id in _cache:
-            _remove_from_cache(lru_id)
+    while _cache and _total_cache_size + new_size > max_size_bytes:
+        lru_id = next(iter(_cache))
+        _remove_from_cache(lru_id)
+        cache_metrics.count('memory', 'eviction')
 
 
 def _remove_from_cache(material_id: int):
-    """Remove an entry from the cache"""
-    global _total_cache_size, _cache, _cache_access_order
+    """Remove an entry from the in-memory cache"""
+    global _total_cache_size
     
+    with _cache_lock:
+        entry = _cache.pop(material_id, None)
+        if entry is not None:
+            _, _, size = entry
+            _total_cache_size -= size
+        _cache_insert_order.pop(material_id, None)
+
+
+def _eviction_victims(material_id: int, new_size: int) -> list:
+    """
+    LRU entries that would be evicted to fit new_size bytes.
+    Must be called with _cache_lock held.
+    """
+    max_size_bytes = MAX_CACHE_SIZE_MB * 1024 * 1024
+    needed = _total_cache_size + new_size - max_size_bytes
     if material_id in _cache:
-        _, _, size = _cache[material_id]
-        _total_cache_size -= size
-        del _cache[material_id]
-        if material_id in _cache_access_order:
-            _cache_access_order.remove(material_id)
+        needed -= _cache[material_id][2]
+    
+    victims = []
+    for victim_id, (_, _, size) in _cache.items():
+        if needed <= 0:
+            break
+        if victim_id == material_id:
+            continue
+        victims.append(victim_id)
+        needed -= size
+    return victims
+
+
+def _add_to_cache(material_id: int, text: str, timestamp: float, text_size: int) -> bool:
+    """
+    Add an entry to the in-memory cache, evicting as needed.
+    Texts larger than the whole budget are not kept in memory. With the TinyLFU
+    policy a new entry is only admitted if it is accessed more often than the
+    entries it would evict. Returns True if the entry was admitted.
+    """
+    global _total_cache_size
+    
+    if text_size > MAX_CACHE_SIZE_MB * 1024 * 1024:
+        return False
+    
+    with _cache_lock:
+        if CACHE_ADMISSION_POLICY == "tinylfu" and material_id not in _cache:
+            _sweep_expired()
+            if not should_admit(_frequency_sketch, material_id, _eviction_victims(material_id, text_size)):
+                cache_metrics.count('memory', 'admission_rejection')
+                return False
+        
+        # Drop the old entry first so its size is not counted twice
+        _remove_from_cache(material_id)
+        _evict_lru_if_needed(text_size)
+        
+        _cache[material_id] = (text, timestamp, text_size)
+        _cache_insert_order[material_id] = timestamp
+        _total_cache_size += text_size
+        return True
 
 
 def get_cached_text(material_id: int) -> Optional[str]:
@@ -109,106 +399,106 @@ def get_cached_text(material_id: int) -> Optional[str]:
     Get cached extracted text for a material.
     Returns None if not cached or expired.
     """
-    global _cache, _cache_access_order
+    _frequency_sketch.increment(material_id)
+    cache_metrics.record_access('text', material_id)
     
     # Check in-memory cache first
-    if material_id in _cache:
-        text, timestamp, size = _cache[material_id]
-        
-        # Check if expired
-        if _is_cache_expired(timestamp):
+    with _cache_lock:
+        entry = _cache.get(material_id)
+        if entry is not None:
+            text, timestamp, size = entry
+            
+            if not _is_cache_expired(timestamp):
+                # Mark as most recently used
+                _cache.move_to_end(material_id)
+                cache_metrics.count('memory', 'hit')
+                return text
+            
             _remove_from_cache(material_id)
-            # Also remove from disk
-            cache_file = _get_cache_file_path(material_id)
-            if cache_file.exists():
-                cache_file.unlink()
+    
+    cache_metrics.count('memory', 'miss')
+    
+    # Expired in memory - also remove from disk
+    if entry is not None:
+        cache_metrics.count('memory', 'expiration')
+        try:
+            _remove_disk_entry(material_id)
+        except Exception as e:
+            print(f"Error removing expired disk cache for material {material_id}: {e}")
+        return None
+    
+    # Check disk cache (one reader per material; concurrent misses share its result)
+    return _text_disk_flight.do(material_id, lambda: _get_disk_cached_text(material_id))
+
+
+def _get_disk_cached_text(material_id: int) -> Optional[str]:
+    """Load cached text from the disk tier into memory. Returns None on a miss."""
+    cache_file = _get_cache_file_path(material_id)
+    try:
+        # Look up the entry in the index to check timestamp
+        cache_info = _index_get(material_id)
+        if cache_info is None:
+            cache_metrics.count('disk', 'miss')
+            return None
+        
+        timestamp, _ = cache_info
+        if _is_cache_expired(timestamp) or not cache_file.exists():
+            _remove_disk_entry(material_id)
+            cache_metrics.count('disk', 'miss')
+            cache_metrics.count('disk', 'expiration')
             return None
         
-        # Update access order (move to end)
-        if material_id in _cache_access_order:
-            _cache_access_order.remove(material_id)
-        _cache_access_order.append(material_id)
+        # Load from disk
+        with cache_metrics.timed('disk_read'):
+            text, _, _, text_size = _read_cache_file(cache_file)
+        _index_touch(material_id)
+        cache_metrics.count('disk', 'hit')
+        cache_metrics.add_disk_bytes_read(text_size)
+        
+        # Add to in-memory cache, stamped now: _cache_insert_order must stay in
+        # insertion-time order for _sweep_expired to stop at the first live entry
+        _add_to_cache(material_id, text, time.time(), text_size)
         
         return text
-    
-    # Check disk cache
-    cache_file = _get_cache_file_path(material_id)
-    if cache_file.exists():
+    except Exception as e:
+        cache_metrics.count('disk', 'error')
+        print(f"Error loading cache from disk for material {material_id}: {e}")
+        # Remove corrupted cache file
         try:
-            # Load metadata to check timestamp
-            metadata = _load_cache_metadata()
-            cache_info = metadata.get(str(material_id), {})
-            timestamp = cache_info.get('timestamp', 0)
-            
-            if _is_cache_expired(timestamp):
-                cache_file.unlink()
-                if str(material_id) in metadata:
-                    del metadata[str(material_id)]
-                    _save_cache_metadata(metadata)
-                return None
-            
-            # Load from disk
-            with open(cache_file, 'rb') as f:
-                text = pickle.load(f)
-            
-            # Add to in-memory cache
-            text_size = _get_text_size(text)
-            _evict_lru_if_needed(text_size)
-            _cache[material_id] = (text, timestamp, text_size)
-            _total_cache_size += text_size
-            _cache_access_order.append(material_id)
-            
-            return text
-        except Exception as e:
-            print(f"Error loading cache from disk for material {material_id}: {e}")
-            # Remove corrupted cache file
-            if cache_file.exists():
-                cache_file.unlink()
+            _remove_disk_entry(material_id)
+        except Exception:
+            pass
     
     return None
 
 
-def cache_text(material_id: int, text: str):
+def cache_text(material_id: int, text: str, memory: bool = True):
     """
     Cache extracted text for a material.
-    Saves to both in-memory and disk cache.
+    Saves to both in-memory and disk cache (disk only with memory=False).
     """
-    global _cache, _cache_access_order, _total_cache_size
-    
     if not text:
         return
     
     text_size = _get_text_size(text)
     timestamp = time.time()
     
-    # Evict if needed before adding
-    _evict_lru_if_needed(text_size)
-    
-    # Remove old entry if exists
-    if material_id in _cache:
-        _remove_from_cache(material_id)
-    
     # Add to in-memory cache
-    _cache[material_id] = (text, timestamp, text_size)
-    _total_cache_size += text_size
-    if material_id in _cache_access_order:
-        _cache_access_order.remove(material_id)
-    _cache_access_order.append(material_id)
+    if memory:
+        _add_to_cache(material_id, text, timestamp, text_size)
     
     # Save to disk cache
+    if text_size > MAX_DISK_CACHE_SIZE_MB * 1024 * 1024:
+        return
     cache_file = _get_cache_file_path(material_id)
     try:
-        with open(cache_file, 'wb') as f:
-            pickle.dump(text, f)
+        _index_delete(material_id)
+        _enforce_disk_budget(text_size)
         
-        # Update metadata
-        metadata = _load_cache_metadata()
-        metadata[str(material_id)] = {
-            'timestamp': timestamp,
-            'size_bytes': text_size,
-            'title': f"Material {material_id}"  # Can be updated with actual title
-        }
-        _save_cache_metadata(metadata)
+        file_size = _write_cache_file(cache_file, text)
+        
+        # Update the index
+        _index_put(material_id, timestamp, file_size)
     except Exception as e:
         print(f"Error saving cache to disk for material {material_id}: {e}")
 
@@ -220,131 +510,833 @@ def invalidate_cache(material_id: int):
     """
     _remove_from_cache(material_id)
     
-    # Remove from disk
-    cache_file = _get_cache_file_path(material_id)
-    if cache_file.exists():
-        cache_file.unlink()
-    
-    # Update metadata
-    metadata = _load_cache_metadata()
-    if str(material_id) in metadata:
-        del metadata[str(material_id)]
-        _save_cache_metadata(metadata)
+    # Remove from disk and the index
+    try:
+        _remove_disk_entry(material_id)
+    except Exception as e:
+        print(f"Error invalidating disk cache for material {material_id}: {e}")
 
 
 def clear_all_cache():
     """Clear all cached materials"""
-    global _cache, _cache_access_order, _total_cache_size
+    global _total_cache_size
     
-    _cache.clear()
-    _cache_access_order.clear()
-    _total_cache_size = 0
+    with _cache_lock:
+        _cache.clear()
+        _cache_insert_order.clear()
+        _total_cache_size = 0
     
     # Clear disk cache
     if CACHE_DIR.exists():
-        for cache_file in CACHE_DIR.glob("material_*.cache"):
+        for cache_file in CACHE_DIR.glob("material_*.text"):
             cache_file.unlink()
+        _remove_legacy_cache_files()
     
-    # Clear metadata
-    metadata_path = _get_cache_metadata_path()
-    if metadata_path.exists():
-        metadata_path.unlink()
+    # Clear the index
+    _get_index_conn().execute("DELETE FROM cache_entries")
+
+
+def compress_text(text: str, codec: str = TEXT_CODEC) -> bytes:
+    """Compress text for storage in the MaterialText table"""
+    raw = text.encode('utf-8')
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        return zstandard.ZstdCompressor(level=TEXT_COMPRESSION_LEVEL).compress(raw)
+    if codec == "zlib":
+        return zlib.compress(raw, TEXT_COMPRESSION_LEVEL)
+    raise ValueError(f"Unknown text codec: {codec}")
+
+
+def decompress_text(blob: bytes, codec: str) -> str:
+    """Decompress text stored in the MaterialText table"""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(blob)
+    elif codec == "zlib":
+        raw = zlib.decompress(blob)
+    else:
+        raise ValueError(f"Unknown text codec: {codec}")
+    return raw.decode('utf-8')
+
+
+def store_material_text(db_session, material_id: int, text: str):
+    """
+    Store extracted text for a material in the compressed blob table.
+    The caller is responsible for committing the session.
+    """
+    from database import MaterialText
+
+    db_session.merge(MaterialText(
+        material_id=material_id,
+        codec=TEXT_CODEC,
+        compressed_text=compress_text(text),
+        raw_size=_get_text_size(text)
+    ))
+
+
+def load_material_text(db_session, material_id: int) -> Optional[str]:
+    """
+    Get extracted text for a material, loading it lazily.
+    Checks the cache first, then the compressed blob table, then the legacy
+    Material.extracted_text column for rows that have not been backfilled yet.
+    """
+    cached_text = get_cached_text(material_id)
+    if cached_text is not None:
+        return cached_text
+
+    # Only one request per material goes to the database; the rest wait for it
+    return _text_db_flight.do(material_id, lambda: _load_material_text_from_db(db_session, material_id))
+
+
+def _load_material_text_from_db(db_session, material_id: int) -> Optional[str]:
+    """Load a material's text from the database and cache it"""
+    from database import Material, MaterialText
+
+    # A load that finished just before this flight started may have filled the cache
+    with _cache_lock:
+        entry = _cache.get(material_id)
+        if entry is not None and not _is_cache_expired(entry[1]):
+            return entry[0]
+
+    cache_metrics.count('database', 'text_load')
+    with cache_metrics.timed('db_text_load'):
+        row = db_session.query(MaterialText.codec, MaterialText.compressed_text).filter(
+            MaterialText.material_id == material_id
+        ).first()
+
+        if row:
+            text = decompress_text(row.compressed_text, row.codec)
+        else:
+            text = db_session.query(Material.extracted_text).filter(
+                Material.id == material_id
+            ).scalar()
+
+    if text:
+        cache_text(material_id, text)
+    return text
+
+
+def _utf8_boundary(data: bytes, pos: int) -> int:
+    """Move a byte offset forward to the start of the next UTF-8 character"""
+    pos = max(0, min(pos, len(data)))
+    while pos < len(data) and (data[pos] & 0xC0) == 0x80:
+        pos += 1
+    return pos
+
+
+def get_cached_text_range(material_id: int, start: int, length: int) -> Optional[Dict]:
+    """
+    Read a byte range of cached text from the disk tier via mmap.
+    Only the requested range is decoded. Returns None on a miss.
+    """
+    cache_file = _get_cache_file_path(material_id)
+    try:
+        cache_info = _index_get(material_id)
+        if cache_info is None or _is_cache_expired(cache_info[0]) or not cache_file.exists():
+            return None
+        
+        with cache_metrics.timed('disk_range_read'):
+            text, begin, end, total_bytes = _read_cache_file(cache_file, start, length)
+        _index_touch(material_id)
+        cache_metrics.count('disk', 'range_hit')
+        cache_metrics.add_disk_bytes_read(end - begin)
+    except Exception as e:
+        print(f"Error reading cache range from disk for material {material_id}: {e}")
+        return None
+    
+    return {
+        'text': text,
+        'start': begin,
+        'end': end,
+        'total_bytes': total_bytes
+    }
+
+
+def load_material_text_range(db_session, material_id: int, start: int, length: int) -> Optional[Dict]:
+    """
+    Get a byte range of a material's extracted text.
+    Offsets are UTF-8 byte offsets, snapped forward to character boundaries so
+    consecutive ranges (next_start) concatenate back to the full text.
+    Returns None if the material has no text.
+    """
+    # Serve straight from the mmapped disk file when possible
+    text_range = get_cached_text_range(material_id, start, length)
+    if text_range is not None:
+        return text_range
+    
+    text = load_material_text(db_session, material_id)
+    if text is None:
+        return None
+
+    data = text.encode('utf-8')
+    begin = _utf8_boundary(data, start)
+    end = _utf8_boundary(data, begin + length)
+
+    return {
+        'text': data[begin:end].decode('utf-8'),
+        'start': begin,
+        'end': end,
+        'total_bytes': len(data)
+    }
+
+
+def delete_material_text(db_session, material_id: int):
+    """
+    Delete stored text for a material and drop it from the cache.
+    The caller is responsible for committing the session.
+    """
+    from database import MaterialText
+
+    invalidate_cache(material_id)
+    db_session.query(MaterialText).filter(
+        MaterialText.material_id == material_id
+    ).delete(synchronize_session=False)
 
 
 def get_cache_stats() -> Dict:
     """Get cache statistics"""
-    global _cache, _total_cache_size
+    disk_cache_count, disk_cache_size = _index_totals()
     
-    metadata = _load_cache_metadata()
-    disk_cache_count = len([f for f in CACHE_DIR.glob("material_*.cache")])
+    with _cache_lock:
+        in_memory_entries = len(_cache)
+        total_size = _total_cache_size
     
-    return {
-        'in_memory_entries': len(_cache),
-        'total_size_mb': round(_total_cache_size / (1024 * 1024), 2),
+    stats = {
+        'in_memory_entries': in_memory_entries,
+        'total_size_mb': round(total_size / (1024 * 1024), 2),
         'disk_cache_entries': disk_cache_count,
+        'disk_size_mb': round(disk_cache_size / (1024 * 1024), 2),
         'max_size_mb': MAX_CACHE_SIZE_MB,
+        'admission_policy': CACHE_ADMISSION_POLICY,
+        'admission_rejections': cache_metrics.get('memory', 'admission_rejection'),
+        'max_disk_size_mb': MAX_DISK_CACHE_SIZE_MB,
         'cache_dir': str(CACHE_DIR)
     }
+    stats.update(get_vector_cache_stats())
+    stats['single_flight'] = get_single_flight_stats()
+    
+    from shared_corpus import get_shared_corpus_stats
+    stats.update(get_shared_corpus_stats())
+    
+    stats['metrics'] = cache_metrics.snapshot()
+    return stats
+
+
+def get_cache_metrics_prometheus() -> str:
+    """Cache metrics and sizes in Prometheus text exposition format"""
+    stats = get_cache_stats()
+    disk_entries, disk_bytes = _index_totals()
+    with _cache_lock:
+        memory_bytes = _total_cache_size
+    with _vector_cache_lock:
+        vector_bytes = _vector_cache_size
+    mb = 1024 * 1024
+    gauges = {
+        'memory_entries': stats['in_memory_entries'],
+        'memory_bytes': memory_bytes,
+        'memory_budget_bytes': MAX_CACHE_SIZE_MB * mb,
+        'disk_entries': disk_entries,
+        'disk_bytes': disk_bytes,
+        'disk_budget_bytes': MAX_DISK_CACHE_SIZE_MB * mb,
+        'vector_materials': stats['vector_materials'],
+        'vector_chunks': stats['vector_chunks'],
+        'vector_bytes': vector_bytes,
+        'vector_budget_bytes': MAX_VECTOR_CACHE_SIZE_MB * mb,
+        'shared_corpus_entries': stats.get('shared_corpus_entries', 0),
+    }
+    for group, flight_stats in stats['single_flight'].items():
+        gauges[f'single_flight_loads{{group="{group}"}}'] = flight_stats['loads']
+        gauges[f'single_flight_coalesced{{group="{group}"}}'] = flight_stats['coalesced']
+        gauges[f'single_flight_in_flight{{group="{group}"}}'] = flight_stats['in_flight']
+    return cache_metrics.render_prometheus(gauges)
 
 
-# Vector entries cache for RAG performance
-_vector_entries_cache: Dict[int, list] = {}  # material_id -> list of vector entries
-_vector_cache_timestamp: Dict[int, float] = {}  # material_id -> last cache time
+# Vector entries cache for RAG performance.
+# Entries are keyed by a per-material version instead of a wall-clock TTL:
+# a material's chunks never change while its version stays the same, so
+# immutable system textbooks stay cached for the life of the process.
+# Each material is held as one compact VectorBlock, and the tier is bounded
+# by MAX_VECTOR_CACHE_SIZE_MB with LRU eviction like the text cache.
 
-def get_cached_vector_entries(material_id: int) -> Optional[list]:
-    """Get cached vector entries for a material"""
-    if material_id in _vector_entries_cache:
-        # Check if cache is still valid (5 minutes)
-        if time.time() - _vector_cache_timestamp.get(material_id, 0) < 300:
-            return _vector_entries_cache[material_id]
-        else:
-            # Expired, remove from cache
-            del _vector_entries_cache[material_id]
-            if material_id in _vector_cache_timestamp:
-                del _vector_cache_timestamp[material_id]
-    return None
+class VectorBlock:
+    """
+    All vector entries of one material in compact form.
+    Embeddings are one flat float32 array (row i is embeddings[i*dim:(i+1)*dim])
+    instead of a Python float list per chunk. The arrays may also be memoryviews
+    over the shared corpus files (see shared_corpus.py).
+    """
+    __slots__ = ('material_id', 'user_id', 'version', 'dim', 'ids', 'chunk_indexes',
+                 'embeddings', 'contents', 'metadata', 'size_bytes')
+
+    def __init__(self, material_id: int, user_id: str, version: str, dim: int,
+                 ids, chunk_indexes, embeddings, contents, metadata,
+                 size_bytes: Optional[int] = None):
+        self.material_id = material_id
+        self.user_id = user_id
+        self.version = version
+        self.dim = dim
+        self.ids = ids
+        self.chunk_indexes = chunk_indexes
+        self.embeddings = embeddings
+        self.contents = contents
+        self.metadata = metadata
+        self.size_bytes = _estimate_block_size(self) if size_bytes is None else size_bytes
+
+    def __len__(self) -> int:
+        return len(self.ids)
 
+    def embedding(self, i: int):
+        """Embedding of the i-th entry (a slice of the flat array)"""
+        return self.embeddings[i * self.dim:(i + 1) * self.dim]
 
-def cache_vector_entries(material_id: int, vector_entries: list):
-    """Cache vector entries for a material"""
-    _vector_entries_cache[material_id] = vector_entries
-    _vector_cache_timestamp[material_id] = time.time()
+    def dot_scores(self, query_embedding) -> list:
+        """Dot product of the query against every entry in the block"""
+        dim = self.dim
+        if len(query_embedding) != dim:
+            return [0.0] * len(self)
+        embeddings = self.embeddings
+        return [
+            sum(a * b for a, b in zip(query_embedding, embeddings[start:start + dim]))
+            for start in range(0, len(embeddings), dim)
+        ]
+
+
+def _estimate_block_size(block: VectorBlock) -> int:
+    """Approximate memory held by a VectorBlock in bytes"""
+    size = 200  # object, lists and arrays overhead
+    size += block.embeddings.itemsize * len(block.embeddings)
+    size += block.ids.itemsize * len(block.ids) + block.chunk_indexes.itemsize * len(block.chunk_indexes)
+    for content in block.contents:
+        size += 50 + len(content)
+    for metadata in block.metadata:
+        size += 100 + len(json.dumps(metadata, default=str)) if metadata else 16
+    return size
+
+
+def build_vector_block(material_id: int, version: str, rows) -> Optional[VectorBlock]:
+    """Build a VectorBlock from VectorIndexEntry rows of one material (ordered by chunk)"""
+    if not rows:
+        return None
+
+    dim = len(rows[0].embedding or [])
+    ids = array('q')
+    chunk_indexes = array('i')
+    embeddings = array('f')
+    contents = []
+    metadata = []
+    for row in rows:
+        embedding = row.embedding or []
+        if len(embedding) != dim:
+            print(f"Skipping vector entry {row.id} of material {material_id}: embedding dimension {len(embedding)} != {dim}")
+            continue
+        ids.append(row.id)
+        chunk_indexes.append(row.chunk_index or 0)
+        embeddings.extend(embedding)
+        contents.append(row.content)
+        metadata.append(row.vector_metadata or {})
+
+    return VectorBlock(material_id, rows[0].user_id, version, dim,
+                       ids, chunk_indexes, embeddings, contents, metadata)
+
+
+_vector_cache: "OrderedDict[int, VectorBlock]" = OrderedDict()  # material_id -> VectorBlock (LRU order)
+_vector_cache_size = 0
+_vector_cache_lock = threading.Lock()
+# Negative markers: processed materials that have no vector entries at this version
+_empty_vector_versions: "OrderedDict[int, str]" = OrderedDict()  # material_id -> version (LRU order)
+MAX_EMPTY_VECTOR_MARKERS = 10000
+
+def material_vector_version(processed_at, chunk_count) -> str:
+    """Version of a material's vector entries; changes whenever it is (re)processed"""
+    processed = processed_at.isoformat() if processed_at else ""
+    return f"{processed}:{chunk_count or 0}"
+
+
+def get_cached_vector_entries(material_id: int, version: str) -> Optional[VectorBlock]:
+    """Get the cached VectorBlock for a material if it matches the given version"""
+    global _vector_cache_size
+    with _vector_cache_lock:
+        block = _vector_cache.get(material_id)
+        if block is None:
+            cache_metrics.count('vector', 'miss')
+            return None
+        if block.version != version:
+            # Material was reprocessed; drop the stale entries
+            del _vector_cache[material_id]
+            _vector_cache_size -= block.size_bytes
+            cache_metrics.count('vector', 'miss')
+            cache_metrics.count('vector', 'invalidation')
+            return None
+        _vector_cache.move_to_end(material_id)
+        cache_metrics.count('vector', 'hit')
+        return block
+
+
+def cache_vector_entries(material_id: int, block: VectorBlock):
+    """Cache a material's VectorBlock, evicting least recently used blocks to stay in budget"""
+    global _vector_cache_size
+    max_size_bytes = MAX_VECTOR_CACHE_SIZE_MB * 1024 * 1024
+    if block.size_bytes > max_size_bytes:
+        return
+
+    with _vector_cache_lock:
+        old_block = _vector_cache.pop(material_id, None)
+        if old_block is not None:
+            _vector_cache_size -= old_block.size_bytes
+
+        while _vector_cache and _vector_cache_size + block.size_bytes > max_size_bytes:
+            _, evicted = _vector_cache.popitem(last=False)
+            _vector_cache_size -= evicted.size_bytes
+            cache_metrics.count('vector', 'eviction')
+
+        _vector_cache[material_id] = block
+        _vector_cache_size += block.size_bytes
+        _empty_vector_versions.pop(material_id, None)
+
+
+def _has_no_vector_entries(material_id: int, version: str) -> bool:
+    """True if the material is known to have no vector entries at this version"""
+    with _vector_cache_lock:
+        if _empty_vector_versions.get(material_id) != version:
+            return False
+        _empty_vector_versions.move_to_end(material_id)
+        cache_metrics.count('vector', 'hit')
+        return True
+
+
+def _mark_no_vector_entries(material_id: int, version: str):
+    """Remember that the material has no vector entries at this version"""
+    with _vector_cache_lock:
+        _empty_vector_versions[material_id] = version
+        _empty_vector_versions.move_to_end(material_id)
+        while len(_empty_vector_versions) > MAX_EMPTY_VECTOR_MARKERS:
+            _empty_vector_versions.popitem(last=False)
 
 
 def invalidate_vector_cache(material_id: int):
     """Invalidate vector entries cache for a material"""
-    if material_id in _vector_entries_cache:
-        del _vector_entries_cache[material_id]
-    if material_id in _vector_cache_timestamp:
-        del _vector_cache_timestamp[material_id]
+    global _vector_cache_size
+    with _vector_cache_lock:
+        block = _vector_cache.pop(material_id, None)
+        if block is not None:
+            _vector_cache_size -= block.size_bytes
+        _empty_vector_versions.pop(material_id, None)
+
+
+def get_vector_cache_stats() -> Dict:
+    """Get vector cache statistics"""
+    with _vector_cache_lock:
+        return {
+            'vector_materials': len(_vector_cache),
+            'vector_chunks': sum(len(block) for block in _vector_cache.values()),
+            'vector_size_mb': round(_vector_cache_size / (1024 * 1024), 2),
+            'vector_empty_materials': len(_empty_vector_versions),
+            'max_vector_size_mb': MAX_VECTOR_CACHE_SIZE_MB,
+            'vector_evictions': cache_metrics.get('vector', 'eviction')
+        }
+
+
+def load_vector_blocks(db_session, materials) -> list:
+    """
+    Get VectorBlocks for a set of materials, serving from the shared corpus or
+    the cache where possible. materials are rows with id, processed_at and
+    chunk_count. Materials missing from both (or cached at an older version)
+    are loaded in a single query. Materials without vector entries are omitted,
+    and remembered per version so they are not queried again until reprocessed.
+    """
+    from database import VectorIndexEntry
+    from shared_corpus import get_shared_block
+
+    blocks = []
+    missing = {}
+    for material in materials:
+        version = material_vector_version(material.processed_at, material.chunk_count)
+        cache_metrics.record_access('vectors', material.id)
+        if _has_no_vector_entries(material.id, version):
+            continue
+        block = get_shared_block(material.id, version)
+        if block is not None:
+            cache_metrics.count('shared_corpus', 'hit')
+        else:
+            block = get_cached_vector_entries(material.id, version)
+        if block is not None:
+            blocks.append(block)
+        else:
+            missing[material.id] = version
+
+    if not missing:
+        return blocks
+
+    # Load only the materials no other request is already loading; wait for the rest
+    leading = {}
+    waiting = []
+    for material_id, version in missing.items():
+        call, is_leader = _vector_flight.begin((material_id, version))
+        if is_leader:
+            leading[material_id] = call
+        else:
+            waiting.append(call)
+
+    loaded = {material_id: None for material_id in leading}
+    try:
+        if leading:
+            cache_metrics.count('database', 'vector_load', len(leading))
+            rows_by_material = {material_id: [] for material_id in leading}
+            with cache_metrics.timed('db_vector_load'):
+                rows = db_session.query(VectorIndexEntry).filter(
+                    VectorIndexEntry.source_id.in_(list(leading)),
+                    VectorIndexEntry.source_type == "material"
+                ).order_by(VectorIndexEntry.source_id, VectorIndexEntry.chunk_index).all()
+            for row in rows:
+                rows_by_material[row.source_id].append(row)
+
+            for material_id, material_rows in rows_by_material.items():
+                block = build_vector_block(material_id, missing[material_id], material_rows)
+                if block is not None:
+                    cache_vector_entries(material_id, block)
+                else:
+                    _mark_no_vector_entries(material_id, missing[material_id])
+                loaded[material_id] = block
+    except BaseException as e:
+        for material_id, call in leading.items():
+            _vector_flight.finish((material_id, missing[material_id]), call, error=e)
+        raise
+
+    for material_id, call in leading.items():
+        _vector_flight.finish((material_id, missing[material_id]), call, result=loaded[material_id])
+
+    for block in list(loaded.values()) + [call.wait() for call in waiting]:
+        if block is not None:
+            blocks.append(block)
+
+    return blocks
 
 
 def preload_system_materials(db_session, system_user_id: str = "SYSTEM"):
     """
     Preload system materials into cache.
     Useful for warming up the cache on server startup.
+    When the shared corpus is available, embeddings are mapped from it and texts
+    only go to the disk tier (shared by all workers) instead of every worker's memory.
+    Rows are streamed with yield_per so no query holds the whole corpus at once.
     """
-    from database import Material, VectorIndexEntry
-    
+    from database import Material, MaterialText, VectorIndexEntry
+    from shared_corpus import ensure_shared_corpus, get_shared_block
+
+    shared = False
     try:
-        system_materials = db_session.query(Material).filter(
-            Material.user_id == system_user_id,
-            Material.status == "processed",
-            Material.extracted_text.isnot(None)
-        ).all()
-        
-        loaded_count = 0
-        vector_loaded_count = 0
-        
-        for material in system_materials:
-            if material.extracted_text:
-                cache_text(material.id, material.extracted_text)
+        shared = ensure_shared_corpus(db_session, system_user_id)
+    except Exception as e:
+        print(f"Warning: Could not build shared corpus, preloading per worker: {e}")
+
+    system_materials = db_session.query(
+        Material.id, Material.processed_at, Material.chunk_count
+    ).filter(
+        Material.user_id == system_user_id,
+        Material.status == "processed"
+    ).all()
+
+    # Texts: one query streaming the compressed blobs of materials not cached yet
+    pending_ids = [
+        material.id for material in system_materials
+        if not (shared and _index_get(material.id) is not None)
+    ]
+    loaded_count = len(system_materials) - len(pending_ids)
+    if pending_ids:
+        text_rows = db_session.query(
+            Material.id, MaterialText.codec, MaterialText.compressed_text
+        ).outerjoin(
+            MaterialText, MaterialText.material_id == Material.id
+        ).filter(
+            Material.id.in_(pending_ids)
+        ).yield_per(20)
+
+        legacy_ids = []
+        for row in text_rows:
+            if row.compressed_text is None:
+                legacy_ids.append(row.id)
+                continue
+            cache_text(row.id, decompress_text(row.compressed_text, row.codec), memory=not shared)
+            loaded_count += 1
+
+        # Not backfilled yet - fall back to the legacy column
+        for material_id in legacy_ids:
+            if load_material_text(db_session, material_id):
                 loaded_count += 1
-            
-            # Also preload vector entries for RAG performance
-            vector_entries = db_session.query(VectorIndexEntry).filter(
-                VectorIndexEntry.source_id == material.id,
-                VectorIndexEntry.source_type == "material"
-            ).all()
-            
-            if vector_entries:
-                # Convert to serializable format
-                cached_entries = []
-                for entry in vector_entries:
-                    cached_entries.append({
-                        'id': entry.id,
-                        'content': entry.content,
-                        'embedding': entry.embedding,
-                        'metadata': entry.vector_metadata,
-                        'chunk_index': entry.chunk_index
-                    })
-                cache_vector_entries(material.id, cached_entries)
-                vector_loaded_count += 1
+
+    # Vectors: materials in the shared corpus are served from the mapped files;
+    # the rest come from one query grouped by material as rows stream in
+    versions = {m.id: material_vector_version(m.processed_at, m.chunk_count) for m in system_materials}
+    vector_loaded_count = 0
+    pending_vector_ids = []
+    for material_id, version in versions.items():
+        if shared and get_shared_block(material_id, version) is not None:
+            vector_loaded_count += 1
+            continue
+        pending_vector_ids.append(material_id)
+
+    if pending_vector_ids:
+        vector_rows = db_session.query(VectorIndexEntry).filter(
+            VectorIndexEntry.source_id.in_(pending_vector_ids),
+            VectorIndexEntry.source_type == "material"
+        ).order_by(VectorIndexEntry.source_id, VectorIndexEntry.chunk_index).yield_per(500)
+
+        def flush(material_id, rows):
+            block = build_vector_block(material_id, versions[material_id], rows)
+            if block is not None:
+                cache_vector_entries(material_id, block)
+                return 1
+            return 0
+
+        current_id = None
+        current_rows = []
+        for row in vector_rows:
+            if row.source_id != current_id:
+                if current_rows:
+                    vector_loaded_count += flush(current_id, current_rows)
+                current_id = row.source_id
+                current_rows = []
+            current_rows.append(row)
+        if current_rows:
+            vector_loaded_count += flush(current_id, current_rows)
+
+    print(f"Preloaded {loaded_count} system materials text and {vector_loaded_count} vector entry sets into cache")
+    return loaded_count
+
+
+# Background warmup state, reported by the /ready endpoint
+_warmup_status = {
+    'state': 'pending',  # pending, running, ready, failed
+    'started_at': None,
+    'finished_at': None,
+    'materials_loaded': 0,
+    'attempts': 0,
+    'error': None
+}
+_warmup_lock = threading.Lock()
+WARMUP_MAX_ATTEMPTS = 3  # A preload that fails (e.g. database not reachable yet) is retried
+WARMUP_RETRY_SECONDS = 10  # Doubled after each failed attempt
+
+def start_background_warmup(system_user_id: str = "SYSTEM") -> threading.Thread:
+    """
+    Warm the cache in a daemon thread so startup does not block on it.
+    The worker serves traffic immediately; get_warmup_status() reports when it is warm.
+    A failed preload is retried WARMUP_MAX_ATTEMPTS times before the state becomes 'failed'.
+    """
+    def warmup():
+        from database import get_session_local
+
+        with _warmup_lock:
+            _warmup_status['state'] = 'running'
+            _warmup_status['started_at'] = time.time()
+
+        db = get_session_local()()
+        for attempt in range(1, WARMUP_MAX_ATTEMPTS + 1):
+            with _warmup_lock:
+                _warmup_status['attempts'] = attempt
+            try:
+                loaded = preload_system_materials(db, system_user_id)
+                with _warmup_lock:
+                    _warmup_status['materials_loaded'] = loaded
+                    _warmup_status['state'] = 'ready'
+                    _warmup_status['error'] = None
+                print("Material cache initialized")
+                break
+            except Exception as e:
+                db.rollback()
+                with _warmup_lock:
+                    _warmup_status['error'] = str(e)
+                    if attempt == WARMUP_MAX_ATTEMPTS:
+                        _warmup_status['state'] = 'failed'
+                print(f"Warning: Could not preload system materials (attempt {attempt}/{WARMUP_MAX_ATTEMPTS}): {e}")
+                if attempt < WARMUP_MAX_ATTEMPTS:
+                    time.sleep(WARMUP_RETRY_SECONDS * 2 ** (attempt - 1))
+        with _warmup_lock:
+            _warmup_status['finished_at'] = time.time()
         
-        print(f"Preloaded {loaded_count} system materials text and {vector_loaded_count} vector entry sets into cache")
-        return loaded_count
-    except Exception as e:
-        print(f"Error preloading system materials: {e}")
-        return 0
+        # Readiness only waits for system materials; the user hot set follows
+        try:
+            restore_hot_set(db)
+        except Exception as e:
+            print(f"Warning: Could not restore cache hot set: {e}")
+        finally:
+            db.close()
+
+    thread = threading.Thread(target=warmup, name="cache-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_warmup_status() -> Dict:
+    """Get the background warmup state"""
+    with _warmup_lock:
+        status = dict(_warmup_status)
+    if status['started_at'] is not None:
+        end = status['finished_at'] or time.time()
+        status['duration_seconds'] = round(end - status['started_at'], 2)
+    return status
 
 
+# Warm-restart snapshots: the ids of the hottest text and vector entries are
+# saved periodically so a restarted worker can reload them instead of starting cold.
+_snapshot_thread: Optional[threading.Thread] = None
+_snapshot_stop = threading.Event()
+
+def _get_snapshot_path() -> Path:
+    """Get the path of the hot-set snapshot file"""
+    return CACHE_DIR / "hot_set.json"
+
+
+def _read_snapshot() -> Dict:
+    """
+    The snapshot's hot ids per tier, plus when each id was last reported
+    ('seen': tier -> {id: time}). Files without 'seen' count as seen at saved_at.
+    """
+    try:
+        with open(_get_snapshot_path(), 'r') as f:
+            snapshot = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'text': [], 'vectors': [], 'seen': {'text': {}, 'vectors': {}}}
+
+    saved_at = snapshot.get('saved_at', time.time())
+    result = {'seen': {}}
+    for tier in ('text', 'vectors'):
+        ids = list(snapshot.get(tier, []))
+        seen = snapshot.get('seen', {}).get(tier, {})
+        result[tier] = ids
+        result['seen'][tier] = {material_id: seen.get(str(material_id), saved_at) for material_id in ids}
+    return result
+
+
+def _merge_hot_ids(own: list, existing: list, seen: Dict[int, float], now: float):
+    """
+    This worker's ids first (hottest first), then other workers' ids not already
+    listed. Ids no worker has reported for SNAPSHOT_MAX_AGE intervals are dropped,
+    so a material that went cold (or was deleted) leaves the file.
+    Returns (ids, {id: last seen}).
+    """
+    max_age = SNAPSHOT_MAX_AGE * (SNAPSHOT_INTERVAL_SECONDS or 300)
+    merged = list(own)
+    last_seen = {material_id: now for material_id in own}
+    for material_id in existing:
+        if material_id in last_seen or now - seen.get(material_id, now) > max_age:
+            continue
+        merged.append(material_id)
+        last_seen[material_id] = seen.get(material_id, now)
+    merged = merged[:SNAPSHOT_MAX_ENTRIES]
+    return merged, {material_id: last_seen[material_id] for material_id in merged}
+
+
+def snapshot_hot_set() -> Dict:
+    """
+    Save the ids of the hottest cached entries, most recently used first.
+    Workers share one file: each merges its own hot set ahead of what is already
+    there, under an exclusive flock so concurrent snapshots don't drop each other's ids.
+    """
+    with _cache_lock:
+        text_ids = list(reversed(_cache))[:SNAPSHOT_MAX_ENTRIES]
+    with _vector_cache_lock:
+        vector_ids = list(reversed(_vector_cache))[:SNAPSHOT_MAX_ENTRIES]
+
+    snapshot_path = _get_snapshot_path()
+    with open(snapshot_path.with_name("hot_set.lock"), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            existing = _read_snapshot()
+            now = time.time()
+            text, text_seen = _merge_hot_ids(text_ids, existing['text'], existing['seen']['text'], now)
+            vectors, vector_seen = _merge_hot_ids(vector_ids, existing['vectors'], existing['seen']['vectors'], now)
+            snapshot = {
+                'saved_at': now,
+                'text': text,
+                'vectors': vectors,
+                'seen': {'text': text_seen, 'vectors': vector_seen}
+            }
+
+            tmp_file = snapshot_path.with_name(f"{snapshot_path.name}.{os.getpid()}.tmp")
+            with open(tmp_file, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_file, snapshot_path)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return snapshot
+
+
+def restore_hot_set(db_session) -> Dict:
+    """
+    Reload the snapshotted hot set, hottest first, stopping at each tier's memory budget.
+    Deleted or unprocessed materials are skipped.
+    """
+    from database import Material
+
+    snapshot = _read_snapshot()
+    restored = {'text': 0, 'vectors': 0}
+    max_text_bytes = MAX_CACHE_SIZE_MB * 1024 * 1024
+    max_vector_bytes = MAX_VECTOR_CACHE_SIZE_MB * 1024 * 1024
+
+    for material_id in snapshot['text']:
+        with _cache_lock:
+            if _total_cache_size >= max_text_bytes:
+                break
+        if load_material_text(db_session, material_id) is not None:
+            restored['text'] += 1
+
+    vector_ids = snapshot['vectors']
+    batch_size = 50
+    for i in range(0, len(vector_ids), batch_size):
+        with _vector_cache_lock:
+            if _vector_cache_size >= max_vector_bytes:
+                break
+        batch = vector_ids[i:i + batch_size]
+        materials = db_session.query(Material.id, Material.processed_at, Material.chunk_count).filter(
+            Material.id.in_(batch),
+            Material.status == "processed"
+        ).all()
+        restored['vectors'] += len(load_vector_blocks(db_session, materials))
+
+    # Loading hottest-first left the hottest entries oldest in LRU order; flip them back
+    with _cache_lock:
+        for material_id in reversed(snapshot['text']):
+            if material_id in _cache:
+                _cache.move_to_end(material_id)
+    with _vector_cache_lock:
+        for material_id in reversed(vector_ids):
+            if material_id in _vector_cache:
+                _vector_cache.move_to_end(material_id)
+
+    if snapshot['text'] or vector_ids:
+        print(f"Restored hot set: {restored['text']} texts and {restored['vectors']} vector sets")
+    return restored
+
+
+def start_snapshot_thread() -> Optional[threading.Thread]:
+    """Snapshot the hot set every SNAPSHOT_INTERVAL_SECONDS in a daemon thread"""
+    global _snapshot_thread
+    if SNAPSHOT_INTERVAL_SECONDS <= 0 or (_snapshot_thread is not None and _snapshot_thread.is_alive()):
+        return _snapshot_thread
+
+    def run():
+        while not _snapshot_stop.wait(SNAPSHOT_INTERVAL_SECONDS):
+            try:
+                snapshot_hot_set()
+            except Exception as e:
+                print(f"Error saving cache snapshot: {e}")
+
+    _snapshot_stop.clear()
+    _snapshot_thread = threading.Thread(target=run, name="cache-snapshot", daemon=True)
+    _snapshot_thread.start()
+    return _snapshot_thread
+
+
+def stop_snapshot_thread():
+    """Stop the snapshot thread and save a final snapshot"""
+    _snapshot_stop.set()
+    if SNAPSHOT_INTERVAL_SECONDS > 0:
+        try:
+            snapshot_hot_set()
+        except Exception as e:
+            print(f"Error saving cache snapshot: {e}")
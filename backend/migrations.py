@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations for existing databases.
+
+init_db() creates a fresh schema from the models; this script brings databases
+that already hold data up to date without locking hot tables.
+
+This script will:
+1. Record applied migrations in main.schema_migrations
+2. Apply pending migrations in version order (index builds use CREATE INDEX
+   CONCURRENTLY, which must run outside a transaction)
+3. EXPLAIN the hot endpoint queries and check they use the expected indexes
+
+Usage:
+    python migrations.py status
+    python migrations.py upgrade [--target N] [--dry-run]
+    python migrations.py check
+"""
+
+import argparse
+import json
+import sys
+from datetime import date
+from typing import Callable, Dict, List
+
+from sqlalchemy import select, func, text
+from sqlalchemy.dialects import postgresql
+
+from database import get_engine, ChatMessage, Material, VectorIndexEntry, CarePlan, LearningPlanProgress
+from partition_maintenance import add_months, ensure_partitions, is_partitioned
+
+MIGRATIONS_TABLE = "main.schema_migrations"
+MIGRATION_LOCK_ID = 7_310_041  # pg_advisory_lock key so two deploys never migrate at once
+
+
+class Migration:
+    """One schema change. Non-transactional migrations run in autocommit mode."""
+
+    def __init__(self, version: int, name: str, upgrade: Callable, transactional: bool = True):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+        self.transactional = transactional
+
+
+MIGRATIONS: List[Migration] = []
+
+def migration(version: int, name: str, transactional: bool = True):
+    """Register the decorated function as a migration"""
+    def register(upgrade: Callable) -> Callable:
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version, name, upgrade, transactional))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return upgrade
+    return register
+
+
+def create_index_concurrently(conn, name: str, table: str, columns: str, unique: bool = False):
+    """
+    Build an index without blocking writes. An interrupted CONCURRENTLY build
+    leaves an INVALID index behind; it is dropped and rebuilt.
+    """
+    schema, _, _ = table.rpartition('.')
+    schema = schema or 'public'
+    is_valid = conn.execute(text("""
+        SELECT i.indisvalid
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = :name AND n.nspname = :schema
+    """), {"name": name, "schema": schema}).scalar()
+
+    if is_valid:
+        return
+    unique_sql = "UNIQUE " if unique else ""
+
+    is_partitioned = conn.execute(text("SELECT relkind = 'p' FROM pg_class WHERE oid = CAST(:table AS regclass)"),
+                                  {"table": table}).scalar()
+    if is_partitioned:
+        # Partitioned tables cannot be indexed CONCURRENTLY: create the index on the
+        # parent only (instant, starts invalid), build each partition's index
+        # concurrently and attach it; the parent index turns valid once all are attached.
+        conn.execute(text(f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON ONLY {table} ({columns})"))
+        partitions = conn.execute(text("""
+            SELECT n.nspname, c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE i.inhparent = CAST(:table AS regclass)
+        """), {"table": table}).all()
+        for partition_schema, partition in partitions:
+            partition_index = f"{partition}_{name}"[:63]
+            create_index_concurrently(conn, partition_index, f"{partition_schema}.{partition}", columns, unique)
+            conn.execute(text(f"ALTER INDEX {schema}.{name} ATTACH PARTITION {partition_schema}.{partition_index}"))
+        return
+
+    if is_valid is False:
+        print(f"   Dropping invalid index {schema}.{name} left by an interrupted build")
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {schema}.{name}"))
+
+    conn.execute(text(f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+# Migrations - append new ones with the next version number. Never edit one that has shipped.
+
+@migration(1, "hot_path_composite_indexes", transactional=False)
+def _hot_path_composite_indexes(conn):
+    # Same names as the Index() declarations in database.py, so fresh and migrated databases match
+    create_index_concurrently(conn, "ix_vector_index_entries_source", "vector_index_entries",
+                              "source_type, source_id, user_id")
+    create_index_concurrently(conn, "ix_materials_user_status", "main.materials", "user_id, status")
+    create_index_concurrently(conn, "ix_learning_plan_progress_user_plan", "main.learning_plan_progress",
+                              "user_id, learning_plan_id, quiz_submitted")
+    create_index_concurrently(conn, "ix_chat_messages_session_timestamp", "user_data.chat_messages",
+                              "session_id, timestamp")
+    create_index_concurrently(conn, "ix_care_plans_user_created", "main.care_plans", "user_id, created_at")
+
+
+# Per-user activity counts from scratch; used to (re)fill user_data.user_activity_summary
+_ACTIVITY_SUMMARY_BACKFILL = """
+        INSERT INTO user_data.user_activity_summary
+            (user_id, total_messages, total_interactions, last_activity_at)
+        SELECT user_id, SUM(messages), SUM(interactions), MAX(last_activity_at)
+        FROM (
+            SELECT user_id, COUNT(*) AS messages, 0 AS interactions, MAX(timestamp) AS last_activity_at
+            FROM user_data.chat_messages WHERE user_id IS NOT NULL GROUP BY user_id
+            UNION ALL
+            SELECT user_id, 0, COUNT(*), MAX(timestamp)
+            FROM user_data.user_interactions WHERE user_id IS NOT NULL GROUP BY user_id
+        ) activity
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET total_messages = EXCLUDED.total_messages,
+            total_interactions = EXCLUDED.total_interactions,
+            last_activity_at = EXCLUDED.last_activity_at,
+            updated_at = now()
+"""
+
+
+def _install_activity_triggers(conn):
+    """(Re)create the triggers that keep user_data.user_activity_summary current"""
+    for table, kind in (("user_data.chat_messages", "messages"), ("user_data.user_interactions", "interactions")):
+        trigger = f"{table.split('.')[1]}_activity"
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger} ON {table}"))
+        conn.execute(text(f"""
+            CREATE TRIGGER {trigger} AFTER INSERT OR DELETE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION user_data.track_user_activity('{kind}')
+        """))
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}_user ON {table}"))
+        conn.execute(text(f"""
+            CREATE TRIGGER {trigger}_user AFTER UPDATE OF user_id ON {table}
+            FOR EACH ROW WHEN (OLD.user_id IS DISTINCT FROM NEW.user_id)
+            EXECUTE FUNCTION user_data.track_user_activity('{kind}')
+        """))
+
+
+@migration(2, "user_activity_summary")
+def _user_activity_summary(conn):
+    # Table matches the UserActivitySummary model; IF NOT EXISTS because init_db may have created it
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS user_data.user_activity_summary (
+            user_id UUID PRIMARY KEY,
+            total_messages INTEGER NOT NULL DEFAULT 0,
+            total_interactions INTEGER NOT NULL DEFAULT 0,
+            last_activity_at TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT now()
+        )
+    """))
+
+    # One function for both tables; TG_ARGV[0] says which counter a row belongs to
+    conn.execute(text("""
+        CREATE OR REPLACE FUNCTION user_data.track_user_activity() RETURNS trigger AS $$
+        DECLARE
+            messages_delta INTEGER := CASE WHEN TG_ARGV[0] = 'messages' THEN 1 ELSE 0 END;
+            interactions_delta INTEGER := CASE WHEN TG_ARGV[0] = 'messages' THEN 0 ELSE 1 END;
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                IF OLD.user_id IS NOT NULL THEN
+                    UPDATE user_data.user_activity_summary
+                    SET total_messages = total_messages - messages_delta,
+                        total_interactions = total_interactions - interactions_delta,
+                        updated_at = now()
+                    WHERE user_id = OLD.user_id;
+                END IF;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                IF NEW.user_id IS NOT NULL THEN
+                    INSERT INTO user_data.user_activity_summary AS s
+                        (user_id, total_messages, total_interactions, last_activity_at, updated_at)
+                    VALUES (NEW.user_id, messages_delta, interactions_delta, NEW.timestamp, now())
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET total_messages = s.total_messages + EXCLUDED.total_messages,
+                        total_interactions = s.total_interactions + EXCLUDED.total_interactions,
+                        last_activity_at = GREATEST(s.last_activity_at, EXCLUDED.last_activity_at),
+                        updated_at = now();
+                END IF;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+
+    _install_activity_triggers(conn)
+
+    # Backfill. CREATE TRIGGER holds off concurrent writes until this transaction
+    # commits, so no row is counted twice or missed.
+    conn.execute(text(_ACTIVITY_SUMMARY_BACKFILL))
+
+
+@migration(3, "unique_user_session_id", transactional=False)
+def _unique_user_session_id(conn):
+    # Concurrent first messages could create duplicate sessions; keep the oldest row of each
+    result = conn.execute(text("""
+        DELETE FROM user_data.user_session s
+        USING user_data.user_session keep
+        WHERE s.session_id = keep.session_id
+          AND (COALESCE(s.created_at, 'epoch'), s.id::text) > (COALESCE(keep.created_at, 'epoch'), keep.id::text)
+    """))
+    if result.rowcount:
+        print(f"   Removed {result.rowcount} duplicate user sessions")
+    create_index_concurrently(conn, "ux_user_session_session_id", "user_data.user_session", "session_id",
+                              unique=True)
+
+
+_ACTIVITY_TABLES = ("user_data.chat_messages", "user_data.user_interactions")
+
+# Activity tables partitioned by month: partition key column and the indexes each carries.
+# The primary key becomes (id, key column) because a partitioned table's unique
+# constraints must include the partition key.
+_PARTITIONED_TABLE_INDEXES = {
+    "user_data.chat_messages": ("timestamp", [
+        ("ix_chat_messages_session_timestamp", "session_id, timestamp"),
+        ("ix_chat_messages_timestamp", "timestamp"),
+    ]),
+    "user_data.user_interactions": ("timestamp", [
+        ("ix_user_interactions_timestamp", "timestamp"),
+    ]),
+    "public.rag_retrieval_logs": ("created_at", [
+        ("ix_rag_retrieval_logs_created_at", "created_at"),
+    ]),
+}
+
+
+def _swap_in_partitioned_table(conn, table: str, column: str, indexes):
+    """Rename table to {table}_legacy and create the empty partitioned table in its place"""
+    schema, name = table.split(".")
+    legacy = f"{table}_legacy"
+    with conn.engine.begin() as tx:
+        tx.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+        # Index names are schema-wide, so the legacy table's indexes step aside too
+        legacy_indexes = tx.execute(text("""
+            SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = CAST(:table AS regclass)
+        """), {"table": table}).scalars().all()
+        for index in legacy_indexes:
+            index_name = index.rpartition(".")[2]
+            tx.execute(text(f"ALTER INDEX {schema}.{index_name} RENAME TO {(index_name + '_legacy')[:63]}"))
+        tx.execute(text(f"ALTER TABLE {table} RENAME TO {name}_legacy"))
+
+        tx.execute(text(f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ("{column}")'))
+        tx.execute(text(f'ALTER TABLE {table} ALTER COLUMN "{column}" SET DEFAULT now(), ALTER COLUMN "{column}" SET NOT NULL'))
+        tx.execute(text(f'ALTER TABLE {table} ADD PRIMARY KEY (id, "{column}")'))
+        for index_name, columns in indexes:
+            tx.execute(text(f"CREATE INDEX {index_name} ON {table} ({columns})"))
+        # Safety net: rows outside every month partition land here instead of failing the insert
+        tx.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+        if table in _ACTIVITY_TABLES:
+            # New writes must keep the activity summary current from the first one on
+            _install_activity_triggers(tx)
+
+        # A serial id's sequence must outlive the legacy table
+        sequence = tx.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": legacy}).scalar()
+        if sequence:
+            tx.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+
+
+def _copy_legacy_rows(conn, table: str, column: str) -> int:
+    """
+    Copy {table}_legacy into the partitioned table one month per transaction, verify, drop it.
+    The partition key is NOT NULL in the new table, so legacy rows without one are
+    copied with 'epoch' (1970-01-01) in its place; the legacy rows are left as they are.
+    """
+    legacy = f"{table}_legacy"
+    columns = conn.execute(text("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = CAST(:legacy AS regclass) AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+    """), {"legacy": legacy}).scalars().all()
+    key = f'COALESCE("{column}", \'epoch\')'
+    select_list = ", ".join(f'{key} AS "{name}"' if name == column else f'"{name}"' for name in columns)
+    column_list = ", ".join(f'"{name}"' for name in columns)
+
+    without_key = conn.execute(text(f'SELECT count(*) FROM {legacy} WHERE "{column}" IS NULL')).scalar()
+    if without_key:
+        print(f"   {without_key} rows of {legacy} have no {column}; copying them with {column} = epoch")
+
+    months = conn.execute(text(
+        f"SELECT DISTINCT date_trunc('month', {key}) FROM {legacy} ORDER BY 1"
+    )).scalars().all()
+    copied = 0
+    for month in months:
+        start = month.date()
+        # Range on the bare column so its index can be used; keyless rows belong to the epoch month
+        where = f'"{column}" >= :start AND "{column}" < :end'
+        if start == date(1970, 1, 1):
+            where = f'({where}) OR "{column}" IS NULL'
+        with conn.engine.begin() as tx:
+            # ON CONFLICT makes a resumed copy skip the rows it already did
+            copied += tx.execute(text(f"""
+                INSERT INTO {table} ({column_list}) SELECT {select_list} FROM {legacy}
+                WHERE {where}
+                ON CONFLICT DO NOTHING
+            """), {"start": start, "end": add_months(start, 1)}).rowcount
+
+    missing = conn.execute(text(f"""
+        SELECT count(*) FROM {legacy} l
+        WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.id = l.id AND t."{column}" = COALESCE(l."{column}", 'epoch'))
+    """)).scalar()
+    if missing:
+        raise RuntimeError(f"{missing} rows of {legacy} were not copied; it has been kept")
+    conn.execute(text(f"DROP TABLE {legacy}"))
+    return copied
+
+
+@migration(4, "partition_activity_tables", transactional=False)
+def _partition_activity_tables(conn):
+    # Swap in an empty partitioned table under a short lock, then copy the old rows
+    # over in month-sized transactions so writers are never blocked for long.
+    # Each step can be re-run: an interrupted migration resumes where it stopped.
+    copied_activity = False
+    for table, (column, indexes) in _PARTITIONED_TABLE_INDEXES.items():
+        legacy = f"{table}_legacy"
+        if not is_partitioned(conn, table):
+            print(f"   Swapping {table} for a partitioned table")
+            _swap_in_partitioned_table(conn, table, column, indexes)
+
+        has_legacy = conn.execute(text("SELECT to_regclass(:legacy) IS NOT NULL"), {"legacy": legacy}).scalar()
+        first_month = None
+        if has_legacy:
+            oldest = conn.execute(text(f'SELECT min("{column}") FROM {legacy} WHERE "{column}" > \'epoch\'')).scalar()
+            first_month = oldest.date().replace(day=1) if oldest else None
+        created = ensure_partitions(conn, table, first_month=first_month)
+        print(f"   Created {created} month partitions for {table}")
+
+        if has_legacy:
+            copied = _copy_legacy_rows(conn, table, column)
+            print(f"   Copied {copied} rows into {table}")
+            copied_activity = copied_activity or table in _ACTIVITY_TABLES
+
+    if copied_activity:
+        # The copied rows fired the activity triggers a second time; recount
+        # with writers held off so the summary is exact again
+        with conn.engine.begin() as tx:
+            tx.execute(text("LOCK TABLE user_data.chat_messages, user_data.user_interactions IN SHARE MODE"))
+            tx.execute(text(_ACTIVITY_SUMMARY_BACKFILL))
+
+
+# Runner
+
+def _ensure_migrations_table(conn):
+    conn.execute(text("CREATE SCHEMA IF NOT EXISTS main"))
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT now()
+        )
+    """))
+
+
+def _applied_versions(conn) -> Dict[int, str]:
+    rows = conn.execute(text(f"SELECT version, applied_at FROM {MIGRATIONS_TABLE}")).all()
+    return {row.version: row.applied_at for row in rows}
+
+
+def show_status():
+    """Print every known migration and whether it has been applied"""
+    engine = get_engine()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        _ensure_migrations_table(conn)
+        applied = _applied_versions(conn)
+
+    for m in MIGRATIONS:
+        state = f"applied {applied[m.version]}" if m.version in applied else "pending"
+        print(f"   {m.version:04d} {m.name:<40} {state}")
+    pending = [m for m in MIGRATIONS if m.version not in applied]
+    print(f"\n{len(applied)} applied, {len(pending)} pending")
+    return pending
+
+
+def upgrade(target: int = None, dry_run: bool = False) -> int:
+    """Apply pending migrations up to target (default: latest). Returns the number applied."""
+    engine = get_engine()
+    applied_count = 0
+
+    # The lock connection stays open for the whole run; the advisory lock is session scoped
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        lock_conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            _ensure_migrations_table(lock_conn)
+            applied = _applied_versions(lock_conn)
+            pending = [m for m in MIGRATIONS
+                       if m.version not in applied and (target is None or m.version <= target)]
+
+            if not pending:
+                print("✅ Database schema is up to date!")
+                return 0
+
+            for m in pending:
+                if dry_run:
+                    print(f"   Would apply {m.version:04d} {m.name}")
+                    continue
+
+                print(f"⏳ Applying {m.version:04d} {m.name}...")
+                if m.transactional:
+                    with engine.begin() as conn:
+                        m.upgrade(conn)
+                        conn.execute(text(f"INSERT INTO {MIGRATIONS_TABLE} (version, name) VALUES (:v, :n)"),
+                                     {"v": m.version, "n": m.name})
+                else:
+                    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                        m.upgrade(conn)
+                        conn.execute(text(f"INSERT INTO {MIGRATIONS_TABLE} (version, name) VALUES (:v, :n)"),
+                                     {"v": m.version, "n": m.name})
+                applied_count += 1
+                print(f"   ✓ Applied {m.version:04d}")
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+    if not dry_run:
+        print(f"\n✅ Applied {applied_count} migrations!")
+    return applied_count
+
+
+# EXPLAIN checks: (description, statement, index the plan must use)
+
+_CHECK_USER = "00000000-0000-0000-0000-000000000000"
+
+def _explain_checks():
+    return [
+        ("Materials for a user by status",
+         select(Material.id, Material.processed_at, Material.chunk_count).where(
+             Material.user_id == _CHECK_USER, Material.status == "processed"),
+         "ix_materials_user_status"),
+        ("Vector entries for a set of materials",
+         select(VectorIndexEntry.id, VectorIndexEntry.chunk_index).where(
+             VectorIndexEntry.source_type == "material", VectorIndexEntry.source_id.in_([1, 2, 3])
+         ).order_by(VectorIndexEntry.source_id, VectorIndexEntry.chunk_index),
+         "ix_vector_index_entries_source"),
+        ("Vector entries of one care plan",
+         select(VectorIndexEntry.id).where(
+             VectorIndexEntry.source_type == "care_plan", VectorIndexEntry.source_id == 1),
+         "ix_vector_index_entries_source"),
+        ("Quiz attempt count",
+         select(func.count()).select_from(LearningPlanProgress).where(
+             LearningPlanProgress.user_id == _CHECK_USER,
+             LearningPlanProgress.learning_plan_id == 1,
+             LearningPlanProgress.quiz_submitted == True),
+         "ix_learning_plan_progress_user_plan"),
+        ("Chat messages of a session",
+         select(ChatMessage.id).where(ChatMessage.session_id == "check").order_by(
+             ChatMessage.timestamp.desc()).limit(50),
+         "ix_chat_messages_session_timestamp"),
+        ("Recent chat messages",
+         select(ChatMessage.id).order_by(ChatMessage.timestamp.desc()).limit(10),
+         "ix_chat_messages_timestamp"),
+        ("Care plans of a user, newest first",
+         select(CarePlan.id, CarePlan.title).where(CarePlan.user_id == _CHECK_USER).order_by(
+             CarePlan.created_at.desc()),
+         "ix_care_plans_user_created"),
+    ]
+
+
+def _plan_indexes(plan: dict) -> List[str]:
+    """Every index name referenced anywhere in an EXPLAIN (FORMAT JSON) plan"""
+    names = []
+    if "Index Name" in plan:
+        names.append(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        names.extend(_plan_indexes(child))
+    return names
+
+
+def _index_and_partitions(conn, index: str) -> List[str]:
+    """The index plus, for an index on a partitioned table, its per-partition indexes"""
+    names = conn.execute(text("""
+        SELECT child.relname
+        FROM pg_class parent
+        CROSS JOIN LATERAL pg_partition_tree(parent.oid) tree
+        JOIN pg_class child ON child.oid = tree.relid
+        WHERE parent.relname = :index AND parent.relkind IN ('i', 'I')
+    """), {"index": index}).scalars().all()
+    return [index, *names]
+
+
+def check_query_plans() -> bool:
+    """
+    EXPLAIN the hot queries and verify each uses its index. Sequential scans are
+    disabled for the check, so small development tables still show whether the
+    index is usable rather than whether it is worth it at the current row count.
+    """
+    engine = get_engine()
+    dialect = postgresql.dialect()
+    ok = True
+    # Read-only: the connection's implicit transaction is rolled back on close
+    with engine.connect() as conn:
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        for description, statement, expected in _explain_checks():
+            sql = str(statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+            raw = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}").scalar()
+            plan = (raw if isinstance(raw, list) else json.loads(raw))[0]["Plan"]
+            used = _plan_indexes(plan)
+            if set(used) & set(_index_and_partitions(conn, expected)):
+                print(f"   ✓ {description}: {expected}")
+            else:
+                ok = False
+                print(f"   ✗ {description}: expected {expected}, plan uses {used or 'no index'}")
+
+    print("\n✅ All hot queries use their indexes!" if ok else "\n⚠️  Some hot queries do not use their indexes")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Versioned schema migrations")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="List migrations and whether they are applied")
+    upgrade_parser = subparsers.add_parser("upgrade", help="Apply pending migrations")
+    upgrade_parser.add_argument("--target", type=int, help="Stop after this version")
+    upgrade_parser.add_argument("--dry-run", action="store_true", help="Only list what would be applied")
+    subparsers.add_parser("check", help="EXPLAIN hot queries and check they use their indexes")
+
+    args = parser.parse_args()
+    if args.command == "status":
+        show_status()
+    elif args.command == "upgrade":
+        upgrade(target=args.target, dry_run=args.dry_run)
+    elif args.command == "check":
+        sys.exit(0 if check_query_plans() else 1)
+
+if __name__ == "__main__":
+    main()
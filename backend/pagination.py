@@ -0,0 +1,108 @@
+"""
+Pagination Module
+
+Keyset (cursor) pagination for list endpoints, newest first. Pages are selected
+with WHERE (timestamp, id) < (last timestamp, last id) instead of OFFSET, so a
+page deep in the history costs the same as the first one. Cursors are opaque
+base64 tokens; clients pass back the next_cursor of the previous page.
+
+Works with both sync Query objects and 2.0-style select() statements.
+Nullable timestamp columns are paged on COALESCE(column, epoch), so rows
+without a timestamp come last instead of dropping out after the first page.
+"""
+
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, func, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+EPOCH = datetime(1970, 1, 1)  # Keyset timestamp of rows whose timestamp is NULL
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Encode keyset values into an opaque pagination cursor"""
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Decode an opaque pagination cursor back into keyset values"""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    """Page size within 1..MAX_PAGE_SIZE"""
+    return max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+
+def _coerce_cursor_id(id_column, last_id):
+    """Convert a cursor's id to the id column's Python type (int or UUID)"""
+    if isinstance(last_id, bool) or not isinstance(last_id, (int, str)):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        python_type = id_column.type.python_type
+    except NotImplementedError:
+        return last_id
+    try:
+        if python_type is int:
+            return int(last_id)
+        if python_type is uuid.UUID:
+            return uuid.UUID(str(last_id))
+        if python_type is str:
+            return str(last_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return last_id
+
+
+def _keyset_timestamp(timestamp_column):
+    """The column itself, or COALESCE(column, EPOCH) when it is nullable"""
+    if getattr(timestamp_column, "nullable", True):
+        return func.coalesce(timestamp_column, EPOCH)
+    return timestamp_column
+
+
+def paginate(query, timestamp_column, id_column, cursor: Optional[str], limit: int):
+    """
+    Restrict query to the page after cursor, newest first.
+    Fetches one extra row so page_result can tell whether another page exists.
+    """
+    timestamp_column = _keyset_timestamp(timestamp_column)
+    if cursor:
+        values = decode_cursor(cursor)
+        try:
+            last_timestamp, last_id = values
+            last_timestamp = datetime.fromisoformat(last_timestamp)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        last_id = _coerce_cursor_id(id_column, last_id)
+        query = query.filter(or_(
+            timestamp_column < last_timestamp,
+            and_(timestamp_column == last_timestamp, id_column < last_id)
+        ))
+    return query.order_by(timestamp_column.desc(), id_column.desc()).limit(limit + 1)
+
+
+def page_result(rows: Sequence, limit: int, key: Callable[[Any], Tuple[datetime, Any]]) -> Tuple[List, Optional[str], bool]:
+    """
+    Split the rows of a paginate() query into (page, next_cursor, has_more).
+    key returns the (timestamp, id) of a row; a None timestamp pages as EPOCH.
+    """
+    has_more = len(rows) > limit
+    page = list(rows[:limit])
+    next_cursor = None
+    if has_more:
+        timestamp, row_id = key(page[-1])
+        if not isinstance(row_id, int):
+            row_id = str(row_id)  # UUID primary keys
+        next_cursor = encode_cursor([(timestamp or EPOCH).isoformat(), row_id])
+    return page, next_cursor, has_more
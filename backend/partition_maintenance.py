@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Script to maintain the monthly partitions of the append-only activity tables
+(user_data.chat_messages, user_data.user_interactions, rag_retrieval_logs).
+
+This script will:
+1. Create the partitions for the next few months (rows that land in a table's
+   DEFAULT partition are moved into the new month partition)
+2. Detach partitions older than the retention window
+3. Export each detached partition to gzipped JSONL in the archive directory
+4. Drop the partition once its export is complete and its row count verified,
+   subtracting its rows from user_data.user_activity_summary in the same
+   transaction (dropping a partition fires no DELETE triggers), so the
+   summary counts the activity still online
+
+Partitions that were detached but not yet archived (e.g. an interrupted run)
+are picked up again on the next run. Run it daily from cron.
+
+Usage:
+    python partition_maintenance.py [--months-ahead 3] [--retention-months 12] [--archive-dir archive] [--dry-run]
+"""
+
+import argparse
+import gzip
+import os
+import re
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+load_dotenv()
+
+# Configuration
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "12"))  # Full months kept besides the current one
+PARTITION_ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "archive")
+EXPORT_BATCH_ROWS = 5000
+
+# Partitioned table -> partition key column. Must match postgresql_partition_by in database.py.
+PARTITIONED_TABLES: Dict[str, str] = {
+    "user_data.chat_messages": "timestamp",
+    "user_data.user_interactions": "timestamp",
+    "public.rag_retrieval_logs": "created_at",
+}
+
+# Activity tables counted in user_data.user_activity_summary (migrations.py version 2) -> counter column
+ACTIVITY_SUMMARY_COUNTERS: Dict[str, str] = {
+    "user_data.chat_messages": "total_messages",
+    "user_data.user_interactions": "total_interactions",
+}
+
+_PARTITION_SUFFIX = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def add_months(month: date, n: int) -> date:
+    """First day of the month n months after month"""
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def current_month() -> date:
+    return date.today().replace(day=1)
+
+
+def partition_name(table: str, month: date) -> str:
+    """Qualified name of a table's partition for month, e.g. user_data.chat_messages_p2025_01"""
+    return f"{table}_p{month.year:04d}_{month.month:02d}"
+
+
+def _split(table: str) -> Tuple[str, str]:
+    schema, _, name = table.rpartition('.')
+    return schema or 'public', name
+
+
+def is_partitioned(conn, table: str) -> bool:
+    schema, name = _split(table)
+    return bool(conn.execute(text("""
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND c.relname = :name
+    """), {"schema": schema, "name": name}).scalar())
+
+
+def _partition_exists(conn, partition: str) -> bool:
+    schema, name = _split(partition)
+    return bool(conn.execute(text("""
+        SELECT 1 FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND c.relname = :name
+    """), {"schema": schema, "name": name}).scalar())
+
+
+def _month_partitions(conn, table: str, attached: bool) -> List[Tuple[date, str]]:
+    """(month, qualified name) of the table's month partitions, attached or detached, oldest first"""
+    schema, name = _split(table)
+    rows = conn.execute(text("""
+        SELECT c.relname, EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid) AS attached
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND c.relkind = 'r' AND c.relname LIKE :pattern
+    """), {"schema": schema, "pattern": f"{name}_p%"}).all()
+
+    partitions = []
+    for relname, is_attached in rows:
+        match = _PARTITION_SUFFIX.search(relname)
+        if match and relname == f"{name}{match.group(0)}" and bool(is_attached) == attached:
+            partitions.append((date(int(match.group(1)), int(match.group(2)), 1), f"{schema}.{relname}"))
+    return sorted(partitions)
+
+
+def create_month_partition(conn, table: str, month: date) -> bool:
+    """
+    Create the partition for month if it does not exist. Returns True if created.
+    Rows for that month already sitting in the DEFAULT partition are moved into it
+    in the same transaction (Postgres refuses to create the partition otherwise).
+    """
+    column = f'"{PARTITIONED_TABLES[table]}"'  # "timestamp" is a reserved word
+    partition = partition_name(table, month)
+    if _partition_exists(conn, partition):
+        return False
+
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    default = f"{table}_default"
+    with conn.engine.begin() as tx:
+        in_default = tx.execute(text(
+            f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {column} >= :start AND {column} < :end)"
+        ), {"start": start, "end": end}).scalar()
+        if not in_default:
+            tx.execute(text(
+                f"CREATE TABLE {partition} PARTITION OF {table} FOR VALUES FROM ('{start}') TO ('{end}')"
+            ))
+        else:
+            tx.execute(text(f"CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            moved = tx.execute(text(f"""
+                WITH moved AS (
+                    DELETE FROM {default} WHERE {column} >= :start AND {column} < :end RETURNING *
+                )
+                INSERT INTO {partition} SELECT * FROM moved
+            """), {"start": start, "end": end}).rowcount
+            tx.execute(text(
+                f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES FROM ('{start}') TO ('{end}')"
+            ))
+            print(f"   Moved {moved} rows from {default} into {partition}")
+    return True
+
+
+def ensure_partitions(conn, table: str, first_month: Optional[date] = None, months_ahead: int = PARTITION_MONTHS_AHEAD) -> int:
+    """Create the DEFAULT partition and month partitions from first_month (default: this month) through months_ahead months from now"""
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"))
+    month = first_month or current_month()
+    last = add_months(current_month(), months_ahead)
+    created = 0
+    while month <= last:
+        if create_month_partition(conn, table, month):
+            created += 1
+        month = add_months(month, 1)
+    return created
+
+
+def archive_partition(conn, partition: str, archive_dir: str) -> int:
+    """
+    Export a detached partition to gzipped JSONL, verify the row count and drop it.
+    For activity tables the partition's per-user counts are taken off
+    user_data.user_activity_summary in the drop's transaction.
+    """
+    schema, name = _split(partition)
+    os.makedirs(os.path.join(archive_dir, schema), exist_ok=True)
+    path = os.path.join(archive_dir, schema, f"{name}.jsonl.gz")
+    tmp_path = path + ".tmp"
+
+    # Postgres renders each row as JSON, so the archive keeps the exact column types.
+    # Server-side cursors need a transaction, so the export uses its own connection.
+    exported = 0
+    with conn.engine.connect() as read_conn, gzip.open(tmp_path, "wt", encoding="utf-8") as out:
+        result = read_conn.execute(text(f"SELECT row_to_json(t)::text FROM {partition} t").execution_options(
+            stream_results=True, yield_per=EXPORT_BATCH_ROWS
+        ))
+        for (line,) in result:
+            out.write(line)
+            out.write("\n")
+            exported += 1
+        expected = read_conn.execute(text(f"SELECT count(*) FROM {partition}")).scalar()
+    if exported != expected:
+        os.remove(tmp_path)
+        raise RuntimeError(f"Exported {exported} rows from {partition} but it holds {expected}")
+
+    os.replace(tmp_path, path)
+    counter = ACTIVITY_SUMMARY_COUNTERS.get(_PARTITION_SUFFIX.sub("", partition))
+    with conn.engine.begin() as tx:
+        if counter:
+            tx.execute(text(f"""
+                UPDATE user_data.user_activity_summary s
+                SET {counter} = s.{counter} - archived.n, updated_at = now()
+                FROM (
+                    SELECT user_id, count(*) AS n FROM {partition}
+                    WHERE user_id IS NOT NULL GROUP BY user_id
+                ) archived
+                WHERE s.user_id = archived.user_id
+            """))
+        tx.execute(text(f"DROP TABLE {partition}"))
+    return exported
+
+
+def run_maintenance(conn, months_ahead: int = PARTITION_MONTHS_AHEAD, retention_months: int = PARTITION_RETENTION_MONTHS,
+                    archive_dir: str = PARTITION_ARCHIVE_DIR, dry_run: bool = False) -> Dict[str, Dict[str, int]]:
+    """Create upcoming partitions, then detach, archive and drop expired ones. conn must be in autocommit mode."""
+    cutoff = add_months(current_month(), -retention_months)
+    summary = {}
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(conn, table):
+            print(f"⚠️  {table} is not partitioned yet (run `python migrations.py upgrade`), skipping")
+            continue
+
+        expired = [(month, p) for month, p in _month_partitions(conn, table, attached=True) if month < cutoff]
+        leftover = _month_partitions(conn, table, attached=False)
+        if dry_run:
+            missing = sum(1 for i in range(months_ahead + 1)
+                          if not _partition_exists(conn, partition_name(table, add_months(current_month(), i))))
+            print(f"   {table}: would create {missing} partitions, archive {len(expired) + len(leftover)}")
+            continue
+
+        created = ensure_partitions(conn, table, months_ahead=months_ahead)
+        archived = 0
+        rows = 0
+        for _, partition in expired:
+            print(f"⏳ Detaching {partition}")
+            conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+        for _, partition in leftover + expired:
+            rows += archive_partition(conn, partition, archive_dir)
+            archived += 1
+            print(f"   ✓ Archived and dropped {partition}")
+        summary[table] = {"created": created, "archived": archived, "archived_rows": rows}
+        print(f"✅ {table}: {created} partitions created, {archived} archived ({rows} rows)")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create, archive and drop monthly partitions of the activity tables")
+    parser.add_argument('--months-ahead', type=int, default=PARTITION_MONTHS_AHEAD, help='Future months to create partitions for')
+    parser.add_argument('--retention-months', type=int, default=PARTITION_RETENTION_MONTHS, help='Full past months to keep online')
+    parser.add_argument('--archive-dir', default=PARTITION_ARCHIVE_DIR, help='Directory for the gzipped JSONL exports')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be done')
+
+    args = parser.parse_args()
+    from database import get_engine
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        run_maintenance(conn, args.months_ahead, args.retention_months, args.archive_dir, args.dry_run)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Query Metrics Module
+
+Counts the SQL statements each request executes and the time spent in them,
+using SQLAlchemy cursor events on the engines. The totals go out in a
+Server-Timing header; a statement shape (the SQL text with bound parameters
+as placeholders) repeated QUERY_REPEAT_THRESHOLD times in one request is
+flagged as a likely N+1 loop. Streamed responses get no header (their body
+runs after the headers are sent); their repeats are still checked once the
+body is done.
+
+assert_query_budget() checks the same numbers in tests, either around code
+running in the test's own context or on a response's Server-Timing header:
+
+    with assert_query_budget(3):
+        check_stuck_materials()
+
+    assert_response_query_budget(client.get("/api/materials", headers=auth), 3)
+"""
+
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+# Configuration
+QUERY_METRICS_ENABLED = os.getenv("QUERY_METRICS_ENABLED", "true").lower() == "true"
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))  # Same statement this often = N+1
+SHAPE_PREVIEW_CHARS = 160
+
+_SERVER_TIMING_DB = re.compile(r'(?:^|,)\s*db;[^,]*desc="(\d+) queries"')
+
+
+class QueryStats:
+    """Statements executed within one request (or one tracked block)"""
+    __slots__ = ('count', 'total_seconds', 'shapes', 'parent', '_lock')
+
+    def __init__(self, parent: Optional["QueryStats"] = None):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.shapes: Counter = Counter()
+        self.parent = parent  # Enclosing tracked block, which counts these statements too
+        # Sync endpoints and threadpool work share the request's stats object
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total_seconds += seconds
+            self.shapes[statement] += 1
+        if self.parent is not None:
+            self.parent.record(statement, seconds)
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> Dict[str, int]:
+        """Statement shapes executed at least threshold times"""
+        with self._lock:
+            return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+    @property
+    def total_ms(self) -> float:
+        return round(self.total_seconds * 1000, 3)
+
+
+# The stats object is mutable, so work in copied contexts (threadpool, tasks) adds to it
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+_hooked_engines = set()
+_hook_lock = threading.Lock()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    start = getattr(context, "_query_start", None)
+    if stats is not None and start is not None:
+        stats.record(statement, time.perf_counter() - start)
+
+
+def install_query_hooks(engine):
+    """Attach the counting hooks to a sync Engine (for an AsyncEngine pass engine.sync_engine)"""
+    if not QUERY_METRICS_ENABLED:
+        return
+    with _hook_lock:
+        if id(engine) in _hooked_engines:
+            return
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        _hooked_engines.add(id(engine))
+
+
+@contextmanager
+def track_queries():
+    """Collect the statements executed inside the block into a fresh QueryStats"""
+    stats = QueryStats(parent=_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def report_repeats(label: str, stats: QueryStats, threshold: int = QUERY_REPEAT_THRESHOLD) -> List[str]:
+    """Print a warning for each repeated statement shape; returns the shapes"""
+    repeated = stats.repeated(threshold)
+    for shape, n in sorted(repeated.items(), key=lambda item: -item[1]):
+        preview = " ".join(shape.split())[:SHAPE_PREVIEW_CHARS]
+        print(f"⚠️  Possible N+1 in {label}: {n}x {preview}")
+    return list(repeated)
+
+
+def server_timing(stats: QueryStats, total_seconds: Optional[float] = None) -> str:
+    """Server-Timing header value for a request's query stats"""
+    value = f'db;dur={stats.total_ms};desc="{stats.count} queries"'
+    repeated = stats.repeated()
+    if repeated:
+        value += f', db-repeat;desc="{len(repeated)} repeated shapes, max {max(repeated.values())}x"'
+    if total_seconds is not None:
+        value += f", total;dur={round(total_seconds * 1000, 3)}"
+    return value
+
+
+@contextmanager
+def assert_query_budget(max_queries: int, max_repeats: Optional[int] = None):
+    """
+    Fail if the block executes more than max_queries statements, or (when given)
+    any one statement shape more than max_repeats times. For tests.
+    """
+    with track_queries() as stats:
+        yield stats
+    if stats.count > max_queries:
+        shapes = "\n".join(f"  {n}x {' '.join(shape.split())[:SHAPE_PREVIEW_CHARS]}"
+                           for shape, n in stats.shapes.most_common(5))
+        raise AssertionError(f"Executed {stats.count} queries, budget is {max_queries}:\n{shapes}")
+    if max_repeats is not None:
+        over = {shape: n for shape, n in stats.shapes.items() if n > max_repeats}
+        if over:
+            shape, n = max(over.items(), key=lambda item: item[1])
+            raise AssertionError(f"Statement repeated {n}x (max {max_repeats}): {' '.join(shape.split())[:SHAPE_PREVIEW_CHARS]}")
+
+
+def assert_response_query_budget(response, max_queries: int):
+    """Fail if the request behind response executed more than max_queries statements"""
+    match = _SERVER_TIMING_DB.search(response.headers.get("server-timing", ""))
+    if match is None:
+        raise AssertionError("Response has no db Server-Timing entry (is QUERY_METRICS_ENABLED on?)")
+    count = int(match.group(1))
+    if count > max_queries:
+        raise AssertionError(f"Request executed {count} queries, budget is {max_queries}")
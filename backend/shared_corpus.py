@@ -0,0 +1,348 @@
+"""
+Shared System Corpus Module
+
+Exports the system materials' embeddings and chunk texts to a set of flat files
+that every uvicorn worker maps read-only. The pages are shared through the OS
+page cache, so RAM stays flat as workers are added and a new worker is warm as
+soon as it maps the current generation.
+
+Layout under .material_cache/shared_corpus/:
+    CURRENT                  generation number of the active file set
+    build.lock               held (flock) by the worker building a generation
+    gen_<n>/manifest.json    dim, entry count and per-material row ranges/versions
+    gen_<n>/embeddings.f32   float32 embeddings, one row of `dim` per entry
+    gen_<n>/ids.i64          VectorIndexEntry ids
+    gen_<n>/chunks.i32       chunk indexes
+    gen_<n>/texts.bin        UTF-8 chunk texts, addressed by text_offsets.u64
+    gen_<n>/meta.bin         JSON chunk metadata, addressed by meta_offsets.u64
+"""
+
+import os
+import json
+import mmap
+import shutil
+import hashlib
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Optional, Dict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from material_cache import CACHE_DIR, VectorBlock, material_vector_version
+
+SHARED_CORPUS_DIR = CACHE_DIR / "shared_corpus"
+SHARED_CORPUS_ENABLED = fcntl is not None and os.getenv("SHARED_CORPUS_ENABLED", "true").lower() == "true"
+GENERATION_CHECK_SECONDS = 5  # How often workers look for a new generation
+GENERATIONS_TO_KEEP = 2  # Older generation directories are removed after a build
+
+_corpus = None  # _MappedCorpus for the generation this worker has mapped
+_corpus_lock = threading.Lock()
+_last_generation_check = 0.0
+_rebuild_lock = threading.Lock()
+
+
+class _MappedRecords:
+    """Read-only sequence of variable-length records in a mapped file"""
+    __slots__ = ('data', 'offsets', 'start', 'end', 'as_json')
+
+    def __init__(self, data, offsets, start: int, end: int, as_json: bool = False):
+        self.data = data
+        self.offsets = offsets
+        self.start = start
+        self.end = end
+        self.as_json = as_json
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        row = self.start + i
+        value = bytes(self.data[self.offsets[row]:self.offsets[row + 1]]).decode('utf-8')
+        return json.loads(value) if self.as_json else value
+
+
+class _MappedCorpus:
+    """One generation of the shared corpus, mapped read-only"""
+
+    def __init__(self, generation: int):
+        gen_dir = _generation_dir(generation)
+        with open(gen_dir / "manifest.json") as f:
+            manifest = json.load(f)
+
+        self.generation = generation
+        self.dim = manifest['dim']
+        self.count = manifest['count']
+        self.materials = {int(k): v for k, v in manifest['materials'].items()}
+
+        self.embeddings = _map_array(gen_dir / "embeddings.f32", 'f')
+        self.ids = _map_array(gen_dir / "ids.i64", 'q')
+        self.chunk_indexes = _map_array(gen_dir / "chunks.i32", 'i')
+        self.texts = _map_array(gen_dir / "texts.bin", 'B')
+        self.text_offsets = _map_array(gen_dir / "text_offsets.u64", 'Q')
+        self.meta = _map_array(gen_dir / "meta.bin", 'B')
+        self.meta_offsets = _map_array(gen_dir / "meta_offsets.u64", 'Q')
+
+    def get_block(self, material_id: int, version: str) -> Optional[VectorBlock]:
+        info = self.materials.get(material_id)
+        if info is None or info['version'] != version:
+            return None
+
+        start, end = info['start'], info['end']
+        dim = self.dim
+        return VectorBlock(
+            material_id, info['user_id'], version, dim,
+            self.ids[start:end],
+            self.chunk_indexes[start:end],
+            self.embeddings[start * dim:end * dim],
+            _MappedRecords(self.texts, self.text_offsets, start, end),
+            _MappedRecords(self.meta, self.meta_offsets, start, end, as_json=True),
+            size_bytes=0  # Lives in the shared page cache, not this worker's budget
+        )
+
+
+def _map_array(path: Path, typecode: str):
+    """Map a file read-only and view it as an array of typecode"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(array(typecode))  # mmap cannot map an empty file
+        # The mapping stays valid after the file is closed (and after it is unlinked)
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mm).cast(typecode)
+
+
+def _generation_dir(generation: int) -> Path:
+    return SHARED_CORPUS_DIR / f"gen_{generation}"
+
+
+def _read_current_generation() -> Optional[int]:
+    try:
+        return int((SHARED_CORPUS_DIR / "CURRENT").read_text().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_current_generation(generation: int):
+    current_file = SHARED_CORPUS_DIR / "CURRENT"
+    tmp_file = current_file.with_name(f"CURRENT.{os.getpid()}.tmp")
+    tmp_file.write_text(str(generation))
+    os.replace(tmp_file, current_file)
+
+
+def _corpus_version(materials) -> str:
+    """Hash of the (material_id, version) pairs that make up the corpus"""
+    digest = hashlib.sha256()
+    for material in sorted(materials, key=lambda m: m.id):
+        digest.update(f"{material.id}={material_vector_version(material.processed_at, material.chunk_count)};".encode())
+    return digest.hexdigest()
+
+
+def get_shared_corpus():
+    """Get the mapped corpus, remapping when another worker published a new generation"""
+    global _corpus, _last_generation_check
+    if not SHARED_CORPUS_ENABLED:
+        return None
+
+    now = time.time()
+    if now - _last_generation_check < GENERATION_CHECK_SECONDS:
+        return _corpus
+
+    with _corpus_lock:
+        if now - _last_generation_check < GENERATION_CHECK_SECONDS:
+            return _corpus
+        _last_generation_check = now
+
+        generation = _read_current_generation()
+        if generation is None:
+            _corpus = None
+        elif _corpus is None or _corpus.generation != generation:
+            try:
+                # Views handed out from the old generation keep its mappings alive
+                _corpus = _MappedCorpus(generation)
+                print(f"Mapped shared corpus generation {generation} ({_corpus.count} entries)")
+            except Exception as e:
+                print(f"Error mapping shared corpus generation {generation}: {e}")
+                _corpus = None
+        return _corpus
+
+
+def get_shared_block(material_id: int, version: str) -> Optional[VectorBlock]:
+    """Get a material's VectorBlock from the shared corpus if it is there at this version"""
+    corpus = get_shared_corpus()
+    if corpus is None:
+        return None
+    return corpus.get_block(material_id, version)
+
+
+def _build_generation(db_session, materials, corpus_version: str, generation: int):
+    """Write a generation's files to a temp directory and move it into place"""
+    from database import VectorIndexEntry
+
+    versions = {m.id: material_vector_version(m.processed_at, m.chunk_count) for m in materials}
+    tmp_dir = SHARED_CORPUS_DIR / f"gen_{generation}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    dim = None
+    count = 0
+    material_ranges: Dict[str, dict] = {}
+    text_offset = 0
+    meta_offset = 0
+    with open(tmp_dir / "embeddings.f32", 'wb') as embeddings_file, \
+            open(tmp_dir / "ids.i64", 'wb') as ids_file, \
+            open(tmp_dir / "chunks.i32", 'wb') as chunks_file, \
+            open(tmp_dir / "texts.bin", 'wb') as texts_file, \
+            open(tmp_dir / "text_offsets.u64", 'wb') as text_offsets_file, \
+            open(tmp_dir / "meta.bin", 'wb') as meta_file, \
+            open(tmp_dir / "meta_offsets.u64", 'wb') as meta_offsets_file:
+        text_offsets_file.write(array('Q', [0]).tobytes())
+        meta_offsets_file.write(array('Q', [0]).tobytes())
+
+        # Stream rows so the builder never holds the whole corpus in memory
+        rows = db_session.query(VectorIndexEntry).filter(
+            VectorIndexEntry.source_id.in_(list(versions)),
+            VectorIndexEntry.source_type == "material"
+        ).order_by(VectorIndexEntry.source_id, VectorIndexEntry.chunk_index).yield_per(500)
+
+        for row in rows:
+            embedding = row.embedding or []
+            if dim is None:
+                dim = len(embedding)
+            if len(embedding) != dim:
+                print(f"Skipping vector entry {row.id} of material {row.source_id}: embedding dimension {len(embedding)} != {dim}")
+                continue
+
+            key = str(row.source_id)
+            if key not in material_ranges:
+                material_ranges[key] = {
+                    'version': versions[row.source_id],
+                    'user_id': row.user_id,
+                    'start': count,
+                    'end': count
+                }
+            material_ranges[key]['end'] = count + 1
+
+            text = (row.content or "").encode('utf-8')
+            meta = json.dumps(row.vector_metadata or {}, default=str).encode('utf-8')
+            text_offset += len(text)
+            meta_offset += len(meta)
+
+            embeddings_file.write(array('f', embedding).tobytes())
+            ids_file.write(array('q', [row.id]).tobytes())
+            chunks_file.write(array('i', [row.chunk_index or 0]).tobytes())
+            texts_file.write(text)
+            text_offsets_file.write(array('Q', [text_offset]).tobytes())
+            meta_file.write(meta)
+            meta_offsets_file.write(array('Q', [meta_offset]).tobytes())
+            count += 1
+
+    with open(tmp_dir / "manifest.json", 'w') as f:
+        json.dump({
+            'generation': generation,
+            'corpus_version': corpus_version,
+            'dim': dim or 0,
+            'count': count,
+            'materials': material_ranges,
+            'built_at': time.time()
+        }, f)
+
+    gen_dir = _generation_dir(generation)
+    shutil.rmtree(gen_dir, ignore_errors=True)
+    os.replace(tmp_dir, gen_dir)
+    return count
+
+
+def _remove_old_generations(current: int):
+    """Remove generation directories no longer needed (mapped views stay valid)"""
+    for gen_dir in SHARED_CORPUS_DIR.glob("gen_*"):
+        suffix = gen_dir.name[len("gen_"):]
+        if suffix.isdigit() and int(suffix) <= current - GENERATIONS_TO_KEEP:
+            shutil.rmtree(gen_dir, ignore_errors=True)
+
+
+def ensure_shared_corpus(db_session, system_user_id: str = "SYSTEM") -> bool:
+    """
+    Make sure the published generation matches the system materials in the database,
+    building a new one if needed. Only one worker builds at a time; the others wait
+    on the lock and then map what it published. Returns True if a corpus is available.
+    """
+    global _last_generation_check
+    if not SHARED_CORPUS_ENABLED:
+        return False
+
+    from database import Material
+
+    SHARED_CORPUS_DIR.mkdir(parents=True, exist_ok=True)
+    materials = db_session.query(Material.id, Material.processed_at, Material.chunk_count).filter(
+        Material.user_id == system_user_id,
+        Material.status == "processed"
+    ).all()
+    corpus_version = _corpus_version(materials)
+
+    with open(SHARED_CORPUS_DIR / "build.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            current = _read_current_generation()
+            if current is not None:
+                try:
+                    with open(_generation_dir(current) / "manifest.json") as f:
+                        if json.load(f).get('corpus_version') == corpus_version:
+                            return True
+                except (FileNotFoundError, ValueError):
+                    pass
+
+            generation = (current or 0) + 1
+            count = _build_generation(db_session, materials, corpus_version, generation)
+            _write_current_generation(generation)
+            _remove_old_generations(generation)
+            print(f"Built shared corpus generation {generation}: {len(materials)} materials, {count} entries")
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Pick up the new generation immediately in this worker
+    _last_generation_check = 0.0
+    return True
+
+
+def schedule_shared_corpus_rebuild(system_user_id: str = "SYSTEM"):
+    """Rebuild the shared corpus in the background after a system material changes"""
+    if not SHARED_CORPUS_ENABLED:
+        return
+
+    def rebuild():
+        from database import get_session_local
+        # Serialize rebuilds within this worker; ensure_shared_corpus serializes across workers
+        with _rebuild_lock:
+            db = get_session_local()()
+            try:
+                ensure_shared_corpus(db, system_user_id)
+            except Exception as e:
+                print(f"Error rebuilding shared corpus: {e}")
+            finally:
+                db.close()
+
+    threading.Thread(target=rebuild, daemon=True).start()
+
+
+def get_shared_corpus_stats() -> Dict:
+    """Get shared corpus statistics"""
+    corpus = get_shared_corpus()
+    if corpus is None:
+        return {'shared_corpus_enabled': SHARED_CORPUS_ENABLED, 'shared_corpus_generation': None}
+    return {
+        'shared_corpus_enabled': True,
+        'shared_corpus_generation': corpus.generation,
+        'shared_corpus_materials': len(corpus.materials),
+        'shared_corpus_entries': corpus.count,
+        'shared_corpus_size_mb': round(
+            (len(corpus.embeddings) * 4 + len(corpus.texts) + len(corpus.meta)) / (1024 * 1024), 2
+        )
+    }
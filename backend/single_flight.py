@@ -0,0 +1,102 @@
+"""
+Single-Flight Module
+
+Coalesces concurrent loads of the same key: the first caller (the leader) runs
+the loader and every caller that arrives while it is in flight waits for and
+shares its result instead of hitting the database or the OpenAI API again.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    """One in-flight load"""
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self) -> Any:
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """Runs at most one loader per key at a time and counts coalesced callers"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.loads = 0
+        self.coalesced = 0
+
+    def begin(self, key: Hashable) -> Tuple[_Call, bool]:
+        """
+        Join the flight for key. Returns (call, is_leader); the leader must call
+        finish() for the key, everyone else calls call.wait().
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self.loads += 1
+            return call, True
+
+    def finish(self, key: Hashable, call: _Call, result: Any = None, error: BaseException = None):
+        """Publish the leader's result (or error) and release the waiters"""
+        call.result = result
+        call.error = error
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.event.set()
+
+    def do(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Run loader for key, or wait for the load already in flight"""
+        call, is_leader = self.begin(key)
+        if not is_leader:
+            return call.wait()
+
+        try:
+            result = loader()
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'loads': self.loads,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._calls)
+            }
+
+
+_flights: Dict[str, SingleFlight] = {}
+_flights_lock = threading.Lock()
+
+def get_single_flight(name: str) -> SingleFlight:
+    """Get (or create) the named single-flight group"""
+    with _flights_lock:
+        flight = _flights.get(name)
+        if flight is None:
+            flight = _flights[name] = SingleFlight(name)
+        return flight
+
+
+def get_single_flight_stats() -> Dict:
+    """Get load and coalesced-request counts for every single-flight group"""
+    with _flights_lock:
+        flights = list(_flights.values())
+    return {flight.name: flight.stats() for flight in flights}
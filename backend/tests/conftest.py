@@ -0,0 +1,52 @@
+"""
+Shared test setup.
+
+Tests import the backend modules directly, so the backend directory goes on
+sys.path. Tests that need PostgreSQL use the database in TEST_DATABASE_URL
+and are skipped when it is not set; it must be a throwaway database, since
+the tests create and drop tables in it.
+"""
+
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    # database.py reads DATABASE_URL at import time
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+
+@pytest.fixture(scope="session")
+def pg_database():
+    """The database module, bound to TEST_DATABASE_URL with all tables and migrations applied"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    import database
+    assert database.init_db(), "init_db() failed against TEST_DATABASE_URL"
+    return database
+
+
+@pytest.fixture
+def isolated_cache(monkeypatch, tmp_path):
+    """material_cache with empty memory tiers and its disk tier in a temp directory"""
+    import threading
+    from collections import OrderedDict
+
+    import material_cache
+    from cache_admission import FrequencySketch
+
+    monkeypatch.setattr(material_cache, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(material_cache, "_index_local", threading.local())
+    monkeypatch.setattr(material_cache, "_cache", OrderedDict())
+    monkeypatch.setattr(material_cache, "_cache_insert_order", OrderedDict())
+    monkeypatch.setattr(material_cache, "_total_cache_size", 0)
+    monkeypatch.setattr(material_cache, "_frequency_sketch", FrequencySketch())
+    monkeypatch.setattr(material_cache, "_vector_cache", OrderedDict())
+    monkeypatch.setattr(material_cache, "_vector_cache_size", 0)
+    monkeypatch.setattr(material_cache, "_empty_vector_versions", OrderedDict())
+    return material_cache
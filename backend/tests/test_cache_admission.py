@@ -0,0 +1,87 @@
+from collections import OrderedDict
+
+import pytest
+
+import material_cache
+from cache_admission import FrequencySketch, MAX_COUNT, should_admit
+
+
+def test_sketch_counts_accesses_per_key():
+    sketch = FrequencySketch(width=64)
+    for _ in range(3):
+        sketch.increment("hot")
+    sketch.increment("warm")
+
+    assert sketch.frequency("hot") >= 3
+    assert sketch.frequency("warm") >= 1
+
+
+def test_sketch_counters_saturate():
+    sketch = FrequencySketch(width=64, sample_size=10_000)
+    for _ in range(MAX_COUNT * 3):
+        sketch.increment("key")
+    assert sketch.frequency("key") == MAX_COUNT
+
+
+def test_sketch_halves_counters_after_sample_size():
+    sketch = FrequencySketch(width=64, sample_size=8)
+    for _ in range(7):
+        sketch.increment("key")
+    assert sketch.frequency("key") == 7 and sketch.resets == 0
+
+    sketch.increment("key")
+    assert sketch.resets == 1
+    assert sketch.frequency("key") == 4
+    assert sketch.additions == 4
+
+
+def test_should_admit_needs_a_higher_frequency_than_every_victim():
+    sketch = FrequencySketch(width=1024)
+    for key, count in (("candidate", 3), ("cold", 1), ("hot", 5)):
+        for _ in range(count):
+            sketch.increment(key)
+
+    assert should_admit(sketch, "candidate", [])
+    assert should_admit(sketch, "candidate", ["cold"])
+    assert not should_admit(sketch, "candidate", ["cold", "hot"])
+    assert not should_admit(sketch, "never-seen", ["cold"])
+
+
+@pytest.fixture
+def text_cache(monkeypatch):
+    """An empty 1 MB in-memory text tier with the TinyLFU policy"""
+    monkeypatch.setattr(material_cache, "_cache", OrderedDict())
+    monkeypatch.setattr(material_cache, "_cache_insert_order", OrderedDict())
+    monkeypatch.setattr(material_cache, "_total_cache_size", 0)
+    monkeypatch.setattr(material_cache, "_frequency_sketch", FrequencySketch(width=1024))
+    monkeypatch.setattr(material_cache, "MAX_CACHE_SIZE_MB", 1)
+    monkeypatch.setattr(material_cache, "CACHE_ADMISSION_POLICY", "tinylfu")
+    return material_cache
+
+
+def test_one_off_read_does_not_evict_hot_entries(text_cache):
+    half = 512 * 1024
+    now = material_cache.time.time()
+    for material_id in (1, 2):
+        for _ in range(3):
+            text_cache._frequency_sketch.increment(material_id)
+        assert text_cache._add_to_cache(material_id, "x", now, half)
+
+    text_cache._frequency_sketch.increment(3)
+    assert not text_cache._add_to_cache(3, "x", now, half)
+    assert list(text_cache._cache) == [1, 2]
+
+    for _ in range(5):
+        text_cache._frequency_sketch.increment(3)
+    assert text_cache._add_to_cache(3, "x", now, half)
+    assert list(text_cache._cache) == [2, 3]
+    assert text_cache._total_cache_size == 2 * half
+
+
+def test_lru_policy_admits_everything(text_cache, monkeypatch):
+    monkeypatch.setattr(material_cache, "CACHE_ADMISSION_POLICY", "lru")
+    half = 512 * 1024
+    now = material_cache.time.time()
+    for material_id in (1, 2, 3):
+        assert text_cache._add_to_cache(material_id, "x", now, half)
+    assert list(text_cache._cache) == [2, 3]
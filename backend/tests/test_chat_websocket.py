@@ -0,0 +1,109 @@
+import time
+
+import jwt
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+def _stream(*deltas):
+    def stream_chat_completion(messages):
+        yield from deltas
+    return stream_chat_completion
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    """A /ws/chat client whose model, retrieval and persistence are stubbed out"""
+    persisted = []
+    monkeypatch.setattr(main, "client", object())
+    monkeypatch.setattr(main, "stream_chat_completion", _stream("Hel", "lo"))
+    monkeypatch.setattr(main, "retrieve_rag_context", lambda message, user_id, db=None, vector_blocks=None: "")
+    monkeypatch.setattr(main, "persist_chat_turn", lambda *args: persisted.append(args))
+
+    async def no_blocks(self):
+        return []
+
+    monkeypatch.setattr(main.ChatConnection, "get_vector_blocks", no_blocks)
+    token = jwt.encode({"sub": "00000000-0000-0000-0000-000000000001"}, "test", algorithm="HS256")
+    with TestClient(main.app).websocket_connect("/ws/chat") as ws:
+        ws.send_json({"type": "auth", "token": token})
+        assert ws.receive_json() == {"type": "ready"}
+        yield ws, persisted
+
+
+def _turn(ws, message="hi"):
+    """Send one message; returns the event types received up to done or error"""
+    ws.send_json({"type": "message", "message": message})
+    events = []
+    while not events or events[-1]["type"] not in ("done", "error"):
+        events.append(ws.receive_json())
+    return events
+
+
+def test_turn_streams_tokens(chat):
+    ws, persisted = chat
+    events = _turn(ws)
+    assert [e["type"] for e in events] == ["meta", "token", "token", "done"]
+    # The turn is persisted after done is sent
+    deadline = time.monotonic() + 5
+    while not persisted and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert persisted[0][2:4] == ("hi", "Hello")
+
+
+def test_invalid_json_keeps_connection_open(chat):
+    ws, _ = chat
+    ws.send_text("{not json")
+    assert ws.receive_json()["type"] == "error"
+    ws.send_bytes(b"\x00")
+    assert ws.receive_json()["type"] == "error"
+    assert _turn(ws)[-1]["type"] == "done"
+
+
+def test_failure_before_streaming_keeps_connection_open(chat, monkeypatch):
+    ws, persisted = chat
+
+    def broken_history(*args):
+        raise RuntimeError("history unavailable")
+
+    monkeypatch.setattr(main, "with_thread_history", broken_history)
+    events = _turn(ws)
+    assert [e["type"] for e in events] == ["error"]
+    assert "history unavailable" in events[0]["detail"]
+    assert persisted == []
+
+    monkeypatch.setattr(main, "with_thread_history", lambda messages, *args: messages)
+    assert _turn(ws)[-1]["type"] == "done"
+
+
+def test_connection_resolves_blocks_each_turn_and_forgets_deleted_materials(monkeypatch):
+    from types import SimpleNamespace
+
+    materials = [SimpleNamespace(id=1), SimpleNamespace(id=2)]
+    queries = []
+    resolved = []
+
+    def fake_read_db(last_write=None):
+        yield "db"
+
+    def materials_query(user_id, db):
+        queries.append(user_id)
+        return list(materials)
+
+    def load_blocks(db, rows):
+        resolved.append([m.id for m in rows])
+        return [f"block-{m.id}" for m in rows]
+
+    monkeypatch.setattr(main, "get_read_db_for", fake_read_db)
+    monkeypatch.setattr(main, "user_materials_for_retrieval", materials_query)
+    monkeypatch.setattr(main, "load_vector_blocks", load_blocks)
+
+    connection = main.ChatConnection({"user_id": "u"})
+    assert connection._load_vector_blocks(reload=True) == ["block-1", "block-2"]
+    main.forget_material_on_chat_connections(1)
+    assert connection._load_vector_blocks(reload=False) == ["block-2"]
+    # One materials query; the blocks were resolved through the vector cache on both turns
+    assert queries == ["u"]
+    assert resolved == [[1, 2], [2]]
@@ -0,0 +1,141 @@
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+import chat_writer as chat_writer_module
+from chat_writer import ChatWriter, _ACCESS, _MESSAGE
+
+
+def _message(session_id, user_id=None, message="hi"):
+    return (_MESSAGE, {
+        "session_id": session_id,
+        "user_id": user_id,
+        "message_type": "user",
+        "message_content": {"message": message},
+        "thread_id": None,
+        "response_time_ms": None,
+        "message_length": len(message)
+    })
+
+
+@pytest.fixture(autouse=True)
+def no_retry_sleep(monkeypatch):
+    monkeypatch.setattr(chat_writer_module.time, "sleep", lambda seconds: None)
+
+
+def test_enqueue_rejects_non_uuid_user_id(monkeypatch):
+    writer = ChatWriter()
+    monkeypatch.setattr(writer, "_put", lambda item: pytest.fail("invalid write was queued"))
+    writer.enqueue_message("s1", "not-a-uuid", "user", {"message": "hi"})
+    assert writer.stats()["rejected"] == 1
+
+
+def test_enqueue_normalizes_uuid_user_id(monkeypatch):
+    writer = ChatWriter()
+    queued = []
+    monkeypatch.setattr(writer, "_put", queued.append)
+    user_id = uuid.uuid4()
+    writer.enqueue_message("s1", user_id.hex.upper(), "user", {"message": "hi"})
+    writer.enqueue_message("s1", None, "user", {"message": "hi"})
+    assert [payload["user_id"] for _, payload in queued] == [str(user_id), None]
+
+
+def test_failed_batch_drops_only_the_bad_writes(monkeypatch):
+    writer = ChatWriter()
+    written = []
+
+    def write(batch):
+        if any(kind == _MESSAGE and payload["message_content"]["message"] == "bad" for kind, payload in batch):
+            raise RuntimeError("bad row")
+        written.extend(batch)
+
+    monkeypatch.setattr(writer, "_write", write)
+    batch = [_message(f"s{i}", message="bad" if i in (3, 11) else f"m{i}") for i in range(16)]
+    batch.append((_ACCESS, [1, 2]))
+    writer._flush(batch)
+
+    assert len(written) == 15
+    assert all(item in written for item in batch if item[0] == _ACCESS or item[1]["message_content"]["message"] != "bad")
+    stats = writer.stats()
+    assert stats["written"] == 15
+    assert stats["failed"] == 2
+
+
+def _rows(database, session_id):
+    with database.get_engine().connect() as conn:
+        messages = conn.execute(text(
+            "SELECT user_id, message_content->>'message' AS message FROM user_data.chat_messages "
+            "WHERE session_id = :s ORDER BY timestamp"), {"s": session_id}).all()
+        sessions = conn.execute(text(
+            "SELECT user_id, is_active, last_activity FROM user_data.user_session WHERE session_id = :s"),
+            {"s": session_id}).all()
+    return messages, sessions
+
+
+def test_mixed_batch_against_postgres(pg_database):
+    writer = ChatWriter()
+    good_session, bad_session = f"test-{uuid.uuid4()}", f"test-{uuid.uuid4()}"
+    user_id = str(uuid.uuid4())
+    # Bypasses enqueue_message's check, as a row Postgres rejects
+    batch = [_message(good_session, user_id, "first"), _message(bad_session, "not-a-uuid"),
+             _message(good_session, user_id, "second")]
+    writer._flush(batch)
+
+    messages, sessions = _rows(pg_database, good_session)
+    assert [row.message for row in messages] == ["first", "second"]
+    assert len(sessions) == 1
+    assert _rows(pg_database, bad_session) == ([], [])
+    assert writer.stats()["failed"] == 1
+
+
+def test_session_upsert_on_conflict(pg_database):
+    session_id, user_id = f"test-{uuid.uuid4()}", str(uuid.uuid4())
+    with pg_database.get_engine().begin() as conn:
+        conn.execute(text(
+            "INSERT INTO user_data.user_session (session_id, user_id, is_active, last_activity) "
+            "VALUES (:s, :u, false, '2000-01-01')"), {"s": session_id, "u": user_id})
+
+    writer = ChatWriter()
+    writer._flush([_message(session_id, user_id, "one"), _message(session_id, str(uuid.uuid4()), "two")])
+    writer._flush([_message(session_id, user_id, "three")])
+
+    messages, sessions = _rows(pg_database, session_id)
+    assert [row.message for row in messages] == ["one", "two", "three"]
+    assert len(sessions) == 1
+    session = sessions[0]
+    assert str(session.user_id) == user_id  # The existing session keeps its owner
+    assert session.is_active
+    assert session.last_activity > datetime(2000, 1, 2)
+
+
+def test_stop_drains_queue(pg_database):
+    writer = ChatWriter()
+    session_id, user_id = f"test-{uuid.uuid4()}", str(uuid.uuid4())
+    for i in range(300):
+        writer.enqueue_message(session_id, user_id, "user", {"message": f"m{i}"})
+    writer.stop()
+
+    messages, _ = _rows(pg_database, session_id)
+    assert [row.message for row in messages] == [f"m{i}" for i in range(300)]
+    stats = writer.stats()
+    assert stats["written"] == 300
+    assert stats["pending"] == 0
+    assert not stats["running"]
+
+
+def test_writes_after_stop_do_not_restart_the_flusher(monkeypatch):
+    writer = ChatWriter()
+    written = []
+    monkeypatch.setattr(writer, "_write", written.append)
+    writer.enqueue_message("s1", None, "user", {"message": "before"})
+    writer.stop()
+    assert len(written) == 1
+
+    writer.enqueue_message("s1", None, "user", {"message": "late"})
+    # Written synchronously, without a new flusher thread
+    assert [batch[0][1]["message_content"]["message"] for batch in written] == ["before", "late"]
+    stats = writer.stats()
+    assert not stats["running"]
+    assert stats["written"] == 2
@@ -0,0 +1,99 @@
+import json
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+PROCESSED_AT = datetime(2024, 1, 1)
+
+
+def _block(cache, material_id):
+    row = SimpleNamespace(id=material_id, user_id="u1", chunk_index=0, embedding=[1.0, 0.0],
+                          content="chunk", vector_metadata={})
+    version = cache.material_vector_version(PROCESSED_AT, 1)
+    return cache.build_vector_block(material_id, version, [row])
+
+
+class _Query:
+    def __init__(self, session):
+        self.session = session
+
+    def filter(self, *criteria):
+        return self
+
+    def all(self):
+        return [SimpleNamespace(id=material_id, processed_at=PROCESSED_AT, chunk_count=1)
+                for material_id in self.session.material_ids]
+
+
+class _Session:
+    def __init__(self, material_ids):
+        self.material_ids = material_ids
+
+    def query(self, *entities):
+        return _Query(self)
+
+
+def test_snapshot_is_restored_hottest_first(isolated_cache, monkeypatch):
+    cache = isolated_cache
+    for material_id in (1, 2, 3):
+        cache.cache_text(material_id, f"text {material_id}")
+        cache.cache_vector_entries(material_id + 10, _block(cache, material_id + 10))
+    cache.get_cached_text(1)
+    cache.get_cached_vector_entries(11, cache.material_vector_version(PROCESSED_AT, 1))
+
+    snapshot = cache.snapshot_hot_set()
+    assert snapshot["text"] == [1, 3, 2]
+    assert snapshot["vectors"] == [11, 13, 12]
+
+    # Restart: empty memory tiers, the snapshot file is all that is left
+    cache.clear_all_cache()
+    for material_id in (11, 12, 13):
+        cache.invalidate_vector_cache(material_id)
+    loaded_texts = []
+
+    def load_text(db, material_id):
+        loaded_texts.append(material_id)
+        cache.cache_text(material_id, f"text {material_id}")
+        return f"text {material_id}"
+
+    def load_blocks(db, materials):
+        blocks = [_block(cache, material.id) for material in materials]
+        for block in blocks:
+            cache.cache_vector_entries(block.material_id, block)
+        return blocks
+
+    monkeypatch.setattr(cache, "load_material_text", load_text)
+    monkeypatch.setattr(cache, "load_vector_blocks", load_blocks)
+    restored = cache.restore_hot_set(_Session([11, 13, 12]))
+
+    assert restored == {"text": 3, "vectors": 3}
+    assert loaded_texts == [1, 3, 2]
+    # The hottest entries end up most recently used, so they are evicted last
+    assert list(cache._cache) == [2, 3, 1]
+    assert list(cache._vector_cache) == [12, 13, 11]
+
+
+def test_workers_merge_into_one_snapshot_and_cold_ids_age_out(isolated_cache):
+    cache = isolated_cache
+    now = time.time()
+    max_age = cache.SNAPSHOT_MAX_AGE * cache.SNAPSHOT_INTERVAL_SECONDS
+    cache._get_snapshot_path().write_text(json.dumps({
+        "saved_at": now,
+        "text": [5, 1, 6],
+        "vectors": [],
+        "seen": {"text": {"5": now, "1": now, "6": now - max_age - 1}, "vectors": {}}
+    }))
+    cache.cache_text(1, "text 1")
+
+    snapshot = cache.snapshot_hot_set()
+    # This worker's ids first, then the other worker's live ids; 6 went cold
+    assert snapshot["text"] == [1, 5]
+    assert cache._read_snapshot()["text"] == [1, 5]
+
+
+def test_missing_or_corrupt_snapshot_restores_nothing(isolated_cache):
+    cache = isolated_cache
+    assert cache.restore_hot_set(_Session([])) == {"text": 0, "vectors": 0}
+
+    cache._get_snapshot_path().write_text("{not json")
+    assert cache.restore_hot_set(_Session([])) == {"text": 0, "vectors": 0}
@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+import pytest
+
+import material_cache
+from material_cache import compress_text, decompress_text
+
+TEXT = "Schéma de soins — étape 1. " * 200
+
+
+def test_zlib_round_trip():
+    blob = compress_text(TEXT, "zlib")
+    assert len(blob) < len(TEXT.encode("utf-8"))
+    assert decompress_text(blob, "zlib") == TEXT
+
+
+def test_zstd_round_trip():
+    pytest.importorskip("zstandard")
+    assert decompress_text(compress_text(TEXT, "zstd"), "zstd") == TEXT
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        compress_text(TEXT, "lz4")
+    with pytest.raises(ValueError):
+        decompress_text(b"", "lz4")
+
+
+class _Query:
+    def __init__(self, session, entities):
+        self.session = session
+        self.entities = entities
+
+    def filter(self, *criteria):
+        return self
+
+    def first(self):
+        self.session.queries.append(self.entities)
+        return self.session.stored
+
+    def scalar(self):
+        self.session.queries.append(self.entities)
+        return self.session.legacy_text
+
+
+class _Session:
+    def __init__(self, stored=None, legacy_text=None):
+        self.stored = stored
+        self.legacy_text = legacy_text
+        self.queries = []
+        self.merged = []
+
+    def query(self, *entities):
+        return _Query(self, entities)
+
+    def merge(self, row):
+        self.merged.append(row)
+
+
+def test_store_material_text_writes_a_compressed_row():
+    session = _Session()
+    material_cache.store_material_text(session, 7, TEXT)
+
+    row, = session.merged
+    assert row.material_id == 7
+    assert row.codec == material_cache.TEXT_CODEC
+    assert row.raw_size == len(TEXT.encode("utf-8"))
+    assert decompress_text(row.compressed_text, row.codec) == TEXT
+
+
+def test_text_is_loaded_from_the_blob_table_once(isolated_cache):
+    session = _Session(stored=SimpleNamespace(codec="zlib", compressed_text=compress_text(TEXT, "zlib")))
+
+    assert isolated_cache.load_material_text(session, 7) == TEXT
+    assert isolated_cache.load_material_text(session, 7) == TEXT
+    assert len(session.queries) == 1
+
+
+def test_rows_not_backfilled_fall_back_to_the_legacy_column(isolated_cache):
+    session = _Session(legacy_text=TEXT)
+    assert isolated_cache.load_material_text(session, 7) == TEXT
+    assert len(session.queries) == 2
+
+    assert isolated_cache.load_material_text(_Session(), 8) is None
@@ -0,0 +1,99 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, Uuid, create_engine, insert, select
+
+from pagination import encode_cursor, paginate, page_result
+
+metadata = MetaData()
+int_items = Table("int_items", metadata, Column("id", Integer, primary_key=True), Column("created_at", DateTime))
+uuid_items = Table("uuid_items", metadata, Column("id", Uuid, primary_key=True), Column("created_at", DateTime))
+
+
+@pytest.fixture
+def conn():
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    with engine.connect() as conn:
+        yield conn
+
+
+def _all_pages(conn, table, limit):
+    """Walk every page via next_cursor; returns the ids in page order"""
+    ids, cursor = [], None
+    while True:
+        statement = paginate(select(table), table.c.created_at, table.c.id, cursor, limit)
+        page, cursor, has_more = page_result(conn.execute(statement).all(), limit,
+                                             key=lambda row: (row.created_at, row.id))
+        assert len(page) <= limit
+        ids.extend(row.id for row in page)
+        if not has_more:
+            assert cursor is None
+            return ids
+
+
+def _rows(ids):
+    # Pairs of rows share a timestamp, so the id tiebreak matters
+    start = datetime(2024, 1, 1)
+    return [{"id": row_id, "created_at": start + timedelta(minutes=i // 2)} for i, row_id in enumerate(ids)]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 10])
+def test_int_cursor_round_trip(conn, limit):
+    rows = _rows(range(1, 8))
+    conn.execute(insert(int_items), rows)
+    expected = [row["id"] for row in sorted(rows, key=lambda r: (r["created_at"], r["id"]), reverse=True)]
+    assert _all_pages(conn, int_items, limit) == expected
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3])
+def test_null_timestamps_page_last(conn, limit):
+    rows = _rows([1, 2, 3, 4])
+    rows += [{"id": 5, "created_at": None}, {"id": 6, "created_at": None}, {"id": 7, "created_at": None}]
+    conn.execute(insert(int_items), rows)
+    # Newest first, then the rows without a timestamp (as epoch), by id
+    assert _all_pages(conn, int_items, limit) == [4, 3, 2, 1, 7, 6, 5]
+
+
+@pytest.mark.parametrize("limit", [1, 3])
+def test_uuid_cursor_round_trip(conn, limit):
+    rows = _rows([uuid.uuid4() for _ in range(7)])
+    conn.execute(insert(uuid_items), rows)
+    expected = [row["id"] for row in sorted(rows, key=lambda r: (r["created_at"], r["id"]), reverse=True)]
+    assert _all_pages(conn, uuid_items, limit) == expected
+
+
+def test_cursor_id_is_coerced_to_column_type(conn):
+    conn.execute(insert(int_items), _rows([1, 2, 3]))
+    # A numeric string id still compares as an integer
+    cursor = encode_cursor([datetime(2024, 1, 1, 0, 1).isoformat(), "3"])
+    statement = paginate(select(int_items), int_items.c.created_at, int_items.c.id, cursor, 10)
+    assert [row.id for row in conn.execute(statement)] == [2, 1]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 !",
+    encode_cursor("just a string"),
+    encode_cursor(["2024-01-01T00:00:00"]),
+    encode_cursor(["yesterday", 1]),
+    encode_cursor([12345, 1]),
+    encode_cursor(["2024-01-01T00:00:00", {"id": 1}]),
+    encode_cursor(["2024-01-01T00:00:00", [1]]),
+    encode_cursor(["2024-01-01T00:00:00", True]),
+    encode_cursor(["2024-01-01T00:00:00", 1.5]),
+    encode_cursor(["2024-01-01T00:00:00", "abc"]),
+])
+def test_invalid_int_cursor(cursor):
+    with pytest.raises(HTTPException) as exc:
+        paginate(select(int_items), int_items.c.created_at, int_items.c.id, cursor, 10)
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize("last_id", ["not-a-uuid", 7, None])
+def test_invalid_uuid_cursor(last_id):
+    cursor = encode_cursor(["2024-01-01T00:00:00", last_id])
+    with pytest.raises(HTTPException) as exc:
+        paginate(select(uuid_items), uuid_items.c.created_at, uuid_items.c.id, cursor, 10)
+    assert exc.value.status_code == 400
@@ -0,0 +1,73 @@
+import uuid
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import text
+
+
+@pytest.fixture
+def autocommit_conn(pg_database):
+    with pg_database.get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        yield conn
+
+
+@pytest.fixture
+def scratch_schema(autocommit_conn):
+    autocommit_conn.execute(text("DROP SCHEMA IF EXISTS partition_test CASCADE"))
+    autocommit_conn.execute(text("CREATE SCHEMA partition_test"))
+    yield "partition_test"
+    autocommit_conn.execute(text("DROP SCHEMA partition_test CASCADE"))
+
+
+def test_copy_legacy_rows_keeps_rows_without_partition_key(autocommit_conn, scratch_schema):
+    from migrations import _copy_legacy_rows, _swap_in_partitioned_table
+
+    table = f"{scratch_schema}.events"
+    autocommit_conn.execute(text(f"CREATE TABLE {table} (id SERIAL PRIMARY KEY, ts TIMESTAMP, note TEXT)"))
+    autocommit_conn.execute(text(f"""
+        INSERT INTO {table} (ts, note) VALUES
+            ('2024-01-05', 'january'), ('2024-02-10', 'february'), (NULL, 'no time'), (NULL, 'also no time')
+    """))
+    _swap_in_partitioned_table(autocommit_conn, table, "ts", [])
+
+    assert _copy_legacy_rows(autocommit_conn, table, "ts") == 4
+    rows = autocommit_conn.execute(text(f"SELECT note, ts FROM {table} ORDER BY id")).all()
+    assert rows == [
+        ("january", datetime(2024, 1, 5)),
+        ("february", datetime(2024, 2, 10)),
+        ("no time", datetime(1970, 1, 1)),
+        ("also no time", datetime(1970, 1, 1)),
+    ]
+    assert autocommit_conn.execute(text(f"SELECT to_regclass('{table}_legacy')")).scalar() is None
+    # The id sequence now belongs to the partitioned table
+    autocommit_conn.execute(text(f"INSERT INTO {table} (note) VALUES ('new')"))
+    assert autocommit_conn.execute(text(f"SELECT id FROM {table} WHERE note = 'new'")).scalar() == 5
+
+
+def _summary(conn, user_id):
+    return conn.execute(text(
+        "SELECT total_messages FROM user_data.user_activity_summary WHERE user_id = :u"), {"u": user_id}).scalar()
+
+
+def test_archive_partition_subtracts_activity_summary(autocommit_conn, tmp_path):
+    from partition_maintenance import archive_partition, create_month_partition, partition_name
+
+    table = "user_data.chat_messages"
+    month = date(2001, 1, 1)
+    partition = partition_name(table, month)
+    autocommit_conn.execute(text(f"DROP TABLE IF EXISTS {partition}"))
+    create_month_partition(autocommit_conn, table, month)
+
+    user_id = str(uuid.uuid4())
+    insert = text(f"INSERT INTO {table} (session_id, user_id, message_type, timestamp) VALUES ('s', :u, 'user', :t)")
+    for when in ("2001-01-10", "2001-01-20", "2001-01-30"):
+        autocommit_conn.execute(insert, {"u": user_id, "t": when})
+    autocommit_conn.execute(insert, {"u": user_id, "t": datetime.now()})
+    assert _summary(autocommit_conn, user_id) == 4
+
+    autocommit_conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+    assert archive_partition(autocommit_conn, partition, str(tmp_path)) == 3
+
+    assert _summary(autocommit_conn, user_id) == 1
+    assert autocommit_conn.execute(text(f"SELECT to_regclass('{partition}')")).scalar() is None
+    assert (tmp_path / "user_data" / "chat_messages_p2001_01.jsonl.gz").exists()
@@ -0,0 +1,63 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from query_metrics import assert_query_budget, assert_response_query_budget
+
+
+@pytest.fixture
+def stuck_materials(pg_database):
+    """Six SYSTEM materials in processing, half of them with vector entries"""
+    engine = pg_database.get_engine()
+    with engine.begin() as conn:
+        ids = conn.execute(text("""
+            INSERT INTO main.materials (user_id, title, file_type, status, processing_progress, uploaded_at)
+            SELECT 'SYSTEM', 'budget test ' || n, 'pdf', 'processing', 0, :uploaded
+            FROM generate_series(1, 6) n RETURNING id
+        """), {"uploaded": datetime.now() - timedelta(hours=2)}).scalars().all()
+        for material_id in ids[:3]:
+            conn.execute(text("""
+                INSERT INTO vector_index_entries (source_type, source_id, user_id, content, chunk_index, embedding)
+                VALUES ('material', :id, 'SYSTEM', 'chunk', 0, '[0.0]')
+            """), {"id": material_id})
+    yield ids
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM vector_index_entries WHERE source_type = 'material' AND source_id = ANY(:ids)"),
+                     {"ids": ids})
+        conn.execute(text("DELETE FROM main.materials WHERE id = ANY(:ids)"), {"ids": ids})
+
+
+def test_check_stuck_materials_query_budget(stuck_materials):
+    from fix_stuck_materials import check_stuck_materials
+
+    # One query for the materials, one grouped count of their vector entries
+    with assert_query_budget(2, max_repeats=1):
+        stuck, active = check_stuck_materials()
+    assert {m.id for m in stuck} == set(stuck_materials)
+    assert active == []
+
+
+def test_all_users_with_data_query_budget(pg_database):
+    import main
+
+    engine = pg_database.get_engine()
+    user_ids = [str(uuid.uuid4()) for _ in range(5)]
+    with engine.begin() as conn:
+        for user_id in user_ids:
+            conn.execute(text(
+                "INSERT INTO user_data.chat_messages (session_id, user_id, message_type) VALUES ('budget', :u, 'user')"
+            ), {"u": user_id})
+            conn.execute(text(
+                "INSERT INTO user_data.user_interactions (session_id, user_id, interaction_type) VALUES ('budget', :u, 'click')"
+            ), {"u": user_id})
+
+    response = TestClient(main.app).get("/api/all-users-with-data")
+    assert response.status_code == 200
+    # A single aggregate, however many users have data
+    assert_response_query_budget(response, 1)
+    users = {u["supabase_user_id"]: u for u in response.json()["users_with_data"]}
+    assert all(users[user_id]["total_messages"] >= 1 and users[user_id]["total_interactions"] >= 1
+               for user_id in user_ids)
@@ -0,0 +1,99 @@
+"""
+Read-your-writes across two app instances sharing a primary and a replica.
+
+Needs TEST_DATABASE_URL (primary) and TEST_DATABASE_READ_URL (a second, separate
+database standing in for a replica that has not caught up: writes never reach it).
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+import jwt
+import pytest
+
+from conftest import BACKEND_DIR, TEST_DATABASE_URL
+
+TEST_DATABASE_READ_URL = os.getenv("TEST_DATABASE_READ_URL")
+
+pytestmark = pytest.mark.skipif(not (TEST_DATABASE_URL and TEST_DATABASE_READ_URL),
+                                reason="TEST_DATABASE_URL and TEST_DATABASE_READ_URL are not set")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(base_url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{base_url} exited with {process.returncode}")
+        try:
+            httpx.get(f"{base_url}/health", timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{base_url} did not start within {timeout}s")
+
+
+@pytest.fixture(scope="module")
+def instances(pg_database):
+    env = dict(os.environ, DATABASE_URL=TEST_DATABASE_READ_URL)
+    subprocess.run([sys.executable, "-c", "import database; assert database.init_db()"],
+                   cwd=BACKEND_DIR, env=env, check=True, capture_output=True)
+
+    env = dict(os.environ, DATABASE_URL=TEST_DATABASE_URL, DATABASE_READ_URL=TEST_DATABASE_READ_URL,
+               READ_YOUR_WRITES_SECONDS="30", CACHE_SNAPSHOT_INTERVAL_SECONDS="0")
+    processes, urls = [], []
+    try:
+        for _ in range(2):
+            port = _free_port()
+            processes.append(subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+                cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            ))
+            urls.append(f"http://127.0.0.1:{port}")
+        for url, process in zip(urls, processes):
+            _wait_until_up(url, process)
+        yield urls
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(10)
+
+
+def _auth():
+    token = jwt.encode({"sub": str(uuid.uuid4()), "email": "ryw@example.com"}, "test", algorithm="HS256")
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_write_on_one_instance_is_read_back_on_the_other(instances):
+    first, second = instances
+    headers = _auth()
+    with httpx.Client(headers=headers) as browser:
+        response = browser.post(f"{first}/api/profile", json={"full_name": "Read Your Writes"})
+        assert response.status_code == 200
+        assert "last_write" in browser.cookies
+
+        # The other instance never saw the write, but the cookie sends the read to the primary
+        profile = browser.get(f"{second}/api/profile/me").json()["profile"]
+        assert profile["profile_exists"]
+        assert profile["full_name"] == "Read Your Writes"
+
+    # Without the cookie the read goes to the replica, which does not have the row
+    profile = httpx.get(f"{second}/api/profile/me", headers=headers).json()["profile"]
+    assert not profile["profile_exists"]
+
+
+def test_reads_without_recent_write_use_replica(instances):
+    first, _ = instances
+    with httpx.Client(headers=_auth()) as browser:
+        assert browser.get(f"{first}/api/profile/me").status_code == 200
+        assert "last_write" not in browser.cookies
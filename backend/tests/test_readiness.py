@@ -0,0 +1,63 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+import main
+import material_cache
+
+
+@pytest.mark.parametrize("state, status_code", [("pending", 503), ("running", 503), ("failed", 503), ("ready", 200)])
+def test_ready_only_after_successful_warmup(monkeypatch, state, status_code):
+    monkeypatch.setattr(main, "get_warmup_status", lambda: {"state": state})
+    response = TestClient(main.app).get("/ready")
+    assert response.status_code == status_code
+    assert response.json()["status"] == {"pending": "warming", "running": "warming"}.get(state, state)
+
+
+class _Session:
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def warmup(monkeypatch):
+    monkeypatch.setattr(database, "get_session_local", lambda: _Session)
+    monkeypatch.setattr(material_cache, "restore_hot_set", lambda db: None)
+    monkeypatch.setattr(material_cache, "WARMUP_RETRY_SECONDS", 0)
+    monkeypatch.setattr(material_cache, "_warmup_status", dict(material_cache._warmup_status))
+
+    def run(preload):
+        monkeypatch.setattr(material_cache, "preload_system_materials", preload)
+        material_cache.start_background_warmup().join(5)
+        return material_cache.get_warmup_status()
+
+    return run
+
+
+def test_warmup_retries_a_failed_preload(warmup):
+    attempts = []
+
+    def preload(db, system_user_id):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("database is starting up")
+        return 7
+
+    status = warmup(preload)
+    assert status["state"] == "ready"
+    assert status["attempts"] == 2
+    assert status["materials_loaded"] == 7
+    assert status["error"] is None
+
+
+def test_warmup_fails_after_its_retries(warmup):
+    def preload(db, system_user_id):
+        raise RuntimeError("no database")
+
+    status = warmup(preload)
+    assert status["state"] == "failed"
+    assert status["attempts"] == material_cache.WARMUP_MAX_ATTEMPTS
+    assert status["error"] == "no database"
@@ -0,0 +1,120 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import shared_corpus
+from database import VectorIndexEntry
+from material_cache import material_vector_version
+
+pytestmark = pytest.mark.skipif(shared_corpus.fcntl is None, reason="shared corpus needs fcntl")
+
+
+class _Query:
+    def __init__(self, result):
+        self.result = result
+
+    def filter(self, *criteria):
+        return self
+
+    def order_by(self, *columns):
+        return self
+
+    def all(self):
+        return self.result
+
+    def yield_per(self, count):
+        return iter(self.result)
+
+
+class _Session:
+    """System materials and their vector entries, as the corpus builder queries them"""
+
+    def __init__(self, materials, rows):
+        self.materials = materials
+        self.rows = rows
+
+    def query(self, *entities):
+        return _Query(self.rows if entities[0] is VectorIndexEntry else self.materials)
+
+
+def _material(material_id, processed_at=datetime(2024, 1, 1)):
+    return SimpleNamespace(id=material_id, processed_at=processed_at, chunk_count=2)
+
+
+def _rows(material_id, scale=1.0):
+    return [
+        SimpleNamespace(id=material_id * 100 + i, source_id=material_id, user_id="SYSTEM", chunk_index=i,
+                        embedding=[scale * (i + 1), 0.5], content=f"chunk {material_id}.{i} é",
+                        vector_metadata={"page": i})
+        for i in range(2)
+    ]
+
+
+def _version(material):
+    return material_vector_version(material.processed_at, material.chunk_count)
+
+
+@pytest.fixture
+def corpus_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(shared_corpus, "SHARED_CORPUS_DIR", tmp_path / "shared_corpus")
+    monkeypatch.setattr(shared_corpus, "SHARED_CORPUS_ENABLED", True)
+    monkeypatch.setattr(shared_corpus, "_corpus", None)
+    monkeypatch.setattr(shared_corpus, "_last_generation_check", 0.0)
+    return tmp_path / "shared_corpus"
+
+
+def test_built_corpus_serves_blocks_at_the_current_version(corpus_dir):
+    materials = [_material(1), _material(2)]
+    session = _Session(materials, _rows(1) + _rows(2))
+    assert shared_corpus.ensure_shared_corpus(session)
+
+    block = shared_corpus.get_shared_block(2, _version(materials[1]))
+    assert block.size_bytes == 0
+    assert list(block.ids) == [200, 201]
+    assert list(block.chunk_indexes) == [0, 1]
+    assert list(block.embedding(1)) == [2.0, 0.5]
+    assert list(block.contents) == ["chunk 2.0 é", "chunk 2.1 é"]
+    assert list(block.metadata) == [{"page": 0}, {"page": 1}]
+    assert block.dot_scores([1.0, 0.0]) == [1.0, 2.0]
+
+    assert shared_corpus.get_shared_block(2, "stale version") is None
+    assert shared_corpus.get_shared_block(3, _version(materials[0])) is None
+
+
+def test_unchanged_materials_do_not_rebuild(corpus_dir):
+    session = _Session([_material(1)], _rows(1))
+    shared_corpus.ensure_shared_corpus(session)
+    shared_corpus.ensure_shared_corpus(session)
+    assert shared_corpus._read_current_generation() == 1
+
+
+def test_workers_remap_when_a_new_generation_is_published(corpus_dir):
+    material = _material(1)
+    shared_corpus.ensure_shared_corpus(_Session([material], _rows(1)))
+    old_block = shared_corpus.get_shared_block(1, _version(material))
+
+    # Another worker reprocesses the material and publishes generation 2
+    reprocessed = _material(1, processed_at=datetime(2024, 2, 1))
+    shared_corpus._build_generation(_Session([reprocessed], _rows(1, scale=10.0)), [reprocessed], "v2", 2)
+    shared_corpus._write_current_generation(2)
+
+    # Until the next generation check this worker keeps its current mapping
+    assert shared_corpus.get_shared_corpus().generation == 1
+    shared_corpus._last_generation_check = 0.0
+    assert shared_corpus.get_shared_corpus().generation == 2
+
+    assert shared_corpus.get_shared_block(1, _version(material)) is None
+    assert list(shared_corpus.get_shared_block(1, _version(reprocessed)).embedding(0)) == [10.0, 0.5]
+    # Blocks handed out from the old generation stay readable
+    assert list(old_block.embedding(0)) == [1.0, 0.5]
+    assert old_block.contents[1] == "chunk 1.1 é"
+
+
+def test_old_generations_are_removed(corpus_dir):
+    for day in (1, 2, 3):
+        material = _material(1, processed_at=datetime(2024, 1, day))
+        shared_corpus.ensure_shared_corpus(_Session([material], _rows(1)))
+
+    assert shared_corpus._read_current_generation() == 3
+    assert sorted(path.name for path in corpus_dir.glob("gen_*")) == ["gen_2", "gen_3"]
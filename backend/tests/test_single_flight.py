@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight, get_single_flight, get_single_flight_stats
+
+
+def _run_concurrently(flight, key, loader, callers):
+    """Call flight.do(key, loader) from several threads; returns their results or errors"""
+    results = [None] * callers
+    started = threading.Barrier(callers)
+
+    def call(i):
+        started.wait()
+        try:
+            results[i] = flight.do(key, loader)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_misses_share_one_load():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        release.wait(5)
+        return "text"
+
+    threads, results = _run_concurrently(flight, 1, loader, 8)
+    # Wait until every caller has joined the leader's flight
+    for _ in range(500):
+        if flight.stats()["coalesced"] == 7:
+            break
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["text"] * 8
+    assert len(loads) == 1
+    assert flight.stats() == {"loads": 1, "coalesced": 7, "in_flight": 0}
+
+
+def test_leader_error_is_raised_in_every_waiter():
+    flight = SingleFlight("test")
+    call, is_leader = flight.begin("key")
+    assert is_leader
+    waiter, is_leader = flight.begin("key")
+    assert not is_leader and waiter is call
+
+    flight.finish("key", call, error=RuntimeError("database down"))
+    with pytest.raises(RuntimeError, match="database down"):
+        waiter.wait()
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_next_load_after_a_failure_runs_again():
+    flight = SingleFlight("test")
+
+    def failing():
+        raise RuntimeError("database down")
+
+    with pytest.raises(RuntimeError):
+        flight.do("key", failing)
+    assert flight.do("key", lambda: 42) == 42
+    assert flight.stats() == {"loads": 2, "coalesced": 0, "in_flight": 0}
+
+
+def test_different_keys_load_independently():
+    flight = SingleFlight("test")
+    first, first_leads = flight.begin(1)
+    second, second_leads = flight.begin(2)
+    assert first_leads and second_leads and first is not second
+
+    flight.finish(1, first, result="a")
+    flight.finish(2, second, result="b")
+    assert (first.wait(), second.wait()) == ("a", "b")
+
+
+def test_named_groups_are_shared_and_reported():
+    flight = get_single_flight("test_named_group")
+    assert get_single_flight("test_named_group") is flight
+    flight.do("key", lambda: None)
+    assert get_single_flight_stats()["test_named_group"]["loads"] >= 1
@@ -0,0 +1,112 @@
+import pytest
+
+import thread_memory
+from thread_memory import CHARS_PER_TOKEN, ThreadHistory, ThreadMemory, estimate_tokens
+
+
+def _text(tokens: int) -> str:
+    """Text that estimate_tokens counts as exactly tokens"""
+    return "x" * ((tokens - 1) * CHARS_PER_TOKEN)
+
+
+def _prompt_tokens(messages):
+    return sum(estimate_tokens(m["content"]) for m in messages)
+
+
+@pytest.mark.parametrize("budget", [0, 5, 10, 25, 31, 1000])
+def test_prompt_messages_keeps_newest_turns_within_budget(budget):
+    history = ThreadHistory([("user", _text(10)), ("assistant", _text(10)), ("user", _text(5)), ("assistant", _text(5))])
+    messages = history.prompt_messages(budget)
+
+    assert _prompt_tokens(messages) <= budget
+    # A contiguous run of the newest turns, oldest first
+    kept = [(m["role"], m["content"]) for m in messages]
+    assert kept == history.turns[len(history.turns) - len(kept):]
+    expected = {0: 0, 5: 1, 10: 2, 25: 3, 31: 4, 1000: 4}[budget]
+    assert len(kept) == expected
+
+
+def test_prompt_messages_counts_summary_against_budget():
+    history = ThreadHistory([("user", _text(10)), ("assistant", _text(10))])
+    history.summary = _text(15)
+    messages = history.prompt_messages(30)
+
+    assert messages[0]["role"] == "system"
+    assert history.summary in messages[0]["content"]
+    assert [m["content"] for m in messages[1:]] == [history.turns[-1][1]]
+
+
+def test_remember_skips_uncached_thread(monkeypatch):
+    memory = ThreadMemory()
+    monkeypatch.setattr(memory, "_load", lambda user_id, thread_id: pytest.fail("remember loaded a thread"))
+    memory.remember("u", "t", "hello", "hi")
+    assert memory.stats()["threads"] == 0
+
+    history = memory.get("u", "t", new=True)
+    memory.remember("u", "t", "hello", "hi")
+    assert history.turns == [("user", "hello"), ("assistant", "hi")]
+
+
+@pytest.fixture
+def small_budget(monkeypatch):
+    monkeypatch.setattr(thread_memory, "THREAD_HISTORY_TOKENS", 100)
+    monkeypatch.setattr(thread_memory, "THREAD_SUMMARY_TOKENS", 20)
+    # (100 - 20) // 2 tokens of verbatim turns survive a compaction
+    return 40
+
+
+def test_compact_folds_oldest_turns_into_summary(small_budget):
+    calls = []
+
+    def summarize(summary, turns):
+        calls.append((summary, list(turns)))
+        return f"summary of {len(turns)} turns"
+
+    memory = ThreadMemory(summarize=summarize)
+    history = ThreadHistory([(("user", "assistant")[i % 2], _text(15)) for i in range(8)])
+    history.summary = "earlier"
+    turns = list(history.turns)
+    history.compacting = True
+    memory._compact(history)
+
+    assert calls == [("earlier", turns[:6])]
+    assert history.summary == "summary of 6 turns"
+    assert history.turns == turns[6:]
+    assert history.turn_tokens() <= small_budget
+    assert not history.compacting
+    assert memory.stats()["compactions"] == 1
+
+
+def test_compact_falls_back_to_truncation(small_budget):
+    def summarize(summary, turns):
+        raise RuntimeError("model unavailable")
+
+    memory = ThreadMemory(summarize=summarize)
+    history = ThreadHistory([("user", _text(40)), ("assistant", _text(40)), ("user", _text(5))])
+    memory._compact(history)
+
+    assert history.turns == [("user", _text(5))]
+    assert 0 < len(history.summary) <= thread_memory.THREAD_SUMMARY_TOKENS * CHARS_PER_TOKEN
+    assert not history.compacting
+
+
+def test_compact_without_anything_to_fold(small_budget):
+    calls = []
+    memory = ThreadMemory(summarize=lambda summary, turns: calls.append(turns) or "s")
+    history = ThreadHistory([("user", _text(5))])
+    memory._compact(history)
+
+    assert calls == []
+    assert history.turns == [("user", _text(5))]
+    assert memory.stats()["compactions"] == 0
+
+
+def test_with_thread_history_degrades_to_no_history(monkeypatch):
+    import main
+
+    def failing_load(user_id, thread_id):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(main.thread_memory, "_load", failing_load)
+    messages = [{"role": "system", "content": "prompt"}, {"role": "user", "content": "hi"}]
+    assert main.with_thread_history(messages, "u", "uncached-thread", new=False) == messages
@@ -0,0 +1,163 @@
+from collections import OrderedDict
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import material_cache
+
+
+def _row(entry_id, material_id, chunk_index, embedding, content="chunk"):
+    return SimpleNamespace(id=entry_id, source_id=material_id, user_id="u1", chunk_index=chunk_index,
+                           embedding=embedding, content=content, vector_metadata={"page": chunk_index})
+
+
+def _block(material_id, version="v1", chunks=2):
+    rows = [_row(material_id * 100 + i, material_id, i, [1.0, 0.0, 0.0]) for i in range(chunks)]
+    return material_cache.build_vector_block(material_id, version, rows)
+
+
+@pytest.fixture
+def vector_cache(monkeypatch):
+    """An empty vector tier"""
+    monkeypatch.setattr(material_cache, "_vector_cache", OrderedDict())
+    monkeypatch.setattr(material_cache, "_vector_cache_size", 0)
+    monkeypatch.setattr(material_cache, "_empty_vector_versions", OrderedDict())
+    return material_cache
+
+
+def test_vector_version_changes_when_reprocessed():
+    processed_at = datetime(2024, 1, 1, 12, 0)
+    version = material_cache.material_vector_version(processed_at, 10)
+    assert version == material_cache.material_vector_version(processed_at, 10)
+    assert version != material_cache.material_vector_version(datetime(2024, 1, 2), 10)
+    assert version != material_cache.material_vector_version(processed_at, 11)
+    assert material_cache.material_vector_version(None, None) == ":0"
+
+
+def test_cached_block_is_served_only_at_its_version(vector_cache):
+    block = _block(1, version="v1")
+    vector_cache.cache_vector_entries(1, block)
+
+    assert vector_cache.get_cached_vector_entries(1, "v1") is block
+    assert vector_cache.get_cached_vector_entries(1, "v2") is None
+    # The stale block was dropped along with its size
+    assert vector_cache.get_cached_vector_entries(1, "v1") is None
+    assert vector_cache._vector_cache_size == 0
+
+
+def test_invalidate_drops_the_block(vector_cache):
+    vector_cache.cache_vector_entries(1, _block(1))
+    vector_cache.invalidate_vector_cache(1)
+    assert vector_cache.get_cached_vector_entries(1, "v1") is None
+    assert vector_cache._vector_cache_size == 0
+
+
+def test_build_vector_block_packs_entries_and_skips_bad_dimensions():
+    rows = [
+        _row(10, 1, 0, [1.0, 2.0, 3.0], "first"),
+        _row(11, 1, 1, [1.0, 2.0], "wrong dimension"),
+        _row(12, 1, 2, [0.0, 1.0, 0.0], "second")
+    ]
+    block = material_cache.build_vector_block(1, "v1", rows)
+
+    assert len(block) == 2
+    assert list(block.ids) == [10, 12]
+    assert list(block.chunk_indexes) == [0, 2]
+    assert block.embeddings.typecode == "f" and len(block.embeddings) == 6
+    assert list(block.embedding(1)) == [0.0, 1.0, 0.0]
+    assert block.contents == ["first", "second"]
+    assert block.size_bytes > len(block.embeddings) * 4
+    assert block.dot_scores([1.0, 1.0, 1.0]) == [6.0, 1.0]
+    assert block.dot_scores([1.0, 1.0]) == [0.0, 0.0]
+    assert material_cache.build_vector_block(1, "v1", []) is None
+
+
+def _sized_block(material_id, size_kb):
+    block = _block(material_id)
+    block.size_bytes = size_kb * 1024
+    return block
+
+
+def test_vector_cache_evicts_least_recently_used_blocks_to_stay_in_budget(vector_cache, monkeypatch):
+    monkeypatch.setattr(material_cache, "MAX_VECTOR_CACHE_SIZE_MB", 1)
+    for material_id in (1, 2, 3):
+        vector_cache.cache_vector_entries(material_id, _sized_block(material_id, 300))
+    # A hit makes 1 the most recently used, so 2 goes first
+    assert vector_cache.get_cached_vector_entries(1, "v1") is not None
+
+    vector_cache.cache_vector_entries(4, _sized_block(4, 300))
+    assert list(vector_cache._vector_cache) == [3, 1, 4]
+    assert vector_cache._vector_cache_size == 900 * 1024
+
+    # Replacing a block does not count the old one against the budget
+    vector_cache.cache_vector_entries(4, _sized_block(4, 500))
+    assert list(vector_cache._vector_cache) == [1, 4]
+    assert vector_cache._vector_cache_size == 800 * 1024
+
+
+def test_block_larger_than_the_budget_is_not_cached(vector_cache, monkeypatch):
+    monkeypatch.setattr(material_cache, "MAX_VECTOR_CACHE_SIZE_MB", 1)
+    vector_cache.cache_vector_entries(1, _sized_block(1, 300))
+    vector_cache.cache_vector_entries(2, _sized_block(2, 2048))
+    assert list(vector_cache._vector_cache) == [1]
+
+
+class _Query:
+    def __init__(self, session):
+        self.session = session
+
+    def filter(self, *criteria):
+        return self
+
+    def order_by(self, *columns):
+        return self
+
+    def all(self):
+        self.session.queries += 1
+        return self.session.rows
+
+
+class _Session:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+
+    def query(self, *entities):
+        return _Query(self)
+
+
+def test_materials_without_entries_are_not_queried_again_until_reprocessed(vector_cache, monkeypatch):
+    import shared_corpus
+    monkeypatch.setattr(shared_corpus, "get_shared_block", lambda material_id, version: None)
+    processed_at = datetime(2024, 1, 1)
+    materials = [SimpleNamespace(id=1, processed_at=processed_at, chunk_count=2),
+                 SimpleNamespace(id=2, processed_at=processed_at, chunk_count=0)]
+    session = _Session([_row(10, 1, 0, [1.0, 0.0]), _row(11, 1, 1, [0.0, 1.0])])
+
+    blocks = vector_cache.load_vector_blocks(session, materials)
+    assert [block.material_id for block in blocks] == [1]
+    assert session.queries == 1
+
+    # Material 1 comes from the cache, material 2 from its negative marker
+    blocks = vector_cache.load_vector_blocks(session, materials)
+    assert [block.material_id for block in blocks] == [1]
+    assert session.queries == 1
+    assert vector_cache.get_vector_cache_stats()["vector_empty_materials"] == 1
+
+    # Reprocessing changes the version, so the marker no longer applies
+    materials[1].chunk_count = 3
+    session.rows = []
+    vector_cache.load_vector_blocks(session, materials)
+    assert session.queries == 2
+
+
+def test_negative_markers_are_bounded(vector_cache, monkeypatch):
+    monkeypatch.setattr(material_cache, "MAX_EMPTY_VECTOR_MARKERS", 2)
+    for material_id in (1, 2, 3):
+        vector_cache._mark_no_vector_entries(material_id, "v1")
+    assert not vector_cache._has_no_vector_entries(1, "v1")
+    assert vector_cache._has_no_vector_entries(3, "v1")
+
+    vector_cache.cache_vector_entries(3, _block(3))
+    assert not vector_cache._has_no_vector_entries(3, "v1")
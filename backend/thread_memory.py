@@ -0,0 +1,195 @@
+"""
+Thread Memory Module
+
+Server-side conversation history for chat threads. A thread's messages are
+loaded from user_data.chat_messages the first time a worker sees it and kept
+in an LRU of threads, so a turn needs no history query. The history sent with
+a prompt is bounded by THREAD_HISTORY_TOKENS: the newest turns are kept
+verbatim and older ones are folded into a rolling summary, compacted in the
+background once the verbatim turns outgrow the budget.
+
+Tokens are estimated at CHARS_PER_TOKEN characters each (no tokenizer dependency).
+Each worker keeps its own LRU; a thread that alternates between workers may
+miss turns served by the other until its entry is evicted.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Configuration
+THREAD_HISTORY_TOKENS = int(os.getenv("THREAD_HISTORY_TOKENS", "1500"))  # Summary plus verbatim turns per prompt
+THREAD_SUMMARY_TOKENS = int(os.getenv("THREAD_SUMMARY_TOKENS", "300"))  # Rolling summary length
+THREAD_CACHE_SIZE = int(os.getenv("THREAD_CACHE_SIZE", "1000"))  # Threads kept in memory per worker
+THREAD_LOAD_LIMIT = 200  # Newest messages read when a thread is loaded
+CHARS_PER_TOKEN = 4
+
+# (previous summary, turns to fold in as (role, content)) -> new summary
+Summarizer = Callable[[str, List[Tuple[str, str]]], str]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class ThreadHistory:
+    """Rolling summary plus the newest turns of one thread"""
+    __slots__ = ('summary', 'turns', 'compacting', 'lock')
+
+    def __init__(self, turns: Optional[List[Tuple[str, str]]] = None):
+        self.summary = ""
+        self.turns: List[Tuple[str, str]] = turns or []  # (role, content), oldest first
+        self.compacting = False
+        self.lock = threading.Lock()
+
+    def turn_tokens(self) -> int:
+        return sum(estimate_tokens(content) for _, content in self.turns)
+
+    def prompt_messages(self, budget: int = THREAD_HISTORY_TOKENS) -> List[Dict[str, str]]:
+        """Summary and the newest turns that fit in budget, as chat messages"""
+        with self.lock:
+            summary = self.summary
+            turns = list(self.turns)
+        messages = []
+        remaining = budget
+        if summary:
+            remaining -= estimate_tokens(summary)
+        for role, content in reversed(turns):
+            remaining -= estimate_tokens(content)
+            if remaining < 0:
+                break
+            messages.append({"role": role, "content": content})
+        messages.reverse()
+        if summary:
+            messages.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        return messages
+
+
+def _fallback_summary(summary: str, turns: List[Tuple[str, str]]) -> str:
+    """Summary without a model: the newest text that fits THREAD_SUMMARY_TOKENS"""
+    text = "\n".join([summary] + [f"{role}: {content}" for role, content in turns]).strip()
+    return text[-THREAD_SUMMARY_TOKENS * CHARS_PER_TOKEN:]
+
+
+class ThreadMemory:
+    """LRU of ThreadHistory keyed by (user_id, thread_id)"""
+
+    def __init__(self, summarize: Optional[Summarizer] = None, capacity: int = THREAD_CACHE_SIZE):
+        self.summarize = summarize
+        self.capacity = capacity
+        self._threads: "OrderedDict[Tuple[str, str], ThreadHistory]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._compactor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thread-summary")
+        self.loads = 0
+        self.hits = 0
+        self.compactions = 0
+
+    def get(self, user_id: str, thread_id: str, new: bool = False) -> ThreadHistory:
+        """The thread's history, loaded from the database on first use (new: a thread just created)"""
+        key = (user_id, thread_id)
+        with self._lock:
+            history = self._threads.get(key)
+            if history is not None:
+                self._threads.move_to_end(key)
+                self.hits += 1
+                return history
+
+        history = ThreadHistory(None if new else self._load(user_id, thread_id))
+        with self._lock:
+            # Another request may have loaded it meanwhile; keep the first
+            history = self._threads.setdefault(key, history)
+            self._threads.move_to_end(key)
+            if not new:
+                self.loads += 1
+            while len(self._threads) > self.capacity:
+                self._threads.popitem(last=False)
+        self._maybe_compact(history)
+        return history
+
+    def _load(self, user_id: str, thread_id: str) -> List[Tuple[str, str]]:
+        from database import get_session_local, ChatMessage
+
+        # Primary, not the replica: chat writes are recent by nature
+        db = get_session_local()()
+        try:
+            rows = db.query(ChatMessage.message_type, ChatMessage.message_content).filter(
+                ChatMessage.session_id == thread_id,
+                ChatMessage.user_id == user_id,
+                ChatMessage.message_type.in_(("user", "assistant"))
+            ).order_by(ChatMessage.timestamp.desc()).limit(THREAD_LOAD_LIMIT).all()
+        finally:
+            db.close()
+        return [
+            (row.message_type, str((row.message_content or {}).get("message", "")))
+            for row in reversed(rows)
+        ]
+
+    def remember(self, user_id: str, thread_id: str, user_message: str, reply: str):
+        """
+        Append a completed turn to the thread if this worker has it cached, and
+        compact it if it outgrew the budget. An uncached thread is left alone: the
+        turn is persisted anyway, and loading the thread just to append would cost
+        a history query per turn on a thread this worker may never serve again.
+        """
+        with self._lock:
+            history = self._threads.get((user_id, thread_id))
+        if history is None:
+            return
+        with history.lock:
+            history.turns.append(("user", user_message))
+            if reply:
+                history.turns.append(("assistant", reply))
+        self._maybe_compact(history)
+
+    def _maybe_compact(self, history: ThreadHistory):
+        with history.lock:
+            if history.compacting or history.turn_tokens() <= THREAD_HISTORY_TOKENS - THREAD_SUMMARY_TOKENS:
+                return
+            history.compacting = True
+        self._compactor.submit(self._compact, history)
+
+    def _compact(self, history: ThreadHistory):
+        """Fold the oldest turns into the summary until the rest fit in half the turn budget"""
+        try:
+            keep_tokens = (THREAD_HISTORY_TOKENS - THREAD_SUMMARY_TOKENS) // 2
+            with history.lock:
+                summary = history.summary
+                kept = 0
+                split = len(history.turns)
+                while split > 0 and kept + estimate_tokens(history.turns[split - 1][1]) <= keep_tokens:
+                    split -= 1
+                    kept += estimate_tokens(history.turns[split][1])
+                folded = history.turns[:split]
+            if not folded:
+                return
+
+            # The model call happens outside the lock; turns keep being appended meanwhile
+            new_summary = None
+            if self.summarize is not None:
+                try:
+                    new_summary = self.summarize(summary, folded)
+                except Exception as e:
+                    print(f"⚠️  Thread summary failed, truncating instead: {e}")
+            if not new_summary:
+                new_summary = _fallback_summary(summary, folded)
+
+            with history.lock:
+                history.summary = new_summary
+                del history.turns[:len(folded)]
+            with self._lock:
+                self.compactions += 1
+        finally:
+            with history.lock:
+                history.compacting = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "threads": len(self._threads),
+                "capacity": self.capacity,
+                "loads": self.loads,
+                "hits": self.hits,
+                "compactions": self.compactions
+            }
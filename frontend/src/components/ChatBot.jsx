@@ -221,7 +221,7 @@ export default function Chat() {
         throw new Error("Not authenticated");
       }
 
-      const res = await fetch("http://localhost:8000/chat-rag", {
+      const res = await fetch("http://localhost:8000/chat-rag/stream", {
         method: "POST",
         headers: { 
           "Content-Type": "application/json",
@@ -235,10 +235,39 @@ export default function Chat() {
       });
 
       if (!res.ok) throw new Error(`HTTP ${res.status}`);
-      const data = await res.json();
 
-      setThreadId(data.thread_id);
-      setMessages(prev => [...prev, { role: "assistant", text: data.reply }]);
+      // Server-sent events: meta, token..., then done or error
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let started = false;
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || "{}");
+          if (event === "meta") {
+            setThreadId(data.thread_id);
+          } else if (event === "token") {
+            if (!started) {
+              started = true;
+              setMessages(prev => [...prev, { role: "assistant", text: data.content }]);
+            } else {
+              setMessages(prev => [
+                ...prev.slice(0, -1),
+                { ...prev[prev.length - 1], text: prev[prev.length - 1].text + data.content },
+              ]);
+            }
+          } else if (event === "error") {
+            throw new Error(data.detail);
+          }
+        }
+      }
+      if (!started) throw new Error("Empty reply");
     } catch (err) {
       setMessages(prev => [
         ...prev,
@@ -271,7 +300,7 @@ export default function Chat() {
                 {message.text}
               </MessageBubble>
             ))}
-            {loading && (
+            {loading && messages[messages.length - 1]?.role === "user" && (
               <MessageBubble $isUser={false}>
                 Thinking... 
               </MessageBubble>
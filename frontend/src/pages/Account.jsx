@@ -184,6 +184,7 @@ export default function Account() {
       if (!token) return;
 
       const response = await fetch(`${API_URL}/api/profile/me`, {
+        credentials: 'include',
         headers: {
           'Authorization': `Bearer ${token}`
         }
@@ -233,6 +234,7 @@ export default function Account() {
     }
 
     const response = await fetch(`${API_URL}/api/profile`, {
+      credentials: 'include',
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
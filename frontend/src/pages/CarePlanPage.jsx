@@ -578,18 +578,31 @@ export default function CarePlanPage() {
         return;
       }
 
-      const response = await fetch("http://localhost:8000/api/care-plans", {
-        headers: {
-          "Authorization": `Bearer ${session.access_token}`
+      // The listing is cursor-paginated; follow the cursor to load every page
+      const carePlansArray = [];
+      let cursor = null;
+      do {
+        const url = cursor
+          ? `http://localhost:8000/api/care-plans?cursor=${encodeURIComponent(cursor)}`
+          : "http://localhost:8000/api/care-plans";
+        const response = await fetch(url, {
+          credentials: "include",
+          headers: {
+            "Authorization": `Bearer ${session.access_token}`
+          }
+        });
+
+        if (!response.ok) {
+          console.error("Failed to load care plans");
+          break;
         }
-      });
 
-      if (response.ok) {
         const data = await response.json();
-        setCarePlans(data.care_plans || []);
-      } else {
-        console.error("Failed to load care plans");
-      }
+        carePlansArray.push(...(data.care_plans || []));
+        cursor = data.next_cursor || null;
+      } while (cursor);
+
+      setCarePlans(carePlansArray);
     } catch (error) {
       console.error("Error loading care plans:", error);
     } finally {
@@ -624,6 +637,7 @@ export default function CarePlanPage() {
       };
 
       const response = await fetch("http://localhost:8000/api/care-plans", {
+        credentials: "include",
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -661,6 +675,7 @@ export default function CarePlanPage() {
       }
 
       const response = await fetch(`http://localhost:8000/api/care-plans/${carePlanId}`, {
+        credentials: "include",
         headers: {
           "Authorization": `Bearer ${session.access_token}`
         }
@@ -760,6 +775,7 @@ export default function CarePlanPage() {
       }
 
       const response = await fetch(`http://localhost:8000/api/care-plans/${carePlanIdToUse}/generate-ai`, {
+        credentials: "include",
         method: "POST",
         headers: {
           "Authorization": `Bearer ${session.access_token}`
@@ -794,6 +810,7 @@ export default function CarePlanPage() {
       }
 
       const response = await fetch(`http://localhost:8000/api/care-plans/${carePlanId}`, {
+        credentials: "include",
         method: "DELETE",
         headers: {
           "Authorization": `Bearer ${session.access_token}`
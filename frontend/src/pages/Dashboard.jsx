@@ -259,6 +259,9 @@ const FileInput = styled.input`
   display: none;
 `;
 
+// Bytes of extracted text fetched for the material preview
+const TEXT_PREVIEW_BYTES = 4096;
+
 export default function Dashboard() {
   const [materials, setMaterials] = useState([]);
   const [selectedMaterial, setSelectedMaterial] = useState(null);
@@ -279,6 +282,7 @@ export default function Dashboard() {
         if (!session) return;
 
         const response = await fetch('http://localhost:8000/api/profile/me', {
+          credentials: 'include',
           headers: {
             'Authorization': `Bearer ${session.access_token}`
           }
@@ -323,6 +327,7 @@ export default function Dashboard() {
 
       // Upload to backend
       const response = await fetch('http://localhost:8000/api/upload', {
+        credentials: 'include',
         method: 'POST',
         headers: {
           'Authorization': `Bearer ${session.access_token}`
@@ -357,20 +362,30 @@ export default function Dashboard() {
       const { data: { session } } = await supabase.auth.getSession();
       if (!session) return;
 
-      const response = await fetch('http://localhost:8000/api/materials', {
-        headers: {
-          'Authorization': `Bearer ${session.access_token}`
-        }
-      });
+      // The listing is metadata only and cursor-paginated; follow the cursor to load every page
+      const materialsArray = [];
+      let cursor = null;
+      do {
+        const url = cursor
+          ? `http://localhost:8000/api/materials?cursor=${encodeURIComponent(cursor)}`
+          : 'http://localhost:8000/api/materials';
+        const response = await fetch(url, {
+          credentials: 'include',
+          headers: {
+            'Authorization': `Bearer ${session.access_token}`
+          }
+        });
+
+        if (!response.ok) break;
 
-      if (response.ok) {
         const materialsData = await response.json();
-        console.log('Loaded materials:', materialsData);
         // Handle both array and object responses
-        const materialsArray = Array.isArray(materialsData) ? materialsData : materialsData.materials || [];
-        console.log('Materials statuses:', materialsArray.map(m => ({ id: m.id, title: m.title, status: m.status })));
-        setMaterials(materialsArray);
-      }
+        materialsArray.push(...(Array.isArray(materialsData) ? materialsData : materialsData.materials || []));
+        cursor = materialsData.next_cursor || null;
+      } while (cursor);
+
+      console.log('Materials statuses:', materialsArray.map(m => ({ id: m.id, title: m.title, status: m.status })));
+      setMaterials(materialsArray);
     } catch (error) {
       console.error('Error loading materials:', error);
     }
@@ -380,13 +395,33 @@ export default function Dashboard() {
     fileInputRef.current?.click();
   };
 
-  const handleStartMaterial = (material) => {
+  const handleStartMaterial = async (material) => {
     console.log('Starting material:', material);
-    console.log('Extracted text length:', material.extracted_text?.length || 0);
-    console.log('First 200 chars of extracted text:', material.extracted_text?.substring(0, 200) || 'No text');
     try {
       setSelectedMaterial(material);
       setShowExpandedView(true);
+
+      if (material.status !== 'processed') return;
+
+      // Text is not part of the listing; fetch just the preview range
+      const { data: { session } } = await supabase.auth.getSession();
+      if (!session) return;
+
+      const response = await fetch(`http://localhost:8000/api/materials/${material.id}/text?start=0&length=${TEXT_PREVIEW_BYTES}`, {
+        credentials: 'include',
+        headers: {
+          'Authorization': `Bearer ${session.access_token}`
+        }
+      });
+
+      if (response.ok) {
+        const textData = await response.json();
+        setSelectedMaterial({
+          ...material,
+          extracted_text: textData.text,
+          text_total_bytes: textData.total_bytes
+        });
+      }
     } catch (error) {
       console.error('Error opening material:', error);
     }
@@ -402,6 +437,7 @@ export default function Dashboard() {
       if (!session) return;
 
       const response = await fetch(`http://localhost:8000/api/materials/${materialId}`, {
+        credentials: 'include',
         method: 'DELETE',
         headers: {
           'Authorization': `Bearer ${session.access_token}`
@@ -533,7 +569,7 @@ export default function Dashboard() {
                   const text = selectedMaterial.extracted_text;
                   const previewLength = 1500;
                   const preview = text.substring(0, previewLength);
-                  const isTruncated = text.length > previewLength;
+                  const isTruncated = text.length > previewLength || selectedMaterial.text_total_bytes > TEXT_PREVIEW_BYTES;
                   
                   // Clean up the text for better readability
                   const cleanedText = preview
@@ -561,7 +597,7 @@ export default function Dashboard() {
                             borderRadius: '4px',
                             border: '1px solid #e9ecef'
                           }}>
-                            ... (showing first {previewLength.toLocaleString()} of {text.length.toLocaleString()} characters)
+                            ... (showing first {Math.min(previewLength, text.length).toLocaleString()} characters of {(selectedMaterial.text_total_bytes || text.length).toLocaleString()} bytes)
                           </span>
                         )}
                       </div>
@@ -624,8 +660,8 @@ export default function Dashboard() {
               justifyContent: 'space-between',
               alignItems: 'center'
             }}>
-              <span><strong>Text Length:</strong> {selectedMaterial.extracted_text.length.toLocaleString()} characters</span>
-              <span><strong>Words:</strong> {selectedMaterial.extracted_text.split(/\s+/).filter(word => word.length > 0).length.toLocaleString()}</span>
+              <span><strong>Text Size:</strong> {(selectedMaterial.text_total_bytes || selectedMaterial.extracted_text.length).toLocaleString()} bytes</span>
+              <span><strong>Chunks:</strong> {(selectedMaterial.chunk_count || 0).toLocaleString()}</span>
             </div>
           )}
           